@@ -13,3 +13,5 @@
    See the License for the specific language governing permissions and
    limitations under the License.       
 """
+
+__version__ = "1.3.0"
@@ -13,11 +13,18 @@
    See the License for the specific language governing permissions and
    limitations under the License.
 """
-import copy
+import sys
+import time
+import inspect
 import logging
 import re
 import types
+import weakref
+import threading
 from springpython.aop import utils
+from springpython.util import CacheRegion
+from springpython.aop import metrics
+from springpython.aop.future import Future, ThreadPoolExecutor, ProcessPoolExecutor, is_future, then
 
 class Pointcut(object):
     """Interface defining where to apply an aspect."""
@@ -36,34 +43,93 @@ class MethodInterceptor(object):
     def invoke(self, invocation):
         raise NotImplementedError()
 
+class AsyncMethodInterceptor(MethodInterceptor):
+    """
+    "Around" advice split into before() and after() halves, so that it also works for methods which return a
+    Future (see springpython.aop.future) instead of their result. after() runs as soon as a plain result is
+    returned or an exception raised, but when a Future is returned, only once that Future is done, on whichever
+    thread completes it. The caller then gets a new Future, which completes with what after() returns.
+    """
+    def before(self, invocation):
+        """Runs before proceeding. Whatever it returns is handed to after() as context."""
+        return None
+
+    def after(self, invocation, context, result, exc_info):
+        """Runs once the call has completed. exc_info is None on success, or what sys.exc_info() returned on failure,
+        in which case the exception is re-raised after this returns. Otherwise, the return value replaces result."""
+        return result
+
+    def invoke(self, invocation):
+        context = self.before(invocation)
+        try:
+            result = invocation.proceed()
+        except Exception:
+            exc_info = sys.exc_info()
+            self.after(invocation, context, None, exc_info)
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+        if not is_future(result):
+            return self.after(invocation, context, result, None)
+
+        def on_done(future):
+            try:
+                value = future.result()
+            except Exception:
+                exc_info = sys.exc_info()
+                self.after(invocation, context, None, exc_info)
+                raise exc_info[0], exc_info[1], exc_info[2]
+            return self.after(invocation, context, value, None)
+
+        return then(result, on_done)
+
 class MethodInvocation(object):
-    """Encapsulation of invoking a method on a proxied service. It iterates throgh the list of interceptors by using
-    a generator."""
-    def __init__(self, instance, method_name, args, kwargs, interceptors):
+    """Encapsulation of invoking a method on a proxied service. It walks through the list of interceptors by keeping
+    the position of the next one, so code may proceed in a nested fashion, versus a for-loop which would act in a
+    chained fashion. Interceptors may still be inserted into intercept_stack ahead of that position.
+
+    If compiled is set, interceptors is a chain made by compile_chain(), which proxies build once and share between
+    calls. It is only copied if intercept_stack is used."""
+    logger = logging.getLogger("springpython.aop.MethodInvocation")
+
+    def __init__(self, instance, method_name, args, kwargs, interceptors, compiled = False):
         self.instance = instance
         self.method_name = method_name
         self.args = args
         self.kwargs = kwargs
-        self.intercept_stack = copy.copy(interceptors)
-        self.intercept_stack.append(FinalInterceptor())
-        self.logger = logging.getLogger("springpython.aop.MethodInvocation")
+        if compiled:
+            self.chain = interceptors
+        else:
+            self.chain = compile_chain(interceptors)
+        self.position = 0
+
+    def _get_intercept_stack(self):
+        if type(self.chain) == tuple:
+            self.chain = list(self.chain)
+        return self.chain
+
+    def _set_intercept_stack(self, intercept_stack):
+        self.chain = intercept_stack
+
+    intercept_stack = property(_get_intercept_stack, _set_intercept_stack)
 
     def getInterceptor(self):
-        """This is a generator to proceed through the stack of interceptors. By using generator convention, code may
-        proceed in a nested fashion, versus a for-loop which would act in a chained fashion."""
-        for interceptor in self.intercept_stack:
-            yield interceptor
+        """This is a generator to proceed through the stack of interceptors."""
+        while self.position < len(self.chain):
+            self.position += 1
+            yield self.chain[self.position - 1]
 
     def proceed(self):
         """This is the method every interceptor should call in order to continue down the chain of interceptors."""
-        interceptor = self.iterator.next()
-        self.logger.debug("Calling %s.%s(%s, %s)" % (interceptor.__class__.__name__, self.method_name, self.args, self.kwargs))
+        interceptor = self.chain[self.position]
+        self.position += 1
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Calling %s.%s(%s, %s)" % (interceptor.__class__.__name__, self.method_name, self.args, self.kwargs))
         return interceptor.invoke(self)
 
     def __getattr__(self, name):
         """This only deals with method invocations. Attributes are dealt with by the AopProxy, and don't every reach this
         block of code."""
-        self.iterator = self.getInterceptor()
+        self.position = 0
         self.method_name = name
         return self
 
@@ -76,14 +142,26 @@ class MethodInvocation(object):
 
     def dump_interceptors(self, level = logging.INFO):
         """DEBUG: Method used to dump the stack of interceptors in order of execution."""
-        for interceptor in self.intercept_stack:
+        for interceptor in self.chain:
             self.logger.log(level, "Interceptor stack: %s" % interceptor.__class__.__name__)
 
+def compile_chain(interceptors):
+    """Returns the immutable chain of interceptors a MethodInvocation walks through, i.e. interceptors followed by
+    the FinalInterceptor."""
+    return tuple(interceptors) + (_final_interceptor,)
+
 class RegexpMethodPointcutAdvisor(Pointcut, MethodMatcher, MethodInterceptor):
     """
     This is a combination PointCut/MethodMatcher/MethodInterceptor. It allows associating one or more
     defined advices with a set of regular expression patterns.
+
+    Whether a "class.method" candidate matches only depends on the patterns, so the answers are cached,
+    up to match_cache_size of them, until patterns is assigned again. The patterns are also combined
+    into a single regular expression, unless one of them uses backreferences or inline flags, which
+    wouldn't survive that.
     """
+    match_cache_size = 1024
+
     def __init__(self, advice = None, patterns = None):
         Pointcut.__init__(self)
         MethodMatcher.__init__(self)
@@ -100,12 +178,39 @@ class RegexpMethodPointcutAdvisor(Pointcut, MethodMatcher, MethodInterceptor):
         for pattern in self.patterns:
             self.compiled_patterns[pattern] = re.compile(pattern)
 
+        self.combined_pattern = None
+        if self.patterns and not [pattern for pattern in self.patterns if _uncombinable.search(pattern)]:
+            try:
+                self.combined_pattern = re.compile("|".join(["(?:%s)" % pattern for pattern in self.patterns]))
+            except re.error:
+                pass
+
+        self.match_cache = {}
+
     def matches_method_and_target(self, method, target_class, args):
-        """Iterate through all patterns, checking for a match. Calls the pattern matcher against "class.method_name"."""
-        for pointcut_pattern in self.patterns:
-            if (self.matches_pattern(target_class + "." + method, pointcut_pattern)):
-                return True
-        return False
+        """Checks "class.method" against all the patterns, unless the answer is already cached."""
+        key = (target_class, method)
+        try:
+            return self.match_cache[key]
+        except KeyError:
+            pass
+
+        candidate = target_class + "." + method
+        if self.combined_pattern is not None:
+            matched = self.combined_pattern.match(candidate) is not None
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Candidate is [%s]; patterns are %s; matched=%s" % (candidate, self.patterns, matched))
+        else:
+            matched = False
+            for pointcut_pattern in self.patterns:
+                if (self.matches_pattern(candidate, pointcut_pattern)):
+                    matched = True
+                    break
+
+        if len(self.match_cache) >= self.match_cache_size:
+            self.match_cache.clear()
+        self.match_cache[key] = matched
+        return matched
 
     def matches_pattern(self, method_name, pointcut_pattern):
         """Uses a pre-built dictionary of regular expression patterns to check for a matcch."""
@@ -113,7 +218,8 @@ class RegexpMethodPointcutAdvisor(Pointcut, MethodMatcher, MethodInterceptor):
             matched = True
         else:
             matched = False
-        self.logger.debug("Candidate is [%s]; pattern is [%s]; matched=%s" % (method_name, pointcut_pattern, matched))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Candidate is [%s]; pattern is [%s]; matched=%s" % (method_name, pointcut_pattern, matched))
         return matched
 
     def invoke(self, invocation):
@@ -129,12 +235,14 @@ class RegexpMethodPointcutAdvisor(Pointcut, MethodMatcher, MethodInterceptor):
             ASSUME_THIS_ADVISOR_WAS_FIRST = 1
             invocation.intercept_stack[ASSUME_THIS_ADVISOR_WAS_FIRST:ASSUME_THIS_ADVISOR_WAS_FIRST] = self.advice
 
-            self.logger.debug("We have a match, passing through to the advice.")
-            invocation.dump_interceptors(logging.DEBUG)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("We have a match, passing through to the advice.")
+                invocation.dump_interceptors(logging.DEBUG)
 
             return invocation.proceed()
         else:
-            self.logger.debug("No match, bypassing advice, going straight to targetClass.")
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("No match, bypassing advice, going straight to targetClass.")
             return getattr(invocation.instance, invocation.method_name)(*invocation.args, **invocation.kwargs)
 
     def __setattr__(self, name, value):
@@ -149,6 +257,9 @@ class RegexpMethodPointcutAdvisor(Pointcut, MethodMatcher, MethodInterceptor):
         if name == "patterns":
             self.init_patterns()
 
+# Backreferences get renumbered, and inline flags apply to the whole expression, once patterns are combined.
+_uncombinable = re.compile(r"\\[1-9]|\(\?P=|\(\?[iLmsux]+\)")
+
 class FinalInterceptor(MethodInterceptor):
     """
     Final interceptor is always at the bottom of interceptor stack.
@@ -161,6 +272,9 @@ class FinalInterceptor(MethodInterceptor):
     def invoke(self, invocation):
         return getattr(invocation.instance, invocation.method_name)(*invocation.args, **invocation.kwargs)
 
+# FinalInterceptor keeps no state of its own, so every invocation shares this one.
+_final_interceptor = FinalInterceptor()
+
 class AopProxy(object):
     """AopProxy acts like the target object by dispatching all method calls to the target through a MethodInvocation.
     The MethodInvocation object actually deals with potential "around" advice, referred to as interceptors. Attribute
@@ -177,26 +291,53 @@ class AopProxy(object):
     def __getattr__(self, name):
         """If any of the parameters are local objects, they are immediately retrieved. Callables cause the dispatch method
         to be return, which forwards callables through the interceptor stack. Target attributes are retrieved directly from
-        the target object."""
+        the target object.
+
+        Dispatch methods are compiled once per method name, along with their chain of interceptors, and cached until
+        target or interceptors are assigned again. They fetch the target when called, and compile the chain again if
+        the interceptors list has been changed in place, so such changes are seen by the next call. Call
+        reset_dispatchers() after changing which of the target's attributes are callable."""
         if name in ["target", "interceptors", "method_name"]:
             return self.__dict__[name]
-        else:
-            attr = getattr(self.target, name)
-            if not callable(attr):
-                return attr
-
-            def dispatch(*args, **kwargs):
-                """This method is returned to the caller emulating the function call being sent to the
-                target object. This services as a proxying agent for the target object."""
-                invocation = MethodInvocation(self.target, name, args, kwargs, self.interceptors)
-                ##############################################################################
-                # NOTE:
-                # getattr(invocation, name) doesn't work here, because __str__ will print
-                # the MethodInvocation's string, instead of trigger the interceptor stack.
-                ##############################################################################
-                return invocation.__getattr__(name)(*args, **kwargs)
-
-            return dispatch
+
+        try:
+            return self.__dict__["_dispatchers"][name]
+        except KeyError:
+            pass
+
+        attr = getattr(self.target, name)
+        if not callable(attr):
+            return attr
+
+        return self._compile_dispatcher(name)
+
+    def _compile_dispatcher(self, name):
+        attributes = self.__dict__
+        interceptors = attributes["interceptors"]
+        # The chain, and a copy of the interceptors it was compiled from.
+        compiled = [compile_chain(interceptors), list(interceptors)]
+
+        def dispatch(*args, **kwargs):
+            """This method is returned to the caller emulating the function call being sent to the
+            target object. This services as a proxying agent for the target object."""
+            interceptors = attributes["interceptors"]
+            if interceptors != compiled[1]:
+                compiled[:] = [compile_chain(interceptors), list(interceptors)]
+            return MethodInvocation(attributes["target"], name, args, kwargs, compiled[0], True).proceed()
+
+        if "_dispatchers" not in self.__dict__:
+            self.__dict__["_dispatchers"] = {}
+        self.__dict__["_dispatchers"][name] = dispatch
+        return dispatch
+
+    def reset_dispatchers(self):
+        """Forgets the compiled dispatch methods, so the next calls pick up the current target and interceptors."""
+        self.__dict__.pop("_dispatchers", None)
+
+    def __setattr__(self, name, value):
+        self.__dict__[name] = value
+        if name in ["target", "interceptors"]:
+            self.reset_dispatchers()
 
 class ProxyFactory(object):
     """This object helps to build AopProxy objects programmatically. It allows configuring advice and target objects.
@@ -225,6 +366,9 @@ class ProxyFactory(object):
 
         self.__dict__[name] = value
 
+        if name in ["target", "interceptors"]:
+            self.__dict__.pop("_dispatchers", None)
+
 class ProxyFactoryObject(ProxyFactory, AopProxy):
     """This class acts as both a ProxyFactory to build and an AopProxy. It makes itself look like the target object.
     Any changes to the target and list of interceptors is immediately seen when using this as a proxy."""
@@ -235,16 +379,584 @@ class ProxyFactoryObject(ProxyFactory, AopProxy):
     def __str__(self):
         return self.__getattr__("__str__")()
 
-class PerformanceMonitorInterceptor(MethodInterceptor):
+class ClassProxyFactory(ProxyFactory):
+    """This ProxyFactory builds proxies from a class generated for the target's class, instead of AopProxy. The
+    generated class subclasses the target's class, so proxies pass isinstance checks, and it defines a real method
+    for each public method of the target, so calling one doesn't go through __getattr__. Other attributes are
+    shared with the target. Generated classes are cached per target class.
+
+    Only public methods defined on the target's class are advised. Unlike with ProxyFactory, callables stored in
+    the target's instance attributes (e.g. target.load_user = cached_loader) are returned as they are, and calling
+    them bypasses the interceptors. Use ProxyFactory for targets which get methods assigned at runtime."""
+
+    def getProxy(self):
+        """Generate a proxy given the current target and list of interceptors. Any changes to the factory after
+        proxy creation do NOT propagate to the proxies."""
+        return get_proxy_class(self.target.__class__)(self.target, self.interceptors)
+
+_proxy_classes = {}
+
+def get_proxy_class(target_class):
+    """Returns the class generated to proxy instances of target_class, generating it the first time. Its constructor
+    takes the target and the list of interceptors.
+
+    Proxies of new-style objects share the target's __dict__, so reading and writing plain attributes costs what
+    it does on the target. Other proxies forward those through __getattr__ and __setattr__. Either way, callables
+    found in the target's instance attributes aren't advised; see ClassProxyFactory."""
+    try:
+        return _proxy_classes[target_class]
+    except KeyError:
+        pass
+
+    namespace = {"__module__": target_class.__module__, "__doc__": target_class.__doc__}
+    for name, method in inspect.getmembers(target_class, inspect.ismethod):
+        if not name.startswith("_") and method.im_self is None:
+            namespace[name] = _make_proxy_method(name)
+
+    if isinstance(target_class, type):
+        namespace["__slots__"] = ["_aop_target", "_aop_interceptors", "_aop_chain"]
+        namespace["__init__"] = _init_new_style_proxy
+        if not target_class.__dictoffset__:
+            # The target's class uses __slots__, so there's no dictionary to share.
+            namespace["__setattr__"] = _set_target_attribute
+            namespace["__delattr__"] = _delete_target_attribute
+    else:
+        namespace["__init__"] = _init_classic_proxy
+        namespace["__setattr__"] = _set_target_attribute
+        namespace["__delattr__"] = _delete_target_attribute
+    namespace["__getattr__"] = _get_target_attribute
+
+    proxy_class = type(target_class)("%sProxy" % target_class.__name__, (target_class,), namespace)
+    _proxy_classes[target_class] = proxy_class
+    return proxy_class
+
+def _make_proxy_method(name):
+    def proxy_method(self, *args, **kwargs):
+        return MethodInvocation(self._aop_target, name, args, kwargs, self._aop_chain, True).proceed()
+    proxy_method.__name__ = name
+    return proxy_method
+
+def _init_new_style_proxy(self, target, interceptors):
+    object.__setattr__(self, "_aop_target", target)
+    object.__setattr__(self, "_aop_interceptors", _as_interceptor_tuple(interceptors))
+    object.__setattr__(self, "_aop_chain", compile_chain(self._aop_interceptors))
+    if self.__class__.__dictoffset__:
+        object.__setattr__(self, "__dict__", target.__dict__)
+
+def _init_classic_proxy(self, target, interceptors):
+    self.__dict__["_aop_target"] = target
+    self.__dict__["_aop_interceptors"] = _as_interceptor_tuple(interceptors)
+    self.__dict__["_aop_chain"] = compile_chain(self.__dict__["_aop_interceptors"])
+
+def _as_interceptor_tuple(interceptors):
+    if interceptors is None:
+        return ()
+    if type(interceptors) == list:
+        return tuple(interceptors)
+    return (interceptors,)
+
+def _get_target_attribute(self, name):
+    if name in ["_aop_target", "_aop_interceptors", "_aop_chain"]:
+        raise AttributeError(name)
+    return getattr(self._aop_target, name)
+
+def _set_target_attribute(self, name, value):
+    setattr(self._aop_target, name, value)
+
+def _delete_target_attribute(self, name):
+    delattr(self._aop_target, name)
+
+class PerformanceMonitorInterceptor(AsyncMethodInterceptor):
+    """Logs when each call begins and ends, and how many seconds it took. For methods returning a Future, the end is
+    logged when the Future is done."""
     def __init__(self, prefix = None, level = logging.DEBUG):
         self.prefix = prefix
         self.level = level
         self.logger = logging.getLogger("springpython.aop")
 
-    def invoke(self, invocation):
+    def before(self, invocation):
         self.logger.log(self.level, "%s BEGIN" % (self.prefix))
-        timing.start()
-        results = invocation.proceed()
-        timing.finish()
-        self.logger.log(self.level, "%s END => %s" % (self.prefix, timing.milli()/1000.0))
+        return time.time()
+
+    def after(self, invocation, context, result, exc_info):
+        self.logger.log(self.level, "%s END => %s" % (self.prefix, time.time() - context))
+        return result
+
+class PerformanceMetricsInterceptor(AsyncMethodInterceptor):
+    """Collects the latency histogram, call count and error count of each intercepted "class.method", instead of
+    logging every call like PerformanceMonitorInterceptor. Calls are recorded per thread without locking. snapshot()
+    returns the aggregates, including 50th/95th/99th percentiles, and format_metrics() renders them in the Prometheus
+    text exposition format, with metric names starting with name."""
+    def __init__(self, name = "springpython_method"):
+        self.name = name
+        self.recorder = metrics.LatencyRecorder()
+
+    def before(self, invocation):
+        return time.time()
+
+    def after(self, invocation, context, result, exc_info):
+        self.recorder.record("%s.%s" % (invocation.instance.__class__.__name__, invocation.method_name),
+                             time.time() - context, exc_info is not None)
+        return result
+
+    def snapshot(self):
+        return self.recorder.snapshot()
+
+    def format_metrics(self):
+        return metrics.format_metrics(self.snapshot(), self.name)
+
+    def reset(self):
+        self.recorder.reset()
+
+class CachingInterceptor(MethodInterceptor):
+    """Memoizes the results of intercepted methods, keyed by target, method name and arguments, so proxies of
+    different targets sharing this interceptor don't see each other's results. Targets are told apart by identity,
+    through weak references, so a cache doesn't keep them alive, and a new target never gets the results of one
+    which is gone. Each method caches into a CacheRegion of its own, unless regions maps its name to the name of a
+    shared one. Regions keep up to max_size results, evicting the least recently used ones first, for ttl seconds, or
+    until evicted if ttl isn't set. A ttl of zero or less is rejected with ValueError. Exceptions aren't cached, and
+    neither are calls with arguments which can't be hashed, or on targets which can't be weakly referenced.
+
+    evictions maps the names of methods which change data to the region(s) they clear once they return, e.g.
+    {"save_user": ["load_user"]}. evict() and clear() do the same programmatically, and stats() returns the hits,
+    misses, evictions and expirations of each region. To cache only some methods, use this as the advice of a
+    RegexpMethodPointcutAdvisor."""
+    def __init__(self, ttl = None, max_size = 1000, regions = None, evictions = None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.regions = regions or {}
+        self.evictions = evictions or {}
+        self.cache_regions = {}
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("springpython.aop.CachingInterceptor")
+
+    def __setattr__(self, name, value):
+        """Numbers set through XML and YAML configs arrive as strings."""
+        if name == "ttl" and value is not None:
+            value = float(value)
+            if value <= 0:
+                raise ValueError("ttl must be positive, or None to never expire, not %r" % value)
+        elif name == "max_size" and value is not None:
+            value = int(value)
+        self.__dict__[name] = value
+
+    def invoke(self, invocation):
+        method_name = invocation.method_name
+        if method_name in self.evictions:
+            results = invocation.proceed()
+            region_names = self.evictions[method_name]
+            if isinstance(region_names, basestring):
+                region_names = [region_names]
+            for region_name in region_names:
+                self.clear(region_name)
+            return results
+
+        try:
+            key = (method_name, invocation.args, frozenset(invocation.kwargs.items()), _TargetKey(invocation.instance))
+            hash(key)
+        except TypeError:
+            return invocation.proceed()
+
+        region = self.get_region(self.regions.get(method_name, method_name))
+        results = region.get(key, _not_cached)
+        if results is _not_cached:
+            results = invocation.proceed()
+            region.put(key, results)
         return results
+
+    def get_region(self, name):
+        """Returns the named CacheRegion, creating it with this interceptor's ttl and max_size if need be."""
+        try:
+            return self.cache_regions[name]
+        except KeyError:
+            self.lock.acquire()
+            try:
+                if name not in self.cache_regions:
+                    self.cache_regions[name] = CacheRegion(name, self.ttl, self.max_size)
+                return self.cache_regions[name]
+            finally:
+                self.lock.release()
+
+    def evict(self, method_name, *args, **kwargs):
+        """Forgets the cached results of calling a method with the given arguments, on every target."""
+        call = (method_name, args, frozenset(kwargs.items()))
+        self.get_region(self.regions.get(method_name, method_name)).evict_where(lambda key: key[:3] == call)
+
+    def clear(self, region_name = None):
+        """Forgets every result cached in a region, or in all regions."""
+        if region_name is None:
+            regions = self.cache_regions.values()
+        else:
+            regions = [self.get_region(region_name)]
+        for region in regions:
+            self.logger.debug("Clearing cache region %s" % region.name)
+            region.clear()
+
+    def stats(self):
+        return dict([(name, region.stats()) for name, region in self.cache_regions.items()])
+
+_not_cached = object()
+
+class _TargetKey(weakref.ref):
+    """Stands for a target in cache keys. Keys are equal while they refer to the same live object, so once the target
+    is gone, its keys match nothing, even if another object gets its id()."""
+    def __init__(self, target):
+        weakref.ref.__init__(self, target)
+        self.hash = id(target)
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, _TargetKey):
+            return False
+        target = self()
+        return target is not None and target is other()
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+class CoalescingInterceptor(MethodInterceptor):
+    """Coalesces concurrent identical calls: while a call on a target is running, any other thread calling the same
+    method of the same target with the same arguments waits for it, and gets the same result, or exception, instead
+    of calling the target again. Calls with arguments which can't be hashed always go through.
+
+    batch_methods optionally maps single-key methods to bulk methods of the target, e.g. {"load_user": "load_users"}.
+    Calls to such a method with one positional argument are then collected for batch_window seconds, or until
+    max_batch_size distinct keys are waiting, and answered by a single call to the bulk method with the list of keys.
+    The bulk method returns either a dictionary keyed by those keys, or a sequence in the same order. Bulk calls go
+    straight to the target, bypassing any interceptors after this one."""
+    def __init__(self, batch_methods = None, batch_window = 0.005, max_batch_size = 100):
+        self.batch_methods = batch_methods or {}
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.batches = {}
+        self.logger = logging.getLogger("springpython.aop.CoalescingInterceptor")
+
+    def __setattr__(self, name, value):
+        """Numbers set through XML and YAML configs arrive as strings."""
+        if name == "batch_window":
+            value = float(value)
+        elif name == "max_batch_size":
+            value = int(value)
+        self.__dict__[name] = value
+
+    def invoke(self, invocation):
+        if invocation.method_name in self.batch_methods and len(invocation.args) == 1 and not invocation.kwargs:
+            try:
+                hash(invocation.args[0])
+            except TypeError:
+                return invocation.proceed()
+            return self._invoke_batched(invocation, self.batch_methods[invocation.method_name])
+
+        key = (id(invocation.instance), invocation.method_name, invocation.args, frozenset(invocation.kwargs.items()))
+        try:
+            hash(key)
+        except TypeError:
+            return invocation.proceed()
+
+        self.lock.acquire()
+        try:
+            future = self.in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self.in_flight[key] = Future()
+        finally:
+            self.lock.release()
+
+        if not leader:
+            self.logger.debug("Joining the call of %s already in flight" % invocation.method_name)
+            return future.result()
+
+        try:
+            results = invocation.proceed()
+        except:
+            # Whatever went wrong, the waiting threads must be released.
+            exc_info = sys.exc_info()
+            self._land(key, future, None, exc_info)
+            raise exc_info[0], exc_info[1], exc_info[2]
+        self._land(key, future, results, None)
+        return results
+
+    def _land(self, key, future, results, exc_info):
+        self.lock.acquire()
+        try:
+            del self.in_flight[key]
+        finally:
+            self.lock.release()
+        if exc_info is not None:
+            future.set_exc_info(exc_info)
+        else:
+            future.set_result(results)
+
+    def _invoke_batched(self, invocation, bulk_method_name):
+        batch_key = (id(invocation.instance), invocation.method_name)
+        key = invocation.args[0]
+
+        self.lock.acquire()
+        try:
+            batch = self.batches.get(batch_key)
+            leader = batch is None
+            if leader:
+                batch = self.batches[batch_key] = _Batch()
+            future = batch.futures.get(key)
+            if future is None:
+                future = batch.futures[key] = Future()
+                batch.keys.append(key)
+                if len(batch.keys) >= self.max_batch_size:
+                    del self.batches[batch_key]
+                    batch.full.set()
+        finally:
+            self.lock.release()
+
+        if leader:
+            batch.full.wait(self.batch_window)
+            self.lock.acquire()
+            try:
+                if self.batches.get(batch_key) is batch:
+                    del self.batches[batch_key]
+            finally:
+                self.lock.release()
+            self._run_batch(batch, getattr(invocation.instance, bulk_method_name))
+
+        return future.result()
+
+    def _run_batch(self, batch, bulk_method):
+        self.logger.debug("Calling %s for a batch of %s keys" % (bulk_method.__name__, len(batch.keys)))
+        try:
+            results = bulk_method(list(batch.keys))
+        except:
+            exc_info = sys.exc_info()
+            for key in batch.keys:
+                batch.futures[key].set_exc_info(exc_info)
+            return
+
+        for i, key in enumerate(batch.keys):
+            try:
+                if isinstance(results, dict):
+                    value = results[key]
+                else:
+                    value = results[i]
+            except (KeyError, IndexError):
+                batch.futures[key].set_exc_info(sys.exc_info())
+            else:
+                batch.futures[key].set_result(value)
+
+class _Batch(object):
+    """The keys collected for one bulk call, in arrival order, each with the Future its callers wait on."""
+    def __init__(self):
+        self.keys = []
+        self.futures = {}
+        self.full = threading.Event()
+
+class CircuitOpenException(Exception):
+    """Raised instead of calling a target whose circuit breaker is open."""
+
+class BulkheadFullException(Exception):
+    """Raised instead of calling a target which already has as many calls running and waiting as its bulkhead allows."""
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+class CircuitBreakerInterceptor(AsyncMethodInterceptor):
+    """Stops calling a target which keeps failing, e.g. a remote service whose host is down, so callers don't each
+    wait for a socket timeout. After failure_threshold consecutive calls raise one of failure_exceptions, the circuit
+    opens and every call raises CircuitOpenException at once. reset_timeout seconds later, it is half-open: a single
+    call is let through as a probe, closing the circuit again if it succeeds, or reopening it if it fails, while
+    other calls keep failing fast. Use one interceptor per target, e.g. on the ProxyFactoryObject of each remote
+    proxy."""
+    def __init__(self, failure_threshold = 5, reset_timeout = 30.0, failure_exceptions = (Exception,), name = None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failure_exceptions = failure_exceptions
+        self.name = name
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("springpython.aop.CircuitBreakerInterceptor")
+
+    def __setattr__(self, name, value):
+        """Numbers set through XML and YAML configs arrive as strings."""
+        if name == "failure_threshold":
+            value = int(value)
+        elif name == "reset_timeout":
+            value = float(value)
+        elif name == "failure_exceptions" and isinstance(value, list):
+            value = tuple(value)
+        self.__dict__[name] = value
+
+    def before(self, invocation):
+        """Returns whether this call is the probe of a half-open circuit."""
+        self.lock.acquire()
+        try:
+            if self.state == CLOSED:
+                return False
+            if self.state == OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+        finally:
+            self.lock.release()
+        raise CircuitOpenException("Circuit of %s is open, not calling %s" % (self._describe(invocation),
+                                                                               invocation.method_name))
+
+    def after(self, invocation, context, result, exc_info):
+        failed = exc_info is not None and isinstance(exc_info[1], self.failure_exceptions)
+        self.lock.acquire()
+        try:
+            if context:
+                self.probing = False
+            if not failed:
+                if self.state != CLOSED and context:
+                    self.logger.info("Closing circuit of %s" % self._describe(invocation))
+                    self.state = CLOSED
+                self.failures = 0
+                return result
+
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.logger.warning("Opening circuit of %s after %s failures" % (self._describe(invocation),
+                                                                                     self.failures))
+                self.state = OPEN
+                self.opened_at = time.time()
+        finally:
+            self.lock.release()
+        return result
+
+    def reset(self):
+        """Closes the circuit and forgets past failures."""
+        self.lock.acquire()
+        try:
+            self.state = CLOSED
+            self.failures = 0
+            self.probing = False
+        finally:
+            self.lock.release()
+
+    def _describe(self, invocation):
+        return self.name or invocation.instance.__class__.__name__
+
+class BulkheadInterceptor(AsyncMethodInterceptor):
+    """Limits how many calls run on a target at once, so a slow remote service can tie up only so many of the
+    caller's threads. Up to max_concurrent_calls calls run; beyond that, up to max_queue callers wait, for at most
+    queue_timeout seconds if that is set, for a call to finish. Any other call raises BulkheadFullException at once.
+    Use one interceptor per target. Calls returning a Future count as running until it is done."""
+    def __init__(self, max_concurrent_calls = 10, max_queue = 0, queue_timeout = None, name = None):
+        self.max_concurrent_calls = max_concurrent_calls
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.name = name
+        self.active = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+
+    def __setattr__(self, name, value):
+        """Numbers set through XML and YAML configs arrive as strings."""
+        if name in ("max_concurrent_calls", "max_queue"):
+            value = int(value)
+        elif name == "queue_timeout" and value is not None:
+            value = float(value)
+        self.__dict__[name] = value
+
+    def before(self, invocation):
+        self.condition.acquire()
+        try:
+            if self.active >= self.max_concurrent_calls:
+                if self.waiting >= self.max_queue:
+                    self._reject(invocation)
+                self.waiting += 1
+                try:
+                    if self.queue_timeout is not None:
+                        deadline = time.time() + self.queue_timeout
+                    while self.active >= self.max_concurrent_calls:
+                        if self.queue_timeout is None:
+                            self.condition.wait()
+                        else:
+                            remaining = deadline - time.time()
+                            if remaining <= 0:
+                                self._reject(invocation)
+                            self.condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+        finally:
+            self.condition.release()
+
+    def after(self, invocation, context, result, exc_info):
+        self.condition.acquire()
+        try:
+            self.active -= 1
+            self.condition.notify()
+        finally:
+            self.condition.release()
+        return result
+
+    def _reject(self, invocation):
+        raise BulkheadFullException("Bulkhead of %s is full (%s running, %s waiting), not calling %s" %
+                                    (self.name or invocation.instance.__class__.__name__, self.active, self.waiting,
+                                     invocation.method_name))
+
+class AsyncExecutionInterceptor(MethodInterceptor):
+    """Runs intercepted methods on a pool of threads or processes, returning a springpython.aop.future.Future to the
+    caller right away. Use it as the advice of a RegexpMethodPointcutAdvisor to offload only some methods.
+
+    executor may be anything with a submit(fn, *args, **kwargs) method returning a future, e.g. an executor from
+    the "futures" backport of concurrent.futures. Otherwise one is created on first use, with up to max_workers
+    threads, or processes if pool is "process". On threads, the rest of the interceptor chain runs on the worker
+    thread. In processes, the target method is called directly, so the target and arguments must be picklable, and
+    calls which haven't completed within task_timeout seconds, if set, fail with TimeoutError, which is how calls
+    lost to a worker process dying are noticed."""
+    def __init__(self, executor = None, pool = "thread", max_workers = 4, task_timeout = None):
+        self.executor = executor
+        self.pool = pool
+        self.max_workers = max_workers
+        self.task_timeout = task_timeout
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("springpython.aop.AsyncExecutionInterceptor")
+
+    def __setattr__(self, name, value):
+        """Numbers set through XML and YAML configs arrive as strings."""
+        if name == "max_workers" and value is not None:
+            value = int(value)
+        elif name == "task_timeout" and value is not None:
+            value = float(value)
+        self.__dict__[name] = value
+
+    def invoke(self, invocation):
+        executor = self.get_executor()
+        self.logger.debug("Submitting %s to %s" % (invocation.method_name, executor))
+        if self.pool == "process":
+            return executor.submit(_call_method, invocation.instance, invocation.method_name, invocation.args,
+                                   invocation.kwargs)
+        return executor.submit(invocation.proceed)
+
+    def get_executor(self):
+        if self.executor is None:
+            self.lock.acquire()
+            try:
+                if self.executor is None:
+                    if self.pool == "process":
+                        self.executor = ProcessPoolExecutor(self.max_workers, self.task_timeout)
+                    elif self.pool == "thread":
+                        self.executor = ThreadPoolExecutor(self.max_workers)
+                    else:
+                        raise ValueError("Unknown pool %r, expected 'thread' or 'process'" % self.pool)
+            finally:
+                self.lock.release()
+        return self.executor
+
+    def shutdown(self, wait = True):
+        if self.executor is not None:
+            self.executor.shutdown(wait)
+
+def _call_method(instance, method_name, args, kwargs):
+    return getattr(instance, method_name)(*args, **kwargs)
@@ -0,0 +1,349 @@
+"""
+   Copyright 2006-2008 SpringSource (http://springsource.com), All Rights Reserved
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+import sys
+import time
+import Queue
+import logging
+import threading
+
+try:
+    import multiprocessing
+except ImportError, e:
+    multiprocessing = None
+
+class TimeoutError(Exception):
+    """Raised when a Future isn't done within the given time."""
+
+class Future(object):
+    """
+    The result of a method call which completes later, possibly on another thread. It offers the
+    subset of the concurrent.futures.Future API which advice needs (done, result, exception and
+    add_done_callback), so futures from the "futures" backport can be returned by targets as well.
+    """
+    logger = logging.getLogger("springpython.aop.future.Future")
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.finished = False
+        self.value = None
+        self.exc_info = None
+        self.callbacks = []
+
+    def done(self):
+        return self.finished
+
+    def result(self, timeout=None):
+        """Waits for the call to complete and returns its result, re-raising its exception if it failed."""
+        self._wait(timeout)
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.value
+
+    def exception(self, timeout=None):
+        """Waits for the call to complete and returns the exception it raised, or None."""
+        self._wait(timeout)
+        if self.exc_info is not None:
+            return self.exc_info[1]
+        return None
+
+    def add_done_callback(self, callback):
+        """Calls callback(future) once the future is done, right away if it already is."""
+        self.condition.acquire()
+        try:
+            if not self.finished:
+                self.callbacks.append(callback)
+                return
+        finally:
+            self.condition.release()
+        self._call(callback)
+
+    def set_result(self, value):
+        self._finish(value, None)
+
+    def set_exception(self, exception):
+        self._finish(None, (exception.__class__, exception, None))
+
+    def set_exc_info(self, exc_info):
+        """Fails the future with the result of sys.exc_info(), keeping the original traceback."""
+        self._finish(None, exc_info)
+
+    def _finish(self, value, exc_info):
+        self.condition.acquire()
+        try:
+            if self.finished:
+                raise RuntimeError("Future is already done")
+            self.value = value
+            self.exc_info = exc_info
+            self.finished = True
+            callbacks, self.callbacks = self.callbacks, []
+            self.condition.notifyAll()
+        finally:
+            self.condition.release()
+
+        for callback in callbacks:
+            self._call(callback)
+
+    def _call(self, callback):
+        try:
+            callback(self)
+        except Exception, e:
+            self.logger.exception("Callback %s of %s failed" % (callback, self))
+
+    def _wait(self, timeout):
+        self.condition.acquire()
+        try:
+            if not self.finished:
+                self.condition.wait(timeout)
+            if not self.finished:
+                raise TimeoutError("Future wasn't done within %s seconds" % timeout)
+        finally:
+            self.condition.release()
+
+def is_future(obj):
+    """Tells whether obj looks like a Future, i.e. has result() and add_done_callback()."""
+    return hasattr(obj, "add_done_callback") and hasattr(obj, "result")
+
+def then(future, callback):
+    """
+    Returns a Future which completes with callback(future) once future is done, or with the
+    exception callback raises.
+    """
+    chained = Future()
+
+    def on_done(source):
+        try:
+            value = callback(source)
+        except Exception:
+            chained.set_exc_info(sys.exc_info())
+        else:
+            chained.set_result(value)
+
+    future.add_done_callback(on_done)
+    return chained
+
+def completed(value):
+    """Returns a Future which is already done with a given result."""
+    future = Future()
+    future.set_result(value)
+    return future
+
+class ThreadPoolExecutor(object):
+    """
+    Runs callables on up to max_workers daemon threads, started as work arrives. submit() returns
+    a Future, like concurrent.futures.ThreadPoolExecutor's does.
+    """
+    logger = logging.getLogger("springpython.aop.future.ThreadPoolExecutor")
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.queue = Queue.Queue()
+        self.lock = threading.Lock()
+        self.threads = []
+        self.idle = 0
+        self.closed = False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self.lock.acquire()
+        try:
+            if self.closed:
+                raise RuntimeError("Cannot submit work after shutdown")
+            self.queue.put((future, fn, args, kwargs))
+            if self.idle == 0 and len(self.threads) < self.max_workers:
+                thread = threading.Thread(target=self._work, name="%s-%d" % (self.__class__.__name__, len(self.threads)))
+                thread.setDaemon(True)
+                self.threads.append(thread)
+                thread.start()
+        finally:
+            self.lock.release()
+        return future
+
+    def shutdown(self, wait=True):
+        """Stops the threads once the work already submitted is done, waiting for that if wait is set."""
+        self.lock.acquire()
+        try:
+            self.closed = True
+            threads = list(self.threads)
+        finally:
+            self.lock.release()
+        for thread in threads:
+            self.queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _work(self):
+        while True:
+            self._set_idle(1)
+            item = self.queue.get()
+            self._set_idle(-1)
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            try:
+                result = fn(*args, **kwargs)
+            except:
+                future.set_exc_info(sys.exc_info())
+            else:
+                future.set_result(result)
+
+    def _set_idle(self, change):
+        self.lock.acquire()
+        try:
+            self.idle += change
+        finally:
+            self.lock.release()
+
+class ProcessPoolExecutor(object):
+    """
+    Runs callables in a multiprocessing pool of max_workers processes, created on first use.
+    Callables, arguments and results must be picklable, so callables have to be module-level
+    functions. submit() returns a Future.
+
+    The pool only reports successes to callbacks, so a thread watches the outstanding tasks, every
+    poll_interval seconds, for failures the callable itself didn't raise, e.g. a result which can't
+    be pickled; their futures raise the pool's exception. A worker process which dies outright
+    loses its task without a trace; with task_timeout set, futures of tasks which haven't completed
+    within that many seconds raise TimeoutError instead of waiting forever.
+    """
+    def __init__(self, max_workers=None, task_timeout=None, poll_interval=0.1):
+        if multiprocessing is None:
+            raise ImportError("ProcessPoolExecutor needs the multiprocessing module")
+        self.max_workers = max_workers
+        self.task_timeout = task_timeout
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.pool = None
+        self.pending = []
+        self.watcher = None
+        self.abandoned = False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+
+        def on_done(outcome):
+            succeeded, value = outcome
+            try:
+                if succeeded:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+            except RuntimeError:
+                # The watcher already timed the task out. Raising here would stop the pool's result handler.
+                pass
+
+        if self.task_timeout is not None:
+            deadline = time.time() + self.task_timeout
+        else:
+            deadline = None
+
+        self.lock.acquire()
+        try:
+            async_result = self._get_pool().apply_async(_call_capturing, (fn, args, kwargs), callback=on_done)
+            self.pending.append((future, async_result, deadline))
+            if self.watcher is None:
+                self.watcher = threading.Thread(target=self._watch, name="springpython-process-pool-watcher")
+                self.watcher.setDaemon(True)
+                self.watcher.start()
+        finally:
+            self.lock.release()
+        return future
+
+    def shutdown(self, wait=True):
+        """
+        Stops accepting tasks. With wait, blocks until the outstanding tasks completed or timed
+        out, then until the pool's processes exited. A pool which lost a task to a dying worker
+        would wait for it forever, so it is terminated instead.
+        """
+        self.lock.acquire()
+        try:
+            pool, self.pool = self.pool, None
+        finally:
+            self.lock.release()
+        if pool is not None:
+            pool.close()
+            if wait:
+                while self.watcher is not None:
+                    time.sleep(self.poll_interval)
+                if self.abandoned:
+                    pool.terminate()
+                pool.join()
+
+    def _get_pool(self):
+        """Returns the pool, creating it if need be. The lock must be held."""
+        if self.pool is None:
+            self.abandoned = False
+            self.pool = multiprocessing.Pool(self.max_workers)
+        return self.pool
+
+    def _watch(self):
+        """Completes the futures of tasks which failed inside the pool or ran out of time, until none are left.
+        Futures are failed outside the lock, as their callbacks may submit more tasks."""
+        failed = []
+        while True:
+            self.lock.acquire()
+            try:
+                if not self.pending and not failed:
+                    self.watcher = None
+                    return
+            finally:
+                self.lock.release()
+
+            for future, exc_info in failed:
+                try:
+                    future.set_exc_info(exc_info)
+                except RuntimeError:
+                    # The pool's callback completed the future in the meantime.
+                    pass
+
+            time.sleep(self.poll_interval)
+            failed = []
+            self.lock.acquire()
+            try:
+                pending = self.pending
+                self.pending = []
+                for task in pending:
+                    finished, exc_info = self._check(*task)
+                    if not finished:
+                        self.pending.append(task)
+                    elif exc_info is not None:
+                        failed.append((task[0], exc_info))
+            finally:
+                self.lock.release()
+
+    def _check(self, future, async_result, deadline):
+        """Returns whether a task is finished with, and the exc_info to fail its future with if the pool's callback
+        won't complete it."""
+        if async_result.ready():
+            # Successful results were handed to the callback before the result became ready.
+            if not async_result.successful():
+                try:
+                    async_result.get(0)
+                except:
+                    return True, sys.exc_info()
+            return True, None
+        if deadline is not None and time.time() > deadline:
+            self.abandoned = True
+            exception = TimeoutError("Task didn't complete within %s seconds" % self.task_timeout)
+            return True, (TimeoutError, exception, None)
+        return False, None
+
+def _call_capturing(fn, args, kwargs):
+    """Runs in a pool process. Exceptions are returned rather than raised, as the pool's callback only sees successes."""
+    try:
+        return True, fn(*args, **kwargs)
+    except Exception, e:
+        return False, e
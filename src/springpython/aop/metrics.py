@@ -0,0 +1,177 @@
+"""
+   Copyright 2006-2008 SpringSource (http://springsource.com), All Rights Reserved
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+import bisect
+import threading
+
+# Upper bounds, in seconds, of the latency histogram buckets: four per doubling from one
+# microsecond up to about two minutes, so a percentile is off by at most 19%. Anything
+# slower falls in a last, unbounded bucket.
+BUCKET_BOUNDS = [1e-6 * 2 ** (i / 4.0) for i in range(109)]
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+class LatencyRecorder(object):
+    """
+    Records call latencies and error counts per key, e.g. per method. Each thread records into
+    buffers of its own without taking any lock; snapshot() merges the buffers of all threads.
+    The buffers of finished threads are folded into a shared total whenever a thread records
+    for the first time or a snapshot is taken, so there are never more buffers than threads
+    which were alive at the last of those.
+
+    As no thread may touch another thread's buffer, reset() starts a new generation of buffers
+    instead of clearing them: each thread drops its buffer for a new one on its next record.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.buffers = []
+        self.retired = {}
+        self.generation = 0
+
+    def record(self, key, elapsed, failed=False):
+        try:
+            stats = self.local.stats
+            if self.local.generation != self.generation:
+                stats = self._register_thread()
+        except AttributeError:
+            stats = self._register_thread()
+
+        try:
+            entry = stats[key]
+        except KeyError:
+            entry = stats[key] = _new_entry()
+
+        entry[0] += 1
+        if failed:
+            entry[1] += 1
+        entry[2] += elapsed
+        if elapsed > entry[3]:
+            entry[3] = elapsed
+        entry[4][bisect.bisect_left(BUCKET_BOUNDS, elapsed)] += 1
+
+    def snapshot(self):
+        """
+        Returns a dictionary with, for each key, its call and error counts, the total, maximum and
+        50th/95th/99th percentile latencies (estimated as the upper bound of a histogram bucket),
+        and the bucket counts themselves (see BUCKET_BOUNDS).
+        """
+        self.lock.acquire()
+        try:
+            self._retire_finished_threads()
+
+            totals = {}
+            _merge(totals, self.retired)
+            for thread, stats in self.buffers:
+                _merge(totals, dict(stats))
+        finally:
+            self.lock.release()
+
+        snapshot = {}
+        for key, (count, errors, elapsed, maximum, buckets) in totals.items():
+            snapshot[key] = {"count": count, "errors": errors, "sum": elapsed, "max": maximum,
+                             "buckets": buckets}
+            for quantile in QUANTILES:
+                snapshot[key]["p%d" % round(quantile * 100)] = _percentile(buckets, count, quantile, maximum)
+        return snapshot
+
+    def reset(self):
+        """Forgets everything recorded so far. Calls being recorded meanwhile may be forgotten too."""
+        self.lock.acquire()
+        try:
+            self.generation += 1
+            self.buffers = []
+            self.retired = {}
+        finally:
+            self.lock.release()
+
+    def _register_thread(self):
+        """Gives the calling thread a new buffer of the current generation."""
+        stats = {}
+        self.lock.acquire()
+        try:
+            self._retire_finished_threads()
+            self.buffers.append((threading.currentThread(), stats))
+            self.local.stats = stats
+            self.local.generation = self.generation
+        finally:
+            self.lock.release()
+        return stats
+
+    def _retire_finished_threads(self):
+        """Folds the buffers of finished threads into the shared total. The lock must be held."""
+        alive = []
+        for thread, stats in self.buffers:
+            if not thread.isAlive():
+                _merge(self.retired, stats)
+            else:
+                alive.append((thread, stats))
+        self.buffers = alive
+
+def format_metrics(snapshot, name):
+    """
+    Formats a snapshot in the Prometheus text exposition format: a summary of latencies named
+    <name>_seconds, and a counter of failed calls named <name>_errors_total, labelled by key.
+    """
+    lines = ["# HELP %s_seconds Latency of intercepted method calls." % name,
+             "# TYPE %s_seconds summary" % name]
+    keys = sorted(snapshot.keys())
+    for key in keys:
+        label = _escape(key)
+        for quantile in QUANTILES:
+            lines.append('%s_seconds{method="%s",quantile="%s"} %r' %
+                         (name, label, quantile, snapshot[key]["p%d" % round(quantile * 100)]))
+        lines.append('%s_seconds_sum{method="%s"} %r' % (name, label, snapshot[key]["sum"]))
+        lines.append('%s_seconds_count{method="%s"} %d' % (name, label, snapshot[key]["count"]))
+
+    lines.append("# HELP %s_errors_total Intercepted method calls which raised an exception." % name)
+    lines.append("# TYPE %s_errors_total counter" % name)
+    for key in keys:
+        lines.append('%s_errors_total{method="%s"} %d' % (name, _escape(key), snapshot[key]["errors"]))
+    return "\n".join(lines) + "\n"
+
+def _new_entry():
+    """count, errors, total seconds, maximum seconds, bucket counts"""
+    return [0, 0, 0.0, 0.0, [0] * (len(BUCKET_BOUNDS) + 1)]
+
+def _merge(totals, stats):
+    for key, entry in stats.items():
+        if key not in totals:
+            totals[key] = _new_entry()
+        total = totals[key]
+        total[0] += entry[0]
+        total[1] += entry[1]
+        total[2] += entry[2]
+        total[3] = max(total[3], entry[3])
+        buckets = total[4]
+        for i, count in enumerate(entry[4]):
+            if count:
+                buckets[i] += count
+
+def _percentile(buckets, count, quantile, maximum):
+    if count == 0:
+        return 0.0
+    rank = quantile * count
+    seen = 0
+    for i, bucket in enumerate(buckets):
+        seen += bucket
+        if seen >= rank:
+            if i < len(BUCKET_BOUNDS):
+                return min(BUCKET_BOUNDS[i], maximum)
+            return maximum
+    return maximum
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -13,11 +13,23 @@
    See the License for the specific language governing permissions and
    limitations under the License.
 """
+import os
 import re
 import types
 import inspect
 import logging
 
+try:
+    import cPickle as pickle
+except ImportError, e:
+    import pickle
+
+try:
+    from hashlib import sha1
+except ImportError, e:
+    from sha import new as sha1
+
+import springpython
 from springpython.context import scope
 from decorator import decorator, partial
 from springpython.context import ApplicationContextAware
@@ -69,10 +81,10 @@ class ReferenceDef(object):
         self.get_value(container)
 
     def get_value(self, container):
-        return container.get_object(self.ref)
+        return container.get_reference(self.ref)
 
     def set_value(self, obj, container):
-        setattr(obj, self.name, container.objects[self.ref])
+        setattr(obj, self.name, self.get_value(container))
 
     def __str__(self):
         return "name=%s ref=%s" % (self.name, self.ref)
@@ -158,6 +170,16 @@ class ValueDef(object):
     def __str__(self):
         return "name=%s value=%s" % (self.name, self.value)
 
+    def __getstate__(self):
+        """Loggers are stored by name, so unpickled definitions log through the shared loggers."""
+        state = self.__dict__.copy()
+        state["logger"] = self.logger.name
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.logger = logging.getLogger(state["logger"])
+
 class DictDef(ValueDef):
     """Handles behavior for a dictionary-based value."""
     def __init__(self, name, value):
@@ -289,3 +311,94 @@ class Config(object):
         """Abstract method definition - should return an array of Object objects"""
         raise NotImplementedError()
 
+    def get_signature(self):
+        """
+        Returns a value which changes whenever the definitions read_object_defs would return
+        change, or None if that can't be told. Configs reading files named in config_location
+        are signed by the files' content hashes.
+        """
+        if not hasattr(self, "config_location"):
+            return None
+        signature = []
+        for location in self.config_location:
+            if not isinstance(location, basestring):
+                return None
+            signature.append((location, _get_digest(location)))
+        return tuple(signature)
+
+class ObjectDefCache(object):
+    """
+    ObjectDefCache keeps the object definitions parsed from config files in a directory, one
+    pickle per config file. An entry is only used while the file's modification time and SHA-1
+    content hash both match the ones it was stored with, so an edited file is parsed again
+    while unchanged files are not. Entries stored by another release of Spring Python, or while
+    the parser's type mappings (e.g. xml_mappings) were different, aren't used either.
+    """
+
+    # Bump whenever the pickled layout of object definitions changes.
+    FORMAT = 1
+
+    def __init__(self, cache_dir, mappings=None):
+        self.cache_dir = cache_dir
+        self.mappings = mappings or {}
+        self.logger = logging.getLogger("springpython.config.ObjectDefCache")
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, config_file):
+        """Returns the object definitions cached for a config file, or None."""
+        path = os.path.abspath(config_file)
+        try:
+            entry_file = open(self._get_entry_path(path), "rb")
+            try:
+                entry = pickle.load(entry_file)
+            finally:
+                entry_file.close()
+
+            if entry["format"] == self.FORMAT and entry["version"] == springpython.__version__ \
+                    and entry["mappings"] == self._get_mappings_digest() and entry["path"] == path \
+                    and entry["mtime"] == os.stat(path).st_mtime and entry["digest"] == _get_digest(path):
+                self.logger.debug("Using cached object definitions of %s" % path)
+                self.hits += 1
+                return entry["objects"]
+        except Exception, e:
+            self.logger.debug("No usable cached object definitions of %s (%s)" % (path, e))
+
+        self.misses += 1
+        return None
+
+    def store(self, config_file, objects):
+        """Caches the object definitions parsed from a config file. Failures are only logged."""
+        path = os.path.abspath(config_file)
+        entry_path = self._get_entry_path(path)
+        temp_path = "%s.%s.tmp" % (entry_path, os.getpid())
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            entry = {"format": self.FORMAT, "version": springpython.__version__,
+                     "mappings": self._get_mappings_digest(), "path": path, "mtime": os.stat(path).st_mtime,
+                     "digest": _get_digest(path), "objects": objects}
+            entry_file = open(temp_path, "wb")
+            try:
+                pickle.dump(entry, entry_file, pickle.HIGHEST_PROTOCOL)
+            finally:
+                entry_file.close()
+            os.rename(temp_path, entry_path)
+        except Exception, e:
+            self.logger.warning("Could not cache object definitions of %s (%s)" % (path, e))
+
+    def _get_entry_path(self, path):
+        return os.path.join(self.cache_dir, sha1(path).hexdigest() + ".objects")
+
+    def _get_mappings_digest(self):
+        """Mappings can be changed at any time, so they are hashed whenever an entry is loaded or stored."""
+        return sha1(repr(sorted(self.mappings.items()))).hexdigest()
+
+def _get_digest(path):
+    """Returns the SHA-1 hash of a file's content."""
+    config_file = open(path, "rb")
+    try:
+        return sha1(config_file.read()).hexdigest()
+    finally:
+        config_file.close()
+
@@ -74,6 +74,19 @@ _pythonConfigMethods = [name for (name, method) in inspect.getmembers(PythonConf
 
 _object_context = {}
 
+_loggers = {}
+
+def _get_logger(log_func_name):
+    """
+    Returns the logger of a kind of object, e.g. "objectSingleton", shared by all calls so that
+    no logger gets created per call and arguments.
+    """
+    try:
+        return _loggers[log_func_name]
+    except KeyError:
+        log = _loggers[log_func_name] = logging.getLogger("springpython.config.%s" % log_func_name)
+        return log
+
 def _object_wrapper(f, scope, parent, log_func_name, *args, **kwargs):
     """
     This function checks if the object already exists in the container. If so,
@@ -87,35 +100,44 @@ def _object_wrapper(f, scope, parent, log_func_name, *args, **kwargs):
     """
 
     def _deco(f, scope, parent, log_func_name, *args, **kwargs):
-        log = logging.getLogger("springpython.config.%s%s - %s%s" % (log_func_name,
-                                    f, str(args), scope))
+        log = _get_logger(log_func_name)
+        debug = log.isEnabledFor(logging.DEBUG)
+        if debug:
+            prefix = "%s%s - %s: " % (f, str(args), scope)
         if f.func_name != top_func:
-            log.debug("This is NOT the top-level object %s, deferring to container." % top_func)
+            if debug:
+                log.debug(prefix + "This is NOT the top-level object %s, deferring to container." % top_func)
             container = _object_context[args]["container"]
-            log.debug("Container = %s" % container)
+            if debug:
+                log.debug(prefix + "Container = %s" % container)
 
             if parent:
                 parent_result = container.get_object(parent, ignore_abstract=True)
-                log.debug("This IS the top-level object, calling %s(%s)" \
-                           % (f.func_name, parent_result))
+                if debug:
+                    log.debug(prefix + "This IS the top-level object, calling %s(%s)" \
+                               % (f.func_name, parent_result))
                 results = container.get_object(f.func_name)(parent_result)
             else:
                 results = container.get_object(f.func_name)
 
-            log.debug("Found %s inside the container" % results)
+            if debug:
+                log.debug(prefix + "Found %s inside the container" % results)
             return results
         else:
             if parent:
                 container = _object_context[(args[0],)]["container"]
                 parent_result = container.get_object(parent, ignore_abstract=True)
-                log.debug("This IS the top-level object, calling %s(%s)" \
-                           % (f.func_name, parent_result))
+                if debug:
+                    log.debug(prefix + "This IS the top-level object, calling %s(%s)" \
+                               % (f.func_name, parent_result))
                 results = f(container, parent_result)
             else:
-                log.debug("This IS the top-level object, calling %s()." % f.func_name)
+                if debug:
+                    log.debug(prefix + "This IS the top-level object, calling %s()." % f.func_name)
                 results = f(*args, **kwargs)
 
-            log.debug("Found %s" % results)
+            if debug:
+                log.debug(prefix + "Found %s" % results)
             return results
 
     return _deco(f, scope, parent, log_func_name, *args, **kwargs)
@@ -134,6 +156,9 @@ def Object(theScope=scope.SINGLETON, lazy_init=False, abstract=False, parent=Non
     elif theScope == scope.PROTOTYPE:
         log_func_name = "objectPrototype"
 
+    elif scope.get_scope(theScope) is not None:
+        log_func_name = "objectScoped"
+
     else:
         raise InvalidObjectScope("Don't know how to handle scope %s" % theScope)
 
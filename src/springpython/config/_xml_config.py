@@ -198,18 +198,26 @@ class SpringJavaConfig(Config):
 class XMLConfig(Config):
     """
     XMLConfig supports current Spring Python format of XML object definitions.
+
+    If cache_dir is given, the object definitions parsed from each file are kept there
+    (see ObjectDefCache) and reused until the file changes.
     """
 
     NS = "{http://www.springframework.org/springpython/schema/objects}"
     NS_11 = "{http://www.springframework.org/springpython/schema/objects/1.1}"
 
-    def __init__(self, config_location):
+    def __init__(self, config_location, cache_dir=None):
         if isinstance(config_location, list):
             self.config_location = config_location
         else:
             self.config_location = [config_location]
         self.logger = logging.getLogger("springpython.config.XMLConfig")
 
+        if cache_dir is not None:
+            self.cache = ObjectDefCache(cache_dir, xml_mappings)
+        else:
+            self.cache = None
+
         # By making this an instance-based property (instead of function local), inner object
         # definitions can add themselves to the list in the midst of parsing an input.
         self.objects = []
@@ -219,44 +227,59 @@ class XMLConfig(Config):
         # Reset, in case the file is re-read
         self.objects = []
         for config in self.config_location:
-            self.logger.debug("* Parsing %s" % config)
-
-            # A flat list of objects, as found in the XML document.
-            objects = etree.parse(config).getroot()
-
-            # We need to handle both 1.0 and 1.1 XSD schemata *and* we may be
-            # passed a list of config locations of different XSD versions so we
-            # must find out here which one is used in the current config file
-            # and pass the correct namespace down to other parts of XMLConfig.
-            ns = objects.tag[:objects.tag.find("}") + 1]
-
-            # A dictionary of abstract objects, keyed by their IDs, used in
-            # traversing the hierarchies of parents; built upfront here for
-            # convenience.
-            abstract_objects = {}
-            for obj in objects:
-                if obj.get("abstract"):
-                    abstract_objects[obj.get("id")] = obj
-
-            for obj in objects:
-                if obj.get("class") is None and not obj.get("parent"):
-                    self._map_custom_class(obj, xml_mappings, ns)
-
-                elif obj.get("parent"):
-                    # Children are added to self.objects during the children->abstract parents traversal.
-                    pos_constr = self._get_pos_constr(obj, ns)
-                    named_constr = self._get_named_constr(obj, ns)
-                    props = self._get_props(obj, ns)
-                    self._traverse_parents(obj, obj, ns, pos_constr, named_constr, props, abstract_objects)
+            cacheable = self.cache is not None and isinstance(config, basestring)
+            if cacheable:
+                cached_objects = self.cache.load(config)
+                if cached_objects is not None:
+                    self.objects.extend(cached_objects)
                     continue
+                first_object = len(self.objects)
 
-                self.objects.append(self._convert_object(obj, ns=ns))
+            self._read_object_defs_from(config)
+
+            if cacheable:
+                self.cache.store(config, self.objects[first_object:])
 
         self.logger.debug("==============================================================")
         for object in self.objects:
             self.logger.debug("Parsed %s" % object)
         return self.objects
 
+    def _read_object_defs_from(self, config):
+        """Parses one XML document, appending its object definitions to self.objects."""
+        self.logger.debug("* Parsing %s" % config)
+
+        # A flat list of objects, as found in the XML document.
+        objects = etree.parse(config).getroot()
+
+        # We need to handle both 1.0 and 1.1 XSD schemata *and* we may be
+        # passed a list of config locations of different XSD versions so we
+        # must find out here which one is used in the current config file
+        # and pass the correct namespace down to other parts of XMLConfig.
+        ns = objects.tag[:objects.tag.find("}") + 1]
+
+        # A dictionary of abstract objects, keyed by their IDs, used in
+        # traversing the hierarchies of parents; built upfront here for
+        # convenience.
+        abstract_objects = {}
+        for obj in objects:
+            if obj.get("abstract"):
+                abstract_objects[obj.get("id")] = obj
+
+        for obj in objects:
+            if obj.get("class") is None and not obj.get("parent"):
+                self._map_custom_class(obj, xml_mappings, ns)
+
+            elif obj.get("parent"):
+                # Children are added to self.objects during the children->abstract parents traversal.
+                pos_constr = self._get_pos_constr(obj, ns)
+                named_constr = self._get_named_constr(obj, ns)
+                props = self._get_props(obj, ns)
+                self._traverse_parents(obj, obj, ns, pos_constr, named_constr, props, abstract_objects)
+                continue
+
+            self.objects.append(self._convert_object(obj, ns=ns))
+
     def _map_custom_class(self, obj, mappings, ns):
         """ Fill in the missing attributes of Python objects and make it look
         to the rest of XMLConfig as if they already were in the XML config file.
@@ -39,46 +39,73 @@ yaml_mappings = {
 class YamlConfig(Config):
     """
     YamlConfig provides an alternative YAML-based version of objects.
+
+    If cache_dir is given, the object definitions parsed from each file are kept there
+    (see ObjectDefCache) and reused until the file changes.
     """
-    def __init__(self, config_location):
+    def __init__(self, config_location, cache_dir=None):
         if isinstance(config_location, list):
             self.config_location = config_location
         else:
             self.config_location = [config_location]
         self.logger = logging.getLogger("springpython.config.YamlConfig")
 
+        if cache_dir is not None:
+            self.cache = ObjectDefCache(cache_dir, yaml_mappings)
+        else:
+            self.cache = None
+
         # By making this an instance-based property (instead of function local), inner object
         # definitions can add themselves to the list in the midst of parsing an input.
         self.objects = []
 
     def read_object_defs(self):
-        import yaml
-
         self.logger.debug("==============================================================")
         # Reset, in case the file is re-read
         self.objects = []
         for config in self.config_location:
-            self.logger.debug("* Parsing %s" % config)
-            stream = file(config)
-            doc = yaml.load(stream)
-            self.logger.debug(doc)
+            cacheable = self.cache is not None and isinstance(config, basestring)
+            if cacheable:
+                cached_objects = self.cache.load(config)
+                if cached_objects is not None:
+                    self.objects.extend(cached_objects)
+                    continue
+                first_object = len(self.objects)
 
-            # A dictionary of abstract objects, keyed by their IDs, used in
-            # traversing the hierarchies of parents; built upfront here for
-            # convenience.
-            self.abstract_objects = {}
-            for object in doc["objects"]:
-                if "abstract" in object:
-                    self.abstract_objects[object["object"]] = object
+            self._read_object_defs_from(config)
 
-            for object in doc["objects"]:
-                self._print_obj(object)
-                self.objects.append(self._convert_object(object))
+            if cacheable:
+                self.cache.store(config, self.objects[first_object:])
 
         self.logger.debug("==============================================================")
         self.logger.debug("objects = %s" % self.objects)
         return self.objects
 
+    def _read_object_defs_from(self, config):
+        """Parses one YAML document, given as a file name or an open stream, appending its object definitions to
+        self.objects."""
+        import yaml
+
+        self.logger.debug("* Parsing %s" % config)
+        if isinstance(config, basestring):
+            stream = file(config)
+        else:
+            stream = config
+        doc = yaml.load(stream)
+        self.logger.debug(doc)
+
+        # A dictionary of abstract objects, keyed by their IDs, used in
+        # traversing the hierarchies of parents; built upfront here for
+        # convenience.
+        self.abstract_objects = {}
+        for object in doc["objects"]:
+            if "abstract" in object:
+                self.abstract_objects[object["object"]] = object
+
+        for object in doc["objects"]:
+            self._print_obj(object)
+            self.objects.append(self._convert_object(object))
+
     def _map_custom_class(self, obj, mappings):
         """ Enrich the object's attributes and make it look to the rest of
         YamlConfig as if the object had all of them right in the definition.
@@ -14,8 +14,17 @@
    limitations under the License.       
 """
 
+import time
+import types
+import inspect
 import logging
+import itertools
+import operator
+import weakref
+import threading
 from springpython.context import scope
+from springpython.context import profiler as startup_profiler
+from springpython.container.graph import DependencyGraph, CyclicDependencyException
 
 class ObjectContainer(object):
     """
@@ -31,9 +40,24 @@ class ObjectContainer(object):
     reach this container, it doesn't matter what their original format was when a object
     instance is needed. NOTE: This explicitly means that one object in one source
     can refer to another object in another source OF ANY FORMAT as a property.
+
+    An optional springpython.context.profiler.StartupProfiler records how long reading each
+    config and creating each object takes.
+
+    With lazy_proxies set, references to lazy_init singletons which don't exist yet are
+    injected as LazyObjectProxy instances, so those objects are only created once something
+    actually uses them.
+
+    The references between definitions are checked before an object is created: an object
+    which is part of a cycle of references, or depends on one, raises CyclicDependencyException
+    instead of recursing without end. Cycles among objects which are never requested, e.g. lazy
+    ones, are left alone. The dependency_graph attribute holds the graph, which can be exported
+    with its to_dot(). It is built again whenever object_defs has changed since.
     """
-    def __init__(self, config = None):
+    def __init__(self, config = None, profiler = None, lazy_proxies = False):
         self.logger = logging.getLogger("springpython.container.ObjectContainer")
+        self.profiler = profiler
+        self.lazy_proxies = lazy_proxies
 
         if config is None:
             self.configs = []
@@ -43,10 +67,18 @@ class ObjectContainer(object):
             self.configs = [config]
 
         self.object_defs = {}
+
+        # What each config returned, so that an application context's refresh() can tell which
+        # definitions changed. The configs' signatures are only taken by the first refresh(),
+        # sparing every other container the hashing of its config files.
+        self.config_object_defs = []
+        self.config_signatures = None
     
         for configuration in self.configs:
             self.logger.debug("=== Scanning configuration %s for object definitions ===" % configuration)
-            for object_def in configuration.read_object_defs():
+            self.config_object_defs.append(self._read_config(configuration))
+
+            for object_def in self.config_object_defs[-1]:
                 if object_def.id not in self.object_defs:
                     self.logger.debug("%s object definition does not exist. Adding to list of definitions." % object_def.id)
                 else:
@@ -55,13 +87,73 @@ class ObjectContainer(object):
 
         self.logger.debug("=== Done reading object definitions. ===")
 
-        self.objects = {}
+        self.dependency_graph = self.get_dependency_graph()
+
+        # Taken before any object is created, because creating objects may alter definitions.
+        self.object_def_fingerprints = dict([(name, get_fingerprint(object_def))
+                                             for name, object_def in self.object_defs.items()])
+
+        self.objects = ObjectStorage()
+
+        # One re-entrant lock per singleton id, handed out lazily by _get_creation_lock.
+        # Keeping a lock per id (rather than one for the whole container) means unrelated
+        # singletons never wait on each other, and nested reference resolution can't
+        # deadlock on a lock that merely happens to be shared.
+        self._creation_locks = {}
+        self._creation_locks_guard = threading.Lock()
+
+        # Creation plans compiled from object definitions, keyed by object id.
+        self._plans = {}
+
+        self._scope_ref = weakref.ref(self)
+
+    def _get_object_defs(self):
+        return self._object_defs
+
+    def _set_object_defs(self, object_defs):
+        if not isinstance(object_defs, ObjectDefinitions):
+            object_defs = ObjectDefinitions(object_defs)
+        self._object_defs = object_defs
+
+    object_defs = property(_get_object_defs, _set_object_defs)
+
+    def _get_dependency_graph(self):
+        """Returns the graph of the current object definitions, building it again if they have changed."""
+        graph, version = self._dependency_graph
+        if version != self.object_defs.version:
+            version = self.object_defs.version
+            graph = self.get_dependency_graph()
+            self._dependency_graph = (graph, version)
+        return graph
+
+    def _set_dependency_graph(self, graph):
+        """Sets the graph of the current object definitions."""
+        self._dependency_graph = (graph, self.object_defs.version)
+
+    dependency_graph = property(_get_dependency_graph, _set_dependency_graph)
+
+    def _read_config(self, configuration):
+        """Returns the object definitions read from a config, timing it if profiling."""
+        start = time.time()
+        object_defs = configuration.read_object_defs()
+        if self.profiler is not None:
+            self.profiler.record_source(configuration, time.time() - start)
+        return object_defs
+
+    def _get_config_signature(self, configuration):
+        if hasattr(configuration, "get_signature"):
+            return configuration.get_signature()
+        return None
 
     def get_object(self, name, ignore_abstract=False):
         """
         This function attempts to find the object in the singleton cache. If not found, 
         delegates to _create_object in order to hunt for the definition, and request a
         object factory to generate one.
+
+        Already stored singletons are returned without taking any lock. The first request
+        for a singleton takes that object's creation lock and checks the storage again, so
+        concurrent first-hit callers get the same single instance.
         """
         try:
             object_def = self.object_defs[name]
@@ -71,46 +163,134 @@ class ObjectContainer(object):
             return self.objects[name]
             
         except KeyError, e:
-            self.logger.debug("Did NOT find object '%s' in the singleton storage." % name)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Did NOT find object '%s' in the singleton storage." % name)
             try:
                 object_def = self.object_defs[name]
                 if object_def.abstract and not ignore_abstract:
                     raise AbstractObjectException("Object [%s] is an abstract one." % name)
+
+                # Fail now rather than recurse without end.
+                if self.dependency_graph.depends_on_cycle(name):
+                    raise CyclicDependencyException(self.dependency_graph.find_cycles([name]))
                 
-                comp = self._create_object(object_def)
-                
+                if object_def.scope == scope.SINGLETON:
+                    return self._get_singleton(name, object_def)
+
                 # Evaluate any scopes, and store appropriately.
-                if self.object_defs[name].scope == scope.SINGLETON:
-                    self.objects[name] = comp
-                    self.logger.debug("Stored object '%s' in container's singleton storage" % name)
-                elif self.object_defs[name].scope == scope.PROTOTYPE:
-                    pass
-                else:
-                    raise InvalidObjectScope("Don't know how to handle scope %s" % self.object_defs[name].scope)
-                
-                return comp
+                if object_def.scope == scope.PROTOTYPE:
+                    return self._create_object(object_def)
+
+                custom_scope = scope.get_scope(object_def.scope)
+                if custom_scope is None:
+                    raise InvalidObjectScope("Don't know how to handle scope %s" % object_def.scope)
+
+                return custom_scope.get(self._get_scope_key(name), lambda: self._create_object(object_def))
             except KeyError, e:
                 self.logger.error("Object '%s' has no definition!" % name)
                 raise e
+
+    def _get_scope_key(self, name):
+        """
+        Returns the key a custom scope keeps this container's object of a given id under. Scopes
+        may keep objects for as long as a thread lives, so the key only weakly refers to the container.
+        """
+        return (self._scope_ref, name)
+
+    def get_reference(self, name):
+        """
+        Returns what a reference to the named object should inject. That's the object itself,
+        unless lazy_proxies is on and the object is a lazy_init singleton which hasn't been
+        created yet, in which case it's a LazyObjectProxy standing in for it.
+        """
+        if self.lazy_proxies and name not in self.objects:
+            object_def = self.object_defs.get(name)
+            if _is_lazy_singleton(object_def) and not object_def.abstract:
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug("Injecting a lazy proxy for '%s'" % name)
+                return LazyObjectProxy(self, name)
+        return self.get_object(name)
+
+    def _get_lazy_target(self, name):
+        """Returns the object a LazyObjectProxy stands in for, creating it on first use."""
+        return self.get_object(name)
+
+    def _get_singleton(self, name, object_def):
+        """
+        Creates and stores a singleton while holding its creation lock. Another thread may
+        have stored it while this one was waiting for the lock, so check again first.
+        """
+        lock = self._get_creation_lock(name)
+        lock.acquire()
+        try:
+            if name in self.objects:
+                return self.objects[name]
+
+            comp = self._create_object(object_def)
+            self.objects[name] = comp
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Stored object '%s' in container's singleton storage" % name)
+            return comp
+        finally:
+            lock.release()
+
+    def _get_creation_lock(self, name):
+        """Returns the creation lock of a given object id, creating it on first use."""
+        try:
+            return self._creation_locks[name]
+        except KeyError:
+            self._creation_locks_guard.acquire()
+            try:
+                if name not in self._creation_locks:
+                    self._creation_locks[name] = threading.RLock()
+                return self._creation_locks[name]
+            finally:
+                self._creation_locks_guard.release()
             
-    def _get_constructors_pos(self, object_def):
+    def get_dependencies(self, object_def):
+        """
+        Returns the set of object ids an object definition refers to, either through ReferenceDef
+        and InnerObjectDef entries or through references nested inside collection values. Objects
+        built by code, like PythonConfig's, may fetch further objects which can't be seen here.
         """
-        This function iterates over the positional constructors, and assembles their values into a list.
-        In this situation, the order as read from the XML should be the order expected by the class
-        definition.
+        dependencies = set()
+        entries = list(object_def.pos_constr) + object_def.named_constr.values() + list(object_def.props)
+        for entry in entries:
+            _scan_dependencies(entry, dependencies)
+        return dependencies
+
+    def get_dependency_graph(self, object_defs=None):
         """
-        return tuple([constr.get_value(self) for constr in object_def.pos_constr
-                      if hasattr(constr, "get_value")])
+        Returns a springpython.container.graph.DependencyGraph of the references between the
+        current, or the given, object definitions. Use its to_dot() to draw it. With lazy_proxies
+        on, references to lazy_init singletons are left out, as resolving them creates nothing.
+        """
+        if object_defs is None:
+            object_defs = self.object_defs
+
+        dependencies = {}
+        for name, object_def in object_defs.items():
+            dependencies[name] = self.get_dependencies(object_def)
+            if self.lazy_proxies:
+                dependencies[name] = set([dependency for dependency in dependencies[name]
+                                          if not _is_lazy_singleton(object_defs.get(dependency))])
+        return DependencyGraph(dependencies)
 
-    def _get_constructors_kw(self, kwargs):
+    def _get_plan(self, object_def):
         """
-        This function iterates over the named constructors, and assembles their values into a list.
-        In this situation, each argument is associated with a name, and due to unicode format provided
-        by the XML parser, requires conversion into a new dictionary.
+        Returns the creation plan compiled for a given object definition. Plans are cached
+        by object id and compiled again whenever that id is bound to a different ObjectDef.
         """
-        return dict([(key, kwargs[key].get_value(self)) for key in kwargs
-                     if hasattr(kwargs[key], "get_value")])
+        try:
+            plan = self._plans[object_def.id]
+            if plan.object_def is object_def:
+                return plan
+        except KeyError:
+            pass
 
+        plan = ObjectCreationPlan(object_def)
+        self._plans[object_def.id] = plan
+        return plan
 
     def _create_object(self, object_def):
         """
@@ -118,22 +298,446 @@ class ObjectContainer(object):
         takes all the steps to read the object's definition, res it up, and store it in the appropriate
         scoped cache.
         """
-        self.logger.debug("Creating an instance of %s" % object_def)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Creating an instance of %s" % object_def)
         
-        [constr.prefetch(self) for constr in object_def.pos_constr if hasattr(constr, "prefetch")]
-        [constr.prefetch(self) for constr in object_def.named_constr.values() if hasattr(constr, "prefetch")]
-        [prop.prefetch(self) for prop in object_def.props if hasattr(prop, "prefetch")]
+        if self.profiler is None:
+            return self._get_plan(object_def).execute(self)
+
+        self.profiler.begin_object()
+        try:
+            return self._get_plan(object_def).execute(self)
+        finally:
+            self.profiler.end_object(object_def.id, startup_profiler.CREATE_OBJECT)
         
+        
+class LazyObjectProxy(object):
+    """
+    Stands in for a lazy_init singleton until it's first used. Fetching, setting or deleting
+    an attribute, calling, comparing, iterating, arithmetic, using it in a with statement, etc.
+    fetches the target from the container (creating and initializing it if need be, see
+    ApplicationContext._get_lazy_target) and forwards to it. The target is remembered, so
+    afterwards the proxy costs one extra attribute lookup per access.
+
+    The proxy is not the target: identity checks and type(proxy) still see the proxy, though
+    isinstance does not, as __class__ is forwarded too.
+    """
+    __slots__ = ["_container", "_name", "_target"]
+
+    def __init__(self, container, name):
+        object.__setattr__(self, "_container", container)
+        object.__setattr__(self, "_name", name)
+
+    def _get_target(self):
+        try:
+            return object.__getattribute__(self, "_target")
+        except AttributeError:
+            target = object.__getattribute__(self, "_container")._get_lazy_target(object.__getattribute__(self, "_name"))
+            object.__setattr__(self, "_target", target)
+            return target
+
+    def __getattribute__(self, name):
+        if name == "_get_target":
+            return object.__getattribute__(self, name)
+        return getattr(object.__getattribute__(self, "_get_target")(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._get_target(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._get_target(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._get_target()(*args, **kwargs)
+
+    def __str__(self):
+        return str(self._get_target())
+
+    def __repr__(self):
+        return repr(self._get_target())
+
+    def __unicode__(self):
+        return unicode(self._get_target())
+
+    def __eq__(self, other):
+        return self._get_target() == other
+
+    def __ne__(self, other):
+        return self._get_target() != other
+
+    def __lt__(self, other):
+        return self._get_target() < other
+
+    def __le__(self, other):
+        return self._get_target() <= other
+
+    def __gt__(self, other):
+        return self._get_target() > other
+
+    def __ge__(self, other):
+        return self._get_target() >= other
+
+    def __hash__(self):
+        return hash(self._get_target())
+
+    def __nonzero__(self):
+        return bool(self._get_target())
+
+    def __len__(self):
+        return len(self._get_target())
+
+    def __iter__(self):
+        return iter(self._get_target())
+
+    def __reversed__(self):
+        return reversed(self._get_target())
+
+    def __contains__(self, item):
+        return item in self._get_target()
+
+    def __getitem__(self, key):
+        return self._get_target()[key]
+
+    def __setitem__(self, key, value):
+        self._get_target()[key] = value
+
+    def __delitem__(self, key):
+        del self._get_target()[key]
+
+    def __getslice__(self, i, j):
+        return self._get_target()[i:j]
+
+    def __enter__(self):
+        return self._get_target().__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._get_target().__exit__(exc_type, exc_value, traceback)
+
+    def __int__(self):
+        return int(self._get_target())
+
+    def __long__(self):
+        return long(self._get_target())
+
+    def __float__(self):
+        return float(self._get_target())
+
+    def __index__(self):
+        return operator.index(self._get_target())
+
+    def __neg__(self):
+        return -self._get_target()
+
+    def __pos__(self):
+        return +self._get_target()
+
+    def __abs__(self):
+        return abs(self._get_target())
+
+    def __invert__(self):
+        return ~self._get_target()
+
+def _forward_operator(operator_func):
+    """Returns a LazyObjectProxy method applying a binary operator to its target and the other operand."""
+    def forward(self, other):
+        return operator_func(self._get_target(), other)
+    return forward
+
+def _forward_reflected_operator(operator_func):
+    """Like _forward_operator, for the reflected method called when the proxy is the right operand."""
+    def forward(self, other):
+        return operator_func(other, self._get_target())
+    return forward
+
+for _name, _operator_func in [("add", operator.add), ("sub", operator.sub), ("mul", operator.mul),
+                              ("div", operator.div), ("truediv", operator.truediv),
+                              ("floordiv", operator.floordiv), ("mod", operator.mod), ("pow", operator.pow),
+                              ("lshift", operator.lshift), ("rshift", operator.rshift),
+                              ("and", operator.and_), ("or", operator.or_), ("xor", operator.xor)]:
+    setattr(LazyObjectProxy, "__%s__" % _name, _forward_operator(_operator_func))
+    setattr(LazyObjectProxy, "__r%s__" % _name, _forward_reflected_operator(_operator_func))
+del _name, _operator_func
+
+class ObjectDefinitions(dict):
+    """
+    The dictionary a container keeps its object definitions in, keyed by object id. Every
+    change gives it a new version, so that the container can tell when its dependency graph
+    is out of date.
+    """
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.version = _versions.next()
+
+    def __setitem__(self, name, object_def):
+        dict.__setitem__(self, name, object_def)
+        self.version = _versions.next()
+
+    def __delitem__(self, name):
+        dict.__delitem__(self, name)
+        self.version = _versions.next()
+
+    def pop(self, name, *default):
+        try:
+            return dict.pop(self, name, *default)
+        finally:
+            self.version = _versions.next()
+
+    def popitem(self):
+        try:
+            return dict.popitem(self)
+        finally:
+            self.version = _versions.next()
+
+    def setdefault(self, name, object_def=None):
+        try:
+            return dict.setdefault(self, name, object_def)
+        finally:
+            self.version = _versions.next()
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self.version = _versions.next()
+
+    def clear(self):
+        dict.clear(self)
+        self.version = _versions.next()
+
+# Versions of ObjectDefinitions are drawn from one counter, so that no two dictionaries ever share one.
+_versions = itertools.count()
+
+class ObjectStorage(dict):
+    """
+    The dictionary a container stores its singletons in, keyed by object id. Every stored
+    object is also indexed under each class of its MRO, so that finding the objects of a
+    given type costs in proportion to the number of matches rather than of stored objects.
+    """
+    def __init__(self):
+        dict.__init__(self)
+        self.type_index = {}
+        self.lock = threading.RLock()
+
+    def __setitem__(self, name, obj):
+        self.lock.acquire()
+        try:
+            if name in self:
+                self._unindex(name, self[name])
+            dict.__setitem__(self, name, obj)
+            for cls in _get_classes(obj):
+                self.type_index.setdefault(cls, set()).add(name)
+        finally:
+            self.lock.release()
+
+    def __delitem__(self, name):
+        self.lock.acquire()
+        try:
+            self._unindex(name, self[name])
+            dict.__delitem__(self, name)
+        finally:
+            self.lock.release()
+
+    def pop(self, name, *default):
+        self.lock.acquire()
+        try:
+            if name not in self and default:
+                return default[0]
+            obj = self[name]
+            del self[name]
+            return obj
+        finally:
+            self.lock.release()
+
+    def popitem(self):
+        self.lock.acquire()
+        try:
+            name, obj = dict.popitem(self)
+            self._unindex(name, obj)
+            return name, obj
+        finally:
+            self.lock.release()
+
+    def setdefault(self, name, obj=None):
+        self.lock.acquire()
+        try:
+            if name not in self:
+                self[name] = obj
+            return self[name]
+        finally:
+            self.lock.release()
+
+    def update(self, *args, **kwargs):
+        for name, obj in dict(*args, **kwargs).items():
+            self[name] = obj
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            dict.clear(self)
+            self.type_index.clear()
+        finally:
+            self.lock.release()
+
+    def get_by_type(self, type_, include_type=True):
+        """
+        Returns a dictionary of the stored objects which are instances of a given type. If
+        include_type is False then only instances of the type's subclasses are returned. Types
+        deciding isinstance on their own (e.g. abstract base classes) and tuples of types are
+        checked against every stored object.
+        """
+        if _is_indexable(type_):
+            self.lock.acquire()
+            try:
+                candidates = [(name, self[name]) for name in self.type_index.get(type_, [])]
+            finally:
+                self.lock.release()
+        else:
+            candidates = [(name, obj) for name, obj in self.items() if isinstance(obj, type_)]
+
+        result = {}
+        for name, obj in candidates:
+            if include_type == False and type(obj) is type_:
+                continue
+            result[name] = obj
+        return result
+
+    def _unindex(self, name, obj):
+        for cls in _get_classes(obj):
+            names = self.type_index.get(cls)
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del self.type_index[cls]
+
+def _get_classes(obj):
+    """Returns every class isinstance would find obj to be an instance of, bar registrations."""
+    classes = set(inspect.getmro(type(obj)))
+    classes.update(inspect.getmro(obj.__class__))
+    classes.add(object)
+    return classes
+
+def _is_indexable(type_):
+    """Tells whether isinstance checks against type_ only look at the class hierarchy."""
+    if isinstance(type_, types.ClassType):
+        return True
+    return isinstance(type_, type) and type(type_).__instancecheck__ is type.__instancecheck__
+
+def _is_lazy_singleton(object_def):
+    return object_def is not None and object_def.lazy_init and object_def.scope == scope.SINGLETON
+
+def get_fingerprint(value):
+    """
+    Returns a hashable summary of an object definition, or of any of its parts, which is
+    equal for two definitions exactly when they would create objects the same way.
+    """
+    if hasattr(value, "factory") and hasattr(value, "props"):
+        return ("object", value.id, str(value.factory), value.scope, value.lazy_init, value.abstract,
+                value.parent, get_fingerprint(value.pos_constr), get_fingerprint(value.named_constr),
+                get_fingerprint(value.props))
+    elif hasattr(value, "ref"):
+        return ("ref", value.name, value.ref)
+    elif hasattr(value, "inner_comp"):
+        return ("inner", value.name, value.inner_comp.id)
+    elif hasattr(value, "get_value") and hasattr(value, "value"):
+        return (value.__class__.__name__, value.name, get_fingerprint(value.value))
+    elif isinstance(value, dict):
+        items = [(get_fingerprint(key), get_fingerprint(item)) for key, item in value.items()]
+        items.sort()
+        return ("dict", tuple(items))
+    elif isinstance(value, (set, frozenset)):
+        items = [get_fingerprint(item) for item in value]
+        items.sort()
+        return (value.__class__.__name__, tuple(items))
+    elif isinstance(value, (list, tuple)):
+        return (value.__class__.__name__, tuple([get_fingerprint(item) for item in value]))
+    else:
+        return (type(value).__name__, repr(value))
+
+def _scan_dependencies(value, dependencies):
+    """Collects the ids referred to by a property definition, a value, or any collection of them."""
+    if hasattr(value, "ref"):
+        dependencies.add(value.ref)
+    elif hasattr(value, "inner_comp"):
+        dependencies.add(value.inner_comp.id)
+    elif hasattr(value, "get_value") and hasattr(value, "value"):
+        _scan_dependencies(value.value, dependencies)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _scan_dependencies(item, dependencies)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            _scan_dependencies(item, dependencies)
+
+class ObjectCreationPlan(object):
+    """
+    A flattened form of an ObjectDef, compiled once and reused for every instance created
+    from that definition. Properties and constructor arguments are checked for their
+    prefetch/get_value/set_value hooks up front, and plain ValueDef constructor arguments,
+    whose value never depends on the container, are resolved at compile time.
+    """
+    def __init__(self, object_def):
+        from springpython.config import ValueDef
+
+        self.object_def = object_def
+        self.factory = object_def.factory
+
+        named_constr = object_def.named_constr.items()
+
+        self.prefetchers = [constr.prefetch for constr in object_def.pos_constr if hasattr(constr, "prefetch")]
+        self.prefetchers.extend([constr.prefetch for key, constr in named_constr if hasattr(constr, "prefetch")])
+        self.prefetchers.extend([prop.prefetch for prop in object_def.props if hasattr(prop, "prefetch")])
+
+        def is_constant(constr):
+            return type(constr) is ValueDef
+
+        # In this situation, the order as read from the XML should be the order expected by the class
+        # definition.
+        pos_constr = [constr for constr in object_def.pos_constr if hasattr(constr, "get_value")]
+        if [constr for constr in pos_constr if not is_constant(constr)]:
+            self.pos_constants = None
+            self.pos_args = []
+            for constr in pos_constr:
+                if is_constant(constr):
+                    self.pos_args.append((True, constr.value))
+                else:
+                    self.pos_args.append((False, constr.get_value))
+        else:
+            self.pos_constants = tuple([constr.value for constr in pos_constr])
+            self.pos_args = []
+
+        named_constr = [(key, constr) for key, constr in named_constr if hasattr(constr, "get_value")]
+        self.kw_constants = dict([(key, constr.value) for key, constr in named_constr if is_constant(constr)])
+        self.kw_args = [(key, constr.get_value) for key, constr in named_constr if not is_constant(constr)]
+
+        self.setters = [prop.set_value for prop in object_def.props if hasattr(prop, "set_value")]
+
+    def execute(self, container):
+        """Creates a new instance, resolving only those values which depend on the container."""
+        for prefetch in self.prefetchers:
+            prefetch(container)
+
+        if self.pos_constants is not None:
+            pos_args = self.pos_constants
+        else:
+            pos_args = []
+            for constant, value in self.pos_args:
+                if constant:
+                    pos_args.append(value)
+                else:
+                    pos_args.append(value(container))
+            pos_args = tuple(pos_args)
+
+        kw_args = self.kw_constants.copy()
+        for key, get_value in self.kw_args:
+            kw_args[key] = get_value(container)
+
         # Res up an instance of the object, with ONLY constructor-based properties set.
-        obj = object_def.factory.create_object(self._get_constructors_pos(object_def),
-                                               self._get_constructors_kw(object_def.named_constr))
+        obj = self.factory.create_object(pos_args, kw_args)
 
         # Fill in the other property values.
-        [prop.set_value(obj, self) for prop in object_def.props if hasattr(prop, "set_value")]
-        
+        for set_value in self.setters:
+            set_value(obj, container)
+
         return obj
-        
-        
+
 class AbstractObjectException(Exception):
     """ Raised when the user's code tries to get an abstract object from
     the container.
@@ -0,0 +1,242 @@
+"""
+   Copyright 2006-2008 SpringSource (http://springsource.com), All Rights Reserved
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+class DependencyGraph(object):
+    """
+    The references between object definitions, as a mapping of each object id to the set
+    of ids it depends on. Ids which are referred to but have no definition of their own are
+    kept as nodes without dependencies.
+
+    Every walk is iterative, so arbitrarily deep chains don't hit Python's recursion limit.
+    """
+    def __init__(self, dependencies):
+        self.dependencies = {}
+        for name, names in dependencies.items():
+            self.dependencies[name] = set(names)
+            for dependency in names:
+                self.dependencies.setdefault(dependency, set())
+
+    def get_dependents(self, name):
+        """Returns the set of ids which depend directly on a given one."""
+        return set([other for other, names in self.dependencies.items() if name in names])
+
+    def find_cycles(self, names=None):
+        """
+        Returns one cycle, as a list of ids starting and ending with the same one, for every
+        group of objects which refer to each other, directly or not. Objects referring to
+        themselves count as cycles too. If ids are given, only the cycles which they are part
+        of or depend on are returned.
+        """
+        if names is not None:
+            reachable = self._get_reachable(names)
+
+        cycles = []
+        for component in self._get_strongly_connected_components():
+            start = min(component)
+            if names is not None and start not in reachable:
+                continue
+            if len(component) > 1 or start in self.dependencies[start]:
+                cycles.append(self._find_cycle_within(start, component))
+        cycles.sort()
+        return cycles
+
+    def depends_on_cycle(self, name):
+        """
+        Tells whether an id is part of a cycle or depends on one, directly or not. The answers
+        for every id are worked out together on the first call, so later calls cost a lookup.
+        """
+        try:
+            return name in self._cyclic
+        except AttributeError:
+            dependents = {}
+            for node, names in self.dependencies.items():
+                for dependency in names:
+                    dependents.setdefault(dependency, set()).add(node)
+
+            cyclic = set()
+            pending = []
+            for cycle in self.find_cycles():
+                pending.extend(cycle)
+            while pending:
+                node = pending.pop()
+                if node not in cyclic:
+                    cyclic.add(node)
+                    pending.extend(dependents.get(node, []))
+            self._cyclic = cyclic
+            return name in self._cyclic
+
+    def get_creation_order(self, names=None):
+        """
+        Returns the given ids, or every id, together with everything they depend on, ordered so
+        that each object comes after its dependencies. Apart from that, the given order is kept.
+        Raises CyclicDependencyException if there's no such order, i.e. if any of the ids is part
+        of a cycle or depends on one.
+        """
+        cycles = self.find_cycles(names)
+        if cycles:
+            raise CyclicDependencyException(cycles)
+
+        if names is None:
+            names = sorted(self.dependencies.keys())
+
+        order = []
+        done = set()
+        for name in names:
+            if name in done:
+                continue
+            done.add(name)
+            stack = [(name, iter(sorted(self.dependencies.get(name, []))))]
+            while stack:
+                current, dependencies = stack[-1]
+                for dependency in dependencies:
+                    if dependency not in done:
+                        done.add(dependency)
+                        stack.append((dependency, iter(sorted(self.dependencies[dependency]))))
+                        break
+                else:
+                    stack.pop()
+                    order.append(current)
+        return order
+
+    def get_levels(self, names):
+        """
+        Groups ids by depth: an object's level is one past the deepest of its dependencies, so
+        objects of the same level don't depend on each other. References closing a cycle are
+        ignored. Returns a list of lists of ids, shallowest level first.
+        """
+        levels = {}
+        for name in names:
+            if name in levels:
+                continue
+            path = set([name])
+            stack = [(name, iter(self.dependencies.get(name, [])))]
+            while stack:
+                current, dependencies = stack[-1]
+                for dependency in dependencies:
+                    if dependency not in levels and dependency not in path:
+                        path.add(dependency)
+                        stack.append((dependency, iter(self.dependencies[dependency])))
+                        break
+                else:
+                    stack.pop()
+                    path.discard(current)
+                    level = 0
+                    for dependency in self.dependencies.get(current, []):
+                        if dependency in levels:
+                            level = max(level, levels[dependency] + 1)
+                    levels[current] = level
+
+        grouped = {}
+        for name in names:
+            grouped.setdefault(levels[name], []).append(name)
+        return [grouped[level] for level in sorted(grouped.keys())]
+
+    def to_dot(self, name="objects"):
+        """Returns the graph in Graphviz DOT format, with an edge from each object to its dependencies."""
+        lines = ["digraph %s {" % _quote(name)]
+        for node in sorted(self.dependencies.keys()):
+            lines.append("    %s;" % _quote(node))
+        for node in sorted(self.dependencies.keys()):
+            for dependency in sorted(self.dependencies[node]):
+                lines.append("    %s -> %s;" % (_quote(node), _quote(dependency)))
+        lines.append("}")
+        return "\n".join(lines)
+
+    def _get_reachable(self, names):
+        """Returns the given ids together with every id they depend on, directly or not."""
+        reachable = set()
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name not in reachable:
+                reachable.add(name)
+                pending.extend(self.dependencies.get(name, []))
+        return reachable
+
+    def _get_strongly_connected_components(self):
+        """Tarjan's algorithm, without recursion."""
+        index = {}
+        lowlink = {}
+        on_stack = set()
+        stack = []
+        components = []
+        counter = 0
+
+        for root in sorted(self.dependencies.keys()):
+            if root in index:
+                continue
+            index[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(sorted(self.dependencies[root])))]
+            while work:
+                node, dependencies = work[-1]
+                for dependency in dependencies:
+                    if dependency not in index:
+                        index[dependency] = lowlink[dependency] = counter
+                        counter += 1
+                        stack.append(dependency)
+                        on_stack.add(dependency)
+                        work.append((dependency, iter(sorted(self.dependencies[dependency]))))
+                        break
+                    elif dependency in on_stack:
+                        lowlink[node] = min(lowlink[node], index[dependency])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+                    if lowlink[node] == index[node]:
+                        component = set()
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.add(member)
+                            if member == node:
+                                break
+                        components.append(component)
+        return components
+
+    def _find_cycle_within(self, start, component):
+        """Returns a shortest path from start back to itself, going only through component."""
+        previous = {}
+        queue = [start]
+        for node in queue:
+            for dependency in sorted(self.dependencies[node]):
+                if dependency == start:
+                    path = [start]
+                    while node != start:
+                        path.append(node)
+                        node = previous[node]
+                    path.append(start)
+                    path.reverse()
+                    return path
+                if dependency in component and dependency not in previous:
+                    previous[dependency] = node
+                    queue.append(dependency)
+
+class CyclicDependencyException(Exception):
+    """ Raised when object definitions refer to each other in a cycle, which
+    would otherwise recurse without end when creating them.
+    """
+    def __init__(self, cycles):
+        Exception.__init__(self, "Object definitions refer to each other in a cycle: %s" %
+                           "; ".join([" -> ".join(cycle) for cycle in cycles]))
+        self.cycles = cycles
+
+def _quote(name):
+    return '"%s"' % str(name).replace("\\", "\\\\").replace('"', '\\"')
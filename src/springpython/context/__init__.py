@@ -14,52 +14,317 @@
    limitations under the License.       
 """
 
+import sys
+import time
+import types
+import Queue
 import atexit
 import logging
+import threading
 from traceback import format_exc
 
-from springpython.container import ObjectContainer
+from springpython.container import ObjectContainer, get_fingerprint
+from springpython.context import scope
+from springpython.context import profiler as startup_profiler
+from springpython.factory import ReflectiveObjectFactory
 
 class ApplicationContext(ObjectContainer):
     """
     ApplicationContext IS a ObjectContainer. It also has the ability to define the lifecycle of
     objects.
+
+    With parallel_startup set, eager singletons that don't depend on each other are created
+    concurrently on up to startup_threads threads. See _fetch_eager_objects_in_parallel.
+
+    With a springpython.context.profiler.StartupProfiler, every startup phase is timed per
+    object, and get_startup_report() returns the results.
+
+    With lazy_proxies set, eager objects referring to lazy_init ones get a LazyObjectProxy
+    injected instead, so the lazy objects aren't created at startup. See ObjectContainer.
     """
-    def __init__(self, config = None):
-        super(ApplicationContext, self).__init__(config)
+    def __init__(self, config = None, parallel_startup = False, startup_threads = 4, profiler = None,
+                 lazy_proxies = False):
+        startup_start = time.time()
+        super(ApplicationContext, self).__init__(config, profiler, lazy_proxies)
         
         atexit.register(self.shutdown_hook)
         
         self.logger = logging.getLogger("springpython.context.ApplicationContext")
         self.classnames_to_avoid = set(["PyroProxyFactory", "ProxyFactoryObject", "Pyro4ProxyFactory", "Pyro4FactoryObject"])
+
+        self.parallel_startup = parallel_startup
+        self.startup_threads = startup_threads
+
+        # Seconds spent eagerly fetching each object, keyed by object id, and in parallel
+        # mode, the waves of object ids which were fetched concurrently.
+        self.startup_times = {}
+        self.startup_waves = []
          
+        # Fail before creating anything if an eager object is part of a cycle or depends on one.
+        eager = [object_def.id for object_def in self.object_defs.values() if self._is_eager(object_def)]
+        creation_order = self.dependency_graph.get_creation_order(eager)
+
         for object_def in self.object_defs.values():
             self._apply(object_def)
             
         for configuration in self.configs:
             self._apply(configuration)
 
-        for object_def in self.object_defs.values():
-            if not object_def.lazy_init and object_def.id not in self.objects:
-                self.logger.debug("Eagerly fetching %s" % object_def.id)
-                self.get_object(object_def.id, ignore_abstract=True)
+        if self.parallel_startup:
+            self._fetch_eager_objects_in_parallel()
+        else:
+            # Dependencies first, so that resolving a reference finds its object already stored.
+            for name in creation_order:
+                object_def = self.object_defs.get(name)
+                if object_def is not None and self._is_eager(object_def) and name not in self.objects:
+                    self.logger.debug("Eagerly fetching %s" % name)
+                    self._fetch_eager_object(name)
+
+        self._initialize_objects()
+
+        if self.profiler is not None:
+            self.profiler.record_phase(startup_profiler.STARTUP, time.time() - startup_start)
 
+    def _initialize_objects(self, names=None):
+        """
+        Runs the ObjectPostProcessors and the after_properties_set/set_app_context callbacks on
+        the named stored objects, or on every stored object.
+        """
         post_processors = [object for object in self.objects.values() if isinstance(object, ObjectPostProcessor)]
 
-        for obj_name, obj in self.objects.iteritems():
-            if not isinstance(obj, ObjectPostProcessor):
+        for obj_name in self._get_stored_names(names):
+            obj = self.objects[obj_name]
+            if not isinstance(obj, ObjectPostProcessor) and post_processors:
+                self._begin_profiling()
                 for post_processor in post_processors:
                     self.objects[obj_name] = post_processor.post_process_before_initialization(obj, obj_name)
+                self._end_profiling(obj_name, startup_profiler.POST_PROCESS_BEFORE_INITIALIZATION)
 
+        for obj_name in self._get_stored_names(names):
+            self._begin_profiling()
+            self._apply(self.objects[obj_name])
+            self._end_profiling(obj_name, startup_profiler.AFTER_PROPERTIES_SET)
 
-        for object in self.objects.values():
-            self._apply(object)
-
-        for obj_name, obj in self.objects.iteritems():
-            if not isinstance(obj, ObjectPostProcessor):
+        for obj_name in self._get_stored_names(names):
+            obj = self.objects[obj_name]
+            if not isinstance(obj, ObjectPostProcessor) and post_processors:
+                self._begin_profiling()
                 for post_processor in post_processors:
                     self.objects[obj_name] = post_processor.post_process_after_initialization(obj, obj_name)
+                self._end_profiling(obj_name, startup_profiler.POST_PROCESS_AFTER_INITIALIZATION)
+
+    def _get_lazy_target(self, name):
+        """
+        Creates the object a LazyObjectProxy stands in for the way startup would have, running
+        the ObjectPostProcessors and the after_properties_set/set_app_context callbacks on it.
+        """
+        lock = self._get_creation_lock(name)
+        lock.acquire()
+        try:
+            if name in self.objects:
+                return self.objects[name]
+            self.get_object(name)
+            self._initialize_objects([name])
+            return self.objects[name]
+        finally:
+            lock.release()
+
+    def _get_stored_names(self, names):
+        if names is None:
+            return self.objects.keys()
+        return [name for name in names if name in self.objects]
+
+    def refresh(self):
+        """
+        Reads again every config whose signature (see Config.get_signature) changed, and compares
+        the resulting object definitions with the current ones. Singletons whose definition was
+        added, removed or changed are disposed of and, unless lazy, created again, together with
+        every singleton which refers to them, directly or not, through ReferenceDef/InnerObjectDef
+        entries. Everything else is left alone. Objects built by code (e.g. PythonConfig) may refer
+        to others in ways which can't be seen, and aren't rebuilt on their account.
+
+        Objects of custom scopes (see springpython.context.scope) are forgotten by their scopes
+        when affected, and created again on their next lookup.
+
+        Returns the sorted ids of the affected objects. Lookups made while a refresh is running
+        may see either version of an affected object. If new eager definitions are part of a cycle
+        of references, or depend on one, CyclicDependencyException is raised and nothing is changed.
+
+        Signatures aren't taken at startup, so the first refresh reads every signed config again,
+        leaving it to the definitions' fingerprints to tell what changed.
+        """
+        if self.config_signatures is None:
+            config_signatures = [None] * len(self.configs)
+        else:
+            config_signatures = list(self.config_signatures)
+        config_object_defs = list(self.config_object_defs)
+        for i, configuration in enumerate(self.configs):
+            signature = self._get_config_signature(configuration)
+            if signature is None or signature == config_signatures[i]:
+                continue
+            if self.config_signatures is not None:
+                self.logger.info("Reading changed configuration %s" % configuration)
+            config_signatures[i] = signature
+            config_object_defs[i] = self._read_config(configuration)
+
+        if config_signatures == self.config_signatures:
+            return []
+
+        object_defs = {}
+        for defs in config_object_defs:
+            for object_def in defs:
+                object_defs[object_def.id] = object_def
+
+        # Reject a cycle among eager objects before anything is touched, leaving the context as it was.
+        dependency_graph = self.get_dependency_graph(object_defs)
+        dependency_graph.get_creation_order([name for name, object_def in object_defs.items() if self._is_eager(object_def)])
+
+        self.config_signatures = config_signatures
+        self.config_object_defs = config_object_defs
+
+        fingerprints = {}
+        for name, object_def in object_defs.items():
+            if self.object_defs.get(name) is object_def:
+                fingerprints[name] = self.object_def_fingerprints[name]
+            else:
+                fingerprints[name] = get_fingerprint(object_def)
+
+        changed = set([name for name in set(fingerprints.keys()) | set(self.object_def_fingerprints.keys())
+                       if fingerprints.get(name) != self.object_def_fingerprints.get(name)])
+
+        dependents = {}
+        for object_def in object_defs.values():
+            for dependency in self.get_dependencies(object_def):
+                dependents.setdefault(dependency, set()).add(object_def.id)
+
+        affected = set()
+        pending = list(changed)
+        while pending:
+            name = pending.pop()
+            if name not in affected:
+                affected.add(name)
+                pending.extend(dependents.get(name, []))
+
+        self.logger.debug("Changed definitions %s affect %s" % (sorted(changed), sorted(affected)))
+
+        new_object_defs = [object_def for name, object_def in object_defs.items() if self.object_defs.get(name) is not object_def]
+
+        # Changed in place rather than cleared and filled again, so that lookups made meanwhile still find
+        # every definition which exists both before and after.
+        for name, object_def in object_defs.items():
+            self.object_defs[name] = object_def
+        for name in self.object_defs.keys():
+            if name not in object_defs:
+                self.object_defs.pop(name, None)
+        self.object_def_fingerprints = fingerprints
+        self.dependency_graph = dependency_graph
+
+        for object_def in new_object_defs:
+            self._apply(object_def)
+
+        for name in affected:
+            if name in self.objects:
+                self._dispose(name, self.objects.pop(name))
+            scope.invalidate(self._get_scope_key(name))
+
+        stored = set(self.objects.keys())
+        for name in dependency_graph.get_creation_order(sorted(affected)):
+            object_def = self.object_defs.get(name)
+            if object_def is not None and self._is_eager(object_def) and name not in self.objects:
+                self.logger.debug("Eagerly fetching %s" % name)
+                self.get_object(name, ignore_abstract=True)
+
+        self._initialize_objects([name for name in self.objects.keys() if name not in stored])
+
+        return sorted(affected)
+
+    def _begin_profiling(self):
+        if self.profiler is not None:
+            self.profiler.begin_object()
+
+    def _end_profiling(self, name, phase):
+        if self.profiler is not None:
+            self.profiler.end_object(name, phase)
+
+    def get_startup_report(self):
+        """Returns the startup profiler's report as a dictionary, or None if startup wasn't profiled."""
+        if self.profiler is None:
+            return None
+        return self.profiler.report()
             
+    def _is_eager(self, object_def):
+        """
+        Tells whether an object is fetched at startup. Objects of scopes other than singleton
+        and prototype are only created when looked up within their scope, e.g. a request.
+        """
+        return not object_def.lazy_init and object_def.scope in (scope.SINGLETON, scope.PROTOTYPE)
+
+    def _fetch_eager_object(self, name):
+        """Fetches an object at startup, recording how long it took, including any objects it pulled in."""
+        start = time.time()
+        self.get_object(name, ignore_abstract=True)
+        self.startup_times[name] = time.time() - start
+
+    def _fetch_eager_objects_in_parallel(self):
+        """
+        Objects built by code (e.g. PythonConfig) may fetch anything and share module-level
+        state, so they are fetched one by one first. The remaining eager objects are grouped
+        into waves by the depth of their ReferenceDef/InnerObjectDef dependencies, and every
+        object in a wave is fetched concurrently once the previous wave is done.
+        """
+        eager = [object_def for object_def in self.object_defs.values() if self._is_eager(object_def)]
+
+        for object_def in eager:
+            if not isinstance(object_def.factory, ReflectiveObjectFactory) and object_def.id not in self.objects:
+                self.logger.debug("Eagerly fetching %s" % object_def.id)
+                self._fetch_eager_object(object_def.id)
+
+        self.startup_waves = self.dependency_graph.get_levels(
+            [object_def.id for object_def in eager if isinstance(object_def.factory, ReflectiveObjectFactory)])
+
+        for wave in self.startup_waves:
+            self.logger.debug("Eagerly fetching %s in parallel" % wave)
+            self._fetch_wave(wave)
+
+    def _fetch_wave(self, wave):
+        """Fetches every object of a wave on a pool of threads, re-raising the first failure."""
+        if len(wave) == 1:
+            self._fetch_eager_object(wave[0])
+            return
+
+        pending = Queue.Queue()
+        for name in wave:
+            pending.put(name)
+        errors = []
+
+        def worker():
+            while True:
+                try:
+                    name = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    self._fetch_eager_object(name)
+                except Exception:
+                    errors.append((name, sys.exc_info()))
+
+        threads = [threading.Thread(target=worker, name="springpython-startup-%s" % i)
+                   for i in range(min(self.startup_threads, len(wave)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            name, (exc_type, exc_value, exc_traceback) = errors[0]
+            self.logger.error("Could not create object '%s' during parallel startup" % name)
+            raise exc_type, exc_value, exc_traceback
+
+    def dump_startup_times(self, level = logging.INFO):
+        """Logs the time spent eagerly fetching each object, slowest first."""
+        for name, elapsed in sorted(self.startup_times.items(), key=lambda item: item[1], reverse=True):
+            self.logger.log(level, "Startup time: %.4fs %s" % (elapsed, name))
+
     def _apply(self, obj):
         if not (obj.__class__.__name__ in self.classnames_to_avoid): 
             if hasattr(obj, "after_properties_set"):
@@ -74,45 +339,72 @@ class ApplicationContext(ObjectContainer):
         If include_type is False then only instances of the type's subclasses
         will be returned.
         """
+        return self.objects.get_by_type(type_, include_type)
+
+    def get_object_defs_by_type(self, type_, include_type=True):
+        """ Returns the definitions of all objects whose declared class is a given
+        type or one of its subclasses, whether or not they were created yet. Objects
+        built by code (e.g. PythonConfig) declare no class and are never returned.
+        If include_type is False then only definitions of subclasses are returned.
+
+        Definitions are grouped by declared class name, so each class is resolved
+        once. Definitions whose class can't be imported are skipped and logged.
+        """
+        object_defs_by_class = {}
+        for name, object_def in self.object_defs.items():
+            if hasattr(object_def.factory, "get_class"):
+                object_defs_by_class.setdefault(object_def.factory.module_and_class, []).append((name, object_def))
+
         result = {}
-        for obj_name, obj in self.objects.iteritems():
-            if isinstance(obj, type_):
-                if include_type == False and type(obj) is type_:
-                    continue
-                result[obj_name] = obj
-                
+        for class_name, object_defs in object_defs_by_class.items():
+            try:
+                cls = object_defs[0][1].factory.get_class()
+            except Exception, e:
+                self.logger.warning("Skipping %s, whose class %s can't be resolved (%s)" %
+                                    (sorted([name for name, object_def in object_defs]), class_name, e))
+                continue
+            if not isinstance(cls, (type, types.ClassType)) or not issubclass(cls, type_):
+                continue
+            if include_type == False and cls is type_:
+                continue
+            result.update(object_defs)
+
         return result
                 
     def shutdown_hook(self):
         self.logger.debug("Invoking the destroy_method on registered objects")
         
         for obj_name, obj in self.objects.iteritems():
-            if isinstance(obj, DisposableObject):
-                try:
-                    if hasattr(obj, "destroy_method"):
-                        destroy_method_name = getattr(obj, "destroy_method")
-                    else:
-                        destroy_method_name = "destroy"
-                        
-                    destroy_method = getattr(obj, destroy_method_name)
-                    
-                except Exception, e:
-                    self.logger.error("Could not destroy object '%s', exception '%s'" % (obj_name, format_exc()))
+            self._dispose(obj_name, obj)
+
+        self.logger.debug("Successfully invoked the destroy_method on registered objects")
+            
+    def _dispose(self, obj_name, obj):
+        """Invokes the destroy_method of a DisposableObject, logging rather than raising any failure."""
+        if isinstance(obj, DisposableObject):
+            try:
+                if hasattr(obj, "destroy_method"):
+                    destroy_method_name = getattr(obj, "destroy_method")
+                else:
+                    destroy_method_name = "destroy"
                     
+                destroy_method = getattr(obj, destroy_method_name)
+                
+            except Exception, e:
+                self.logger.error("Could not destroy object '%s', exception '%s'" % (obj_name, format_exc()))
+                
+            else:
+                if callable(destroy_method):
+                    try:
+                        self.logger.debug("About to destroy object '%s'" % obj_name)
+                        destroy_method()
+                        self.logger.debug("Successfully destroyed object '%s'" % obj_name)
+                    except Exception, e:
+                        self.logger.error("Could not destroy object '%s', exception '%s'" % (obj_name, format_exc()))
                 else:
-                    if callable(destroy_method):
-                        try:
-                            self.logger.debug("About to destroy object '%s'" % obj_name)
-                            destroy_method()
-                            self.logger.debug("Successfully destroyed object '%s'" % obj_name)
-                        except Exception, e:
-                            self.logger.error("Could not destroy object '%s', exception '%s'" % (obj_name, format_exc()))
-                    else:
-                        self.logger.error("Could not destroy object '%s', " \
-                            "the 'destroy_method' attribute it defines is not callable, " \
-                            "its type is '%r', value is '%r'" % (obj_name, type(destroy_method), destroy_method))
-                        
-        self.logger.debug("Successfully invoked the destroy_method on registered objects")
+                    self.logger.error("Could not destroy object '%s', " \
+                        "the 'destroy_method' attribute it defines is not callable, " \
+                        "its type is '%r', value is '%r'" % (obj_name, type(destroy_method), destroy_method))
             
 class InitializingObject(object):
     """This allows definition of a method which is invoked by the container after an object has had all properties set."""
@@ -0,0 +1,135 @@
+"""
+   Copyright 2006-2008 SpringSource (http://springsource.com), All Rights Reserved
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+import copy
+import time
+import logging
+import threading
+
+try:
+    import json
+except ImportError, e:
+    import simplejson as json
+
+READ_OBJECT_DEFS = "read_object_defs"
+CREATE_OBJECT = "create_object"
+AFTER_PROPERTIES_SET = "after_properties_set"
+POST_PROCESS_BEFORE_INITIALIZATION = "post_process_before_initialization"
+POST_PROCESS_AFTER_INITIALIZATION = "post_process_after_initialization"
+STARTUP = "startup"
+
+class StartupProfiler(object):
+    """
+    StartupProfiler records the wall time and number of calls of each startup phase of a
+    container, of each config source it reads, and of each object it creates and initializes.
+    Pass one to an ObjectContainer or ApplicationContext to turn profiling on.
+
+    Object times are kept both inclusive ("elapsed") and exclusive ("self") of any other
+    objects created while creating them, so dependencies aren't counted twice.
+    """
+    def __init__(self):
+        self.logger = logging.getLogger("springpython.context.profiler.StartupProfiler")
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.phases = {}
+        self.sources = {}
+        self.objects = {}
+
+    def record_phase(self, phase, elapsed):
+        """Adds one call of a phase which isn't tied to a single object or source."""
+        self.lock.acquire()
+        try:
+            _add(self.phases, phase, elapsed)
+        finally:
+            self.lock.release()
+
+    def record_source(self, source, elapsed):
+        """Adds the time spent reading object definitions from a config."""
+        self.lock.acquire()
+        try:
+            _add(self.sources, _describe(source), elapsed)
+            _add(self.phases, READ_OBJECT_DEFS, elapsed)
+        finally:
+            self.lock.release()
+
+    def begin_object(self):
+        """Starts timing work on an object. Every call must be matched by end_object."""
+        self._get_stack().append([time.time(), 0.0])
+
+    def end_object(self, name, phase):
+        """Finishes timing the innermost work started by begin_object on this thread."""
+        stack = self._get_stack()
+        start, nested = stack.pop()
+        elapsed = time.time() - start
+        if stack:
+            stack[-1][1] += elapsed
+
+        self.lock.acquire()
+        try:
+            if name not in self.objects:
+                self.objects[name] = {"elapsed": 0.0, "self": 0.0, "phases": {}}
+            entry = self.objects[name]
+            entry["elapsed"] += elapsed
+            entry["self"] += elapsed - nested
+            _add(entry["phases"], phase, elapsed)
+            _add(self.phases, phase, elapsed - nested)
+        finally:
+            self.lock.release()
+
+    def report(self):
+        """Returns a snapshot of everything recorded so far as plain dictionaries."""
+        self.lock.acquire()
+        try:
+            return copy.deepcopy({"phases": self.phases, "sources": self.sources, "objects": self.objects})
+        finally:
+            self.lock.release()
+
+    def to_json(self):
+        return json.dumps(self.report(), sort_keys=True, indent=2)
+
+    def slowest_objects(self, count=10):
+        """Returns up to count (name, entry) pairs, ordered by exclusive time, slowest first."""
+        objects = self.report()["objects"].items()
+        objects.sort(key=lambda item: item[1]["self"], reverse=True)
+        return objects[:count]
+
+    def format_slowest_objects(self, count=10):
+        lines = ["%-40s %10s %10s" % ("object", "self (s)", "total (s)")]
+        for name, entry in self.slowest_objects(count):
+            lines.append("%-40s %10.4f %10.4f" % (name, entry["self"], entry["elapsed"]))
+        return "\n".join(lines)
+
+    def dump_slowest_objects(self, count=10, level=logging.INFO):
+        for line in self.format_slowest_objects(count).split("\n"):
+            self.logger.log(level, line)
+
+    def _get_stack(self):
+        try:
+            return self.local.stack
+        except AttributeError:
+            self.local.stack = []
+            return self.local.stack
+
+def _describe(source):
+    """Names a config after its class and the locations it reads, if it has any."""
+    if hasattr(source, "config_location"):
+        return "%s(%s)" % (source.__class__.__name__, ", ".join([str(location) for location in source.config_location]))
+    return source.__class__.__name__
+
+def _add(table, key, elapsed):
+    if key not in table:
+        table[key] = {"calls": 0, "elapsed": 0.0}
+    table[key]["calls"] += 1
+    table[key]["elapsed"] += elapsed
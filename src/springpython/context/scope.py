@@ -14,8 +14,125 @@
    limitations under the License.       
 """
 
+import weakref
+import threading
+
 PROTOTYPE = "scope.PROTOTYPE"
 SINGLETON = "scope.SINGLETON"
+THREAD = "scope.THREAD"
+REQUEST = "scope.REQUEST"
+
+class Scope(object):
+    """
+    A scope decides how long the objects defined with it live. Singletons and prototypes are
+    handled by the container itself; objects of any other scope are kept by the Scope
+    registered under that scope's name (see register_scope).
+    """
+    def get(self, key, create):
+        """Returns the object stored under key, calling create() to make and store it if there's none."""
+        raise NotImplementedError()
+
+    def remove(self, key):
+        """Forgets the object stored under key, returning it, or None if there was none."""
+        raise NotImplementedError()
+
+    def invalidate(self, key):
+        """Forgets the objects stored under key everywhere, e.g. in every thread, because their definition changed."""
+        self.remove(key)
+
+    def end_request(self):
+        """Called by end_request() at the end of each web request."""
+        pass
+
+class _ThreadObjects(dict):
+    """A thread's objects. Unlike a plain dict, it can be weakly referenced."""
+    pass
+
+class ThreadScope(Scope):
+    """Keeps one instance of each object per thread, for as long as the thread lives."""
+    def __init__(self):
+        self.local = threading.local()
+
+        # Every live thread's objects, so that invalidate() can reach them. Entries go away
+        # together with their threads.
+        self.thread_objects = weakref.WeakValueDictionary()
+        self.lock = threading.Lock()
+
+    def get(self, key, create):
+        objects = self._get_objects()
+        try:
+            return objects[key]
+        except KeyError:
+            obj = create()
+            objects[key] = obj
+            return obj
+
+    def remove(self, key):
+        return self._get_objects().pop(key, None)
+
+    def invalidate(self, key):
+        self.lock.acquire()
+        try:
+            all_objects = self.thread_objects.values()
+        finally:
+            self.lock.release()
+        for objects in all_objects:
+            objects.pop(key, None)
+
+    def clear(self):
+        """Forgets every object of the current thread, returning them as a dictionary."""
+        objects = self._get_objects()
+        objects_copy = dict(objects)
+        objects.clear()
+        return objects_copy
+
+    def _get_objects(self):
+        try:
+            return self.local.objects
+        except AttributeError:
+            objects = _ThreadObjects()
+            self.lock.acquire()
+            try:
+                self.thread_objects[id(objects)] = objects
+            finally:
+                self.lock.release()
+            self.local.objects = objects
+            return objects
+
+class RequestScope(ThreadScope):
+    """
+    Keeps one instance of each object per web request. A WSGI request is served by a single
+    thread, so instances are kept per thread and forgotten when the request ends, which
+    springpython.security.web.FilterChainProxy signals by calling end_request().
+    """
+    def end_request(self):
+        self.clear()
+
+_scopes = {}
+
+def register_scope(name, scope):
+    """
+    Makes objects defined with the given scope name be kept by a Scope instance. The name
+    is what configs use, e.g. scope="conversation" in XML, or @Object("conversation").
+    """
+    _scopes[name] = scope
+
+def get_scope(name):
+    """Returns the Scope registered under a name, or None for singleton, prototype and unknown scopes."""
+    return _scopes.get(name)
+
+def end_request():
+    """Tells every registered scope that the current thread's web request has ended."""
+    for scope in _scopes.values():
+        scope.end_request()
+
+def invalidate(key):
+    """Tells every registered scope to forget the objects stored under key."""
+    for scope in _scopes.values():
+        scope.invalidate(key)
+
+register_scope(THREAD, ThreadScope())
+register_scope(REQUEST, RequestScope())
 
 def convert(scope_str):
     "This function converts the string-version of scope into the internal, enumerated version."
@@ -23,6 +140,12 @@ def convert(scope_str):
         return PROTOTYPE
     elif scope_str == "singleton":
         return SINGLETON
+    elif scope_str == "thread":
+        return THREAD
+    elif scope_str == "request":
+        return REQUEST
+    elif scope_str in _scopes:
+        return scope_str
     else:
-        raise Exception("Can not handle scope %s" % s)
+        raise Exception("Can not handle scope %s" % scope_str)
     
@@ -13,6 +13,7 @@
    See the License for the specific language governing permissions and
    limitations under the License.       
 """
+import array
 import logging
 import types
 from springpython.database import ArgumentMustBeNamed
@@ -21,6 +22,11 @@ from springpython.database import IncorrectResultSizeDataAccessException
 from springpython.database import InvalidArgumentType
 from springpython.database import factory
 
+try:
+    import numpy
+except ImportError, e:
+    numpy = None
+
 class DaoSupport(object):
     """
     Any class that extends this one will be provided with a DatabaseTemplate class
@@ -42,8 +48,9 @@ class DatabaseTemplate(object):
     This class is meant to mimic the Spring framework's JdbcTemplate class.
     Since Python doesn't use JDBC, the name is generalized to "Database"
     """
-    def __init__(self, connection_factory = None):
+    def __init__(self, connection_factory = None, fetch_size = 1000):
         self.connection_factory = connection_factory
+        self.fetch_size = fetch_size
         self.logger = logging.getLogger("springpython.database.core.DatabaseTemplate")
 
     def __del__(self):
@@ -56,9 +63,9 @@ class DatabaseTemplate(object):
         if args and type(args) not in self.connection_factory.acceptable_types:
             raise InvalidArgumentType(type(args), self.connection_factory.acceptable_types)
 
-        sql_statement = self.connection_factory.convert_sql_binding(sql_statement)
+        sql_statement = self.connection_factory.get_statement(sql_statement)
 
-        cursor = self.connection_factory.getConnection().cursor()
+        cursor = self.__open_cursor()
         error = None
         rows_affected = 0
         try:
@@ -79,6 +86,7 @@ class DatabaseTemplate(object):
                 cursor.close()
             except Exception, e:
                 self.logger.debug("execute.close: Trapped %s, and throwing away." % e)
+            self.connection_factory.operation_finished()
             
         if error:
             raise DataAccessException(error)
@@ -117,9 +125,9 @@ class DatabaseTemplate(object):
         if args and type(args) not in self.connection_factory.acceptable_types:
             raise InvalidArgumentType(type(args), self.connection_factory.acceptable_types)
 
-        sql_query = self.connection_factory.convert_sql_binding(sql_query)
+        sql_query = self.connection_factory.get_statement(sql_query)
         
-        cursor = self.connection_factory.getConnection().cursor()
+        cursor = self.__open_cursor()
         error = None
         results = None
         metadata = None
@@ -139,6 +147,7 @@ class DatabaseTemplate(object):
                 cursor.close()
             except Exception, e:
                 self.logger.debug("query_for_list.close: Trapped %s, and throwing away." % e)
+            self.connection_factory.operation_finished()
 
         if error:
             self.logger.debug("query_for_list: I thought about kicking this up the chain => %s" % error)
@@ -146,6 +155,88 @@ class DatabaseTemplate(object):
         # Convert multi-item tuple into list
         return [result for result in results or []], metadata
 
+    def query_iter(self, sql_query, args = None, rowhandler = None, fetch_size = None):
+        """Like query, but returns an iterator which fetches rows fetch_size at a time (the template's fetch_size by
+        default), mapping each row with the RowMapper as it is reached, so the whole result set is never held in
+        memory. The cursor is closed once the iterator is exhausted or its close() is called."""
+        if args and not rowhandler:
+            raise ArgumentMustBeNamed(arg_name="rowhandler")
+
+        cursor, metadata = self.__execute_query(sql_query, args)
+        return RowIterator(cursor, metadata, rowhandler, int(fetch_size or self.fetch_size), self.__close_cursor)
+
+    def query_for_iter(self, sql_query, args = None, fetch_size = None):
+        """Like query_for_list, but returns an iterator over the rows, fetching them fetch_size at a time. The cursor
+        is closed once the iterator is exhausted or its close() is called."""
+        cursor, metadata = self.__execute_query(sql_query, args)
+        return RowIterator(cursor, metadata, None, int(fetch_size or self.fetch_size), self.__close_cursor)
+
+    def query_for_columns(self, sql_query, args = None, fetch_size = None, use_numpy = False):
+        """Execute a query and return its results column by column, as a ColumnResultSet, reading rows fetch_size at
+        a time. Columns holding only ints or only floats are stored in compact array.array('l') or array.array('d')
+        buffers, or NumPy arrays if use_numpy is set; any other column, including one with NULLs, is a list."""
+        if use_numpy and numpy is None:
+            raise ImportError("use_numpy needs NumPy, which isn't installed")
+
+        cursor, metadata = self.__execute_query(sql_query, args)
+        fetch_size = int(fetch_size or self.fetch_size)
+        columns = [None] * len(metadata)
+        row_count = 0
+        try:
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                row_count += len(rows)
+                for i, values in enumerate(zip(*rows)):
+                    columns[i] = _extend_column(columns[i], values)
+        finally:
+            self.__close_cursor(cursor, "query_for_columns")
+
+        for i, column in enumerate(columns):
+            if column is None:
+                columns[i] = []
+            elif use_numpy and isinstance(column, array.array):
+                columns[i] = numpy.frombuffer(column, dtype=numpy.dtype(column.typecode))
+        return ColumnResultSet(metadata, columns, row_count)
+
+    def __execute_query(self, sql_query, args):
+        """Runs a query and returns its open cursor and column metadata. Unlike __query_for_list, errors are raised."""
+        if args and type(args) not in self.connection_factory.acceptable_types:
+            raise InvalidArgumentType(type(args), self.connection_factory.acceptable_types)
+
+        sql_query = self.connection_factory.get_statement(sql_query)
+
+        cursor = self.__open_cursor()
+        try:
+            if args:
+                cursor.execute(sql_query, args)
+            else:
+                cursor.execute(sql_query)
+            metadata = [{"name":row[0], "type_code":row[1], "display_size":row[2], "internal_size":row[3], "precision":row[4], "scale":row[5], "null_ok":row[6]} for row in cursor.description]
+        except Exception, e:
+            self.logger.debug("query_iter.execute: Trapped %s while trying to execute '%s'" % (e, sql_query))
+            self.__close_cursor(cursor, "query_iter")
+            raise DataAccessException(e)
+        return cursor, metadata
+
+    def __open_cursor(self):
+        """Tells the connection factory that an operation is starting, and opens a cursor for it."""
+        self.connection_factory.operation_started()
+        try:
+            return self.connection_factory.getConnection().cursor()
+        except:
+            self.connection_factory.operation_finished()
+            raise
+
+    def __close_cursor(self, cursor, operation):
+        """Closes a cursor and tells the connection factory that the operation is over."""
+        try:
+            cursor.close()
+        except Exception, e:
+            self.logger.debug("%s.close: Trapped %s, and throwing away." % (operation, e))
+        self.connection_factory.operation_finished()
+
     def query_for_int(self, sql_query, args = None):
         """Execute a query that results in an int value, given static SQL. If args is provided, bind the arguments 
         (to avoid SQL injection attacks)."""
@@ -192,8 +283,144 @@ class DatabaseTemplate(object):
         """Issue a single SQL update.  If args is provided, bind the arguments 
         (to avoid SQL injection attacks)."""
         return self.execute(sql_statement, args)
+
+    def batch_update(self, sql_statement, batch_args, batch_size = 1000):
+        """Issue a SQL update once for each tuple of arguments in batch_args, which may be any iterable, handing them
+        to cursor.executemany batch_size at a time on a single cursor. Returns a list of the number of rows affected
+        by each batch. Like update, it runs on the connection factory's current connection, so it takes part in any
+        transaction in progress."""
+        batch_size = int(batch_size)
+        acceptable_types = self.connection_factory.acceptable_types
+        sql_statement = self.connection_factory.get_statement(sql_statement)
+
+        cursor = self.__open_cursor()
+        rows_affected = []
+        try:
+            batch = []
+            for args in batch_args:
+                if type(args) not in acceptable_types:
+                    raise InvalidArgumentType(type(args), acceptable_types)
+                batch.append(args)
+                if len(batch) == batch_size:
+                    rows_affected.append(self.__execute_batch(cursor, sql_statement, batch))
+                    batch = []
+            if batch:
+                rows_affected.append(self.__execute_batch(cursor, sql_statement, batch))
+        finally:
+            self.__close_cursor(cursor, "batch_update")
+
+        return rows_affected
+
+    def __execute_batch(self, cursor, sql_statement, batch):
+        try:
+            cursor.executemany(sql_statement, batch)
+        except Exception, e:
+            self.logger.debug("batch_update.executemany: Trapped %s while trying to execute '%s'" % (e, sql_statement))
+            raise DataAccessException(e)
+        return cursor.rowcount
     
     
+class RowIterator(object):
+    """
+    Iterates over the results of DatabaseTemplate.query_iter and query_for_iter, fetching rows fetch_size at a time
+    and mapping each one with the RowMapper, if there is one, as it is reached. The cursor is closed, and the
+    connection factory told that the query is over, once the rows run out, an error is raised, or close() is called,
+    which also happens when the iterator is garbage collected, whether or not iteration ever started.
+    """
+    def __init__(self, cursor, metadata, rowhandler, fetch_size, close_cursor):
+        self.cursor = cursor
+        self.metadata = metadata
+        self.rowhandler = rowhandler
+        self.fetch_size = fetch_size
+        self.close_cursor = close_cursor
+        self.rows = []
+        self.position = 0
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.cursor is None:
+            raise StopIteration
+        try:
+            if self.position == len(self.rows):
+                self.rows = self.cursor.fetchmany(self.fetch_size)
+                self.position = 0
+                if not self.rows:
+                    raise StopIteration
+            row = self.rows[self.position]
+            self.position += 1
+            if self.rowhandler is None:
+                return row
+            return self.rowhandler.map_row(row, self.metadata)
+        except:
+            self.close()
+            raise
+
+    def close(self):
+        cursor, self.cursor = self.cursor, None
+        self.rows = []
+        if cursor is not None:
+            self.close_cursor(cursor, "query_iter")
+
+    def __del__(self):
+        self.close()
+
+class ColumnResultSet(object):
+    """
+    Query results held column by column, as returned by DatabaseTemplate.query_for_columns. Columns can be looked up
+    by name or position; len() is the number of rows.
+    """
+    def __init__(self, metadata, columns, row_count):
+        self.metadata = metadata
+        self.names = [column["name"] for column in metadata]
+        self.columns = columns
+        self.row_count = row_count
+
+    def __getitem__(self, key):
+        if isinstance(key, basestring):
+            return self.columns[self.names.index(key)]
+        return self.columns[key]
+
+    def __len__(self):
+        return self.row_count
+
+    def as_dict(self):
+        return dict(zip(self.names, self.columns))
+
+    def rows(self):
+        """Iterates over the results row by row again, as tuples."""
+        for i in xrange(self.row_count):
+            yield tuple([column[i] for column in self.columns])
+
+_array_typecodes = {types.IntType: "l", types.LongType: "l", types.FloatType: "d"}
+_array_types = {"l": set([types.IntType, types.LongType]), "d": set([types.FloatType])}
+
+def _extend_column(column, values):
+    """
+    Appends a batch of values to a column, starting it as an array if the first values are all integers or all floats.
+    Drivers such as MySQLdb and pgdb return integer columns as longs, so ints and longs share the "l" typecode.
+    An array column which gets any other value, or an integer too big for a C long, is turned into a list.
+    """
+    if column is None:
+        typecode = _array_typecodes.get(type(values[0]))
+        if typecode is None:
+            return list(values)
+        column = array.array(typecode)
+
+    if isinstance(column, array.array):
+        if set(map(type, values)) <= _array_types[column.typecode]:
+            length = len(column)
+            try:
+                column.extend(values)
+                return column
+            except OverflowError:
+                del column[length:]
+        column = column.tolist()
+
+    column.extend(values)
+    return column
+
 class RowMapper(object):
     """
     This is an interface to handle one row of data.
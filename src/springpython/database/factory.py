@@ -16,12 +16,17 @@
 import logging
 import re
 import sys
+import time
 import types
+import threading
+from springpython.util import CacheRegion
+from springpython.database import PoolExhaustedException
 
 class ConnectionFactory(object):
-    def __init__(self, acceptable_types):
+    def __init__(self, acceptable_types, statement_cache_size = 256):
         self.__db = None
         self.acceptable_types = acceptable_types
+        self.statement_cache = CacheRegion("statements", max_size=statement_cache_size)
 
     """This interface defines an object that is able to make database connections.
     This allows database connections to be defined inside application contexts, and
@@ -51,6 +56,23 @@ class ConnectionFactory(object):
     def in_transaction(self):
         raise NotImplementedError()
 
+    def begin_transaction(self):
+        """Called by ConnectionFactoryTransactionManager when the calling thread starts a transaction."""
+        pass
+
+    def end_transaction(self):
+        """Called by ConnectionFactoryTransactionManager once the calling thread's transaction is committed or
+        rolled back."""
+        pass
+
+    def operation_started(self):
+        """Called by DatabaseTemplate before each operation, which ends with a call to operation_finished()."""
+        pass
+
+    def operation_finished(self):
+        """Called by DatabaseTemplate after each operation. The single connection of this factory is kept."""
+        pass
+
     def count_type(self):
         raise NotImplementedError()
     
@@ -60,6 +82,42 @@ class ConnectionFactory(object):
         to the other."""
         return re.sub(pattern="\?", repl="%s", string=sql_query)
 
+    def get_statement(self, sql_query):
+        """Returns convert_sql_binding(sql_query), remembering it in a cache of the statement_cache_size most recently
+        used statements, keyed by SQL text, so that repeated statements aren't rewritten every time."""
+        statement_cache = self._get_statement_cache()
+        statement = statement_cache.get(sql_query)
+        if statement is None:
+            statement = self.convert_sql_binding(sql_query)
+            statement_cache.put(sql_query, statement)
+        return statement
+
+    def _get_statement_cache(self):
+        """Subclasses which don't call ConnectionFactory.__init__ get a statement cache of the default size here."""
+        try:
+            return self.statement_cache
+        except AttributeError:
+            self.statement_cache = CacheRegion("statements", max_size=256)
+            return self.statement_cache
+
+    def get_statement_cache_size(self):
+        return self._get_statement_cache().max_size
+
+    def set_statement_cache_size(self, size):
+        self._get_statement_cache().max_size = int(size)
+
+    statement_cache_size = property(get_statement_cache_size, set_statement_cache_size)
+
+    def statement_cache_stats(self):
+        """Returns the hits, misses, evictions and size of the statement cache, and its hit rate."""
+        stats = self._get_statement_cache().stats()
+        lookups = stats["hits"] + stats["misses"]
+        if lookups:
+            stats["hit_rate"] = float(stats["hits"]) / lookups
+        else:
+            stats["hit_rate"] = 0.0
+        return stats
+
 class MySQLConnectionFactory(ConnectionFactory):
     def __init__(self, username = None, password = None, hostname = None, db = None):
         ConnectionFactory.__init__(self, [types.TupleType])
@@ -99,20 +157,24 @@ class PgdbConnectionFactory(ConnectionFactory):
         return types.LongType
 
 class Sqlite3ConnectionFactory(ConnectionFactory):
-    def __init__(self, db = None, check_same_thread=True):
+    def __init__(self, db = None, check_same_thread=True, cached_statements=100):
         ConnectionFactory.__init__(self, [types.TupleType])
         self.db = db
         self.check_same_thread = check_same_thread
+        self.cached_statements = cached_statements
         self.using_sqlite3 = True
 
     def connect(self):
-        """The import statement is delayed so the library is loaded ONLY if this factory is really used."""
+        """The import statement is delayed so the library is loaded ONLY if this factory is really used.
+        cached_statements sizes sqlite3's own cache of prepared statements, per connection."""
         try:
             import sqlite3
-            return sqlite3.connect(self.db, check_same_thread=self.check_same_thread)               
+            return sqlite3.connect(self.db, check_same_thread=self.check_same_thread,
+                                   cached_statements=int(self.cached_statements))
         except:
             import sqlite
             self.using_sqlite3 = False
+            self.statement_cache.clear()
             return sqlite.connect(self.db, check_same_thread=self.check_same_thread)
 
     def in_transaction(self):
@@ -162,3 +224,339 @@ class SQLServerConnectionFactory(ConnectionFactory):
     def convert_sql_binding(self, sql_query):
         """SQL Server expects parameters to be passed as question marks."""
         return re.sub(pattern="%s", repl="?", string=sql_query)
+
+class PooledConnectionFactory(ConnectionFactory):
+    """
+    Wraps another connection factory, e.g. a MySQLConnectionFactory, and hands each thread a
+    connection of its own out of a pool of at most max_size connections, instead of sharing one
+    connection between all threads.
+
+    A thread keeps the connection it first got from getConnection() until it commits, rolls back
+    (which ConnectionFactoryTransactionManager does at the end of each transaction) or calls
+    release(), so a transaction always runs on a single connection. Outside a transaction, each
+    DatabaseTemplate operation is committed and its connection given back as soon as it's done,
+    as with auto-commit, so threads which only ever use templates don't hold on to connections.
+    Operations can be nested, e.g. while iterating over query_iter() results, in which case the
+    connection is kept until the outermost one is over.
+    Connections of threads which have died are closed once the pool runs out, making room for
+    new ones. When the pool is exhausted, getConnection() waits up to checkout_timeout seconds
+    for a connection, then raises PoolExhaustedException.
+
+    The pool opens min_size connections on first use, and closes connections which have been idle
+    for more than max_idle_time seconds, down to min_size. If validate_on_borrow is set, idle
+    connections are checked before being handed out, by running validation_query if there is one
+    (e.g. "SELECT 1"), or else by opening a cursor, and are replaced if that fails. stats() returns
+    counts of what the pool has been doing.
+
+    As connections move between threads, sqlite3 connections need check_same_thread=False.
+    """
+    def __init__(self, connection_factory = None, min_size = 1, max_size = 10, checkout_timeout = 30.0,
+                 max_idle_time = 300.0, validate_on_borrow = True, validation_query = None):
+        self.logger = logging.getLogger("springpython.database.factory.PooledConnectionFactory")
+        self.connection_factory = connection_factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.max_idle_time = max_idle_time
+        self.validate_on_borrow = validate_on_borrow
+        self.validation_query = validation_query
+
+        self.condition = threading.Condition()
+        self.local = threading.local()
+        self.idle = []
+        self.checked_out = {}
+        self.retired = set()
+        self.size = 0
+        self.filled = False
+        self.counters = {"created": 0, "closed": 0, "checkouts": 0, "waits": 0, "wait_time": 0.0, "timeouts": 0,
+                         "validation_failures": 0, "idle_evictions": 0, "reclaimed": 0}
+
+    def __setattr__(self, name, value):
+        """Numbers and flags set through XML and YAML configs arrive as strings."""
+        if name in ("min_size", "max_size"):
+            value = int(value)
+        elif name in ("checkout_timeout", "max_idle_time") and value is not None:
+            value = float(value)
+        elif name == "validate_on_borrow" and isinstance(value, basestring):
+            value = value.lower() == "true"
+        self.__dict__[name] = value
+
+    def acceptable_types(self):
+        return self.connection_factory.acceptable_types
+    acceptable_types = property(acceptable_types)
+
+    def connect(self):
+        return self.connection_factory.connect()
+
+    def in_transaction(self):
+        """Whether the calling thread is in a transaction, as told by begin_transaction() and end_transaction()."""
+        return getattr(self.local, "in_transaction", False)
+
+    def count_type(self):
+        return self.connection_factory.count_type()
+
+    def convert_sql_binding(self, sql_query):
+        return self.connection_factory.convert_sql_binding(sql_query)
+
+    def statement_cache(self):
+        """Statements are cached by the wrapped factory, as they depend on its database."""
+        return self.connection_factory._get_statement_cache()
+    statement_cache = property(statement_cache)
+
+    def getConnection(self):
+        """Returns the connection checked out by the calling thread, checking one out if need be."""
+        thread = threading.currentThread()
+        try:
+            return self.checked_out[thread]
+        except KeyError:
+            pass
+
+        if not self.filled:
+            self._fill()
+
+        while True:
+            connection = self._borrow()
+            if connection is None:
+                try:
+                    connection = self.connect()
+                except:
+                    self._discard(None)
+                    raise
+                self._count("created")
+            elif not self._validate(connection):
+                self._count("validation_failures")
+                self._discard(connection)
+                continue
+
+            self.condition.acquire()
+            try:
+                self.checked_out[thread] = connection
+                self.counters["checkouts"] += 1
+            finally:
+                self.condition.release()
+            return connection
+
+    def release(self):
+        """Gives the calling thread's connection, if it has one, back to the pool."""
+        evicted = []
+        self.condition.acquire()
+        try:
+            connection = self.checked_out.pop(threading.currentThread(), None)
+            if connection is None:
+                return
+            if id(connection) in self.retired:
+                self.retired.discard(id(connection))
+                self.size -= 1
+                evicted.append(connection)
+            else:
+                self.idle.append((connection, time.time()))
+                evicted.extend(self._evict_idle())
+            self.condition.notify()
+        finally:
+            self.condition.release()
+        self._close_all(evicted)
+
+    def commit(self):
+        """Commits the calling thread's connection, and gives it back to the pool unless one of the thread's
+        operations is still going on."""
+        connection = self.checked_out.get(threading.currentThread())
+        if connection is not None:
+            try:
+                connection.commit()
+            finally:
+                if not self._operation_depth():
+                    self.release()
+
+    def rollback(self):
+        """Rolls back the calling thread's connection, and gives it back to the pool unless one of the thread's
+        operations is still going on."""
+        connection = self.checked_out.get(threading.currentThread())
+        if connection is not None:
+            try:
+                connection.rollback()
+            finally:
+                if not self._operation_depth():
+                    self.release()
+
+    def begin_transaction(self):
+        self.local.in_transaction = True
+
+    def end_transaction(self):
+        self.local.in_transaction = False
+
+    def operation_started(self):
+        self.local.depth = self._operation_depth() + 1
+
+    def operation_finished(self):
+        """Once the calling thread's outermost operation is over, outside a transaction, commits its connection and
+        gives it back to the pool. An iterator returned by query_iter() is an operation until it's exhausted or
+        closed."""
+        self.local.depth = max(self._operation_depth() - 1, 0)
+        if not self.local.depth and not self.in_transaction():
+            self.commit()
+
+    def _operation_depth(self):
+        return getattr(self.local, "depth", 0)
+
+    def close(self):
+        """Rolls back the calling thread's connection and gives it back to the pool, which stays open, unless the thread
+        is in the middle of a transaction or of an operation, whose connection is left alone. DatabaseTemplates call
+        this when they are garbage collected. Use shutdown() to close all connections."""
+        if not self.in_transaction() and not self._operation_depth():
+            self.rollback()
+
+    def shutdown(self):
+        """Closes all idle connections, and the checked out ones as they are given back. The pool opens new
+        connections if it is used again."""
+        self.condition.acquire()
+        try:
+            connections = [connection for connection, last_used in self.idle]
+            self.idle = []
+            self.size -= len(connections)
+            self.retired.update([id(connection) for connection in self.checked_out.values()])
+            self.filled = False
+            self.condition.notifyAll()
+        finally:
+            self.condition.release()
+        self._close_all(connections)
+
+    def stats(self):
+        self.condition.acquire()
+        try:
+            stats = dict(self.counters)
+            stats.update({"size": self.size, "idle": len(self.idle), "checked_out": len(self.checked_out),
+                          "max_size": self.max_size})
+            return stats
+        finally:
+            self.condition.release()
+
+    def _fill(self):
+        """Opens connections until the pool has min_size of them."""
+        while True:
+            self.condition.acquire()
+            try:
+                self.filled = True
+                if self.size >= self.min_size:
+                    return
+                self.size += 1
+            finally:
+                self.condition.release()
+
+            try:
+                connection = self.connect()
+            except:
+                self._discard(None)
+                raise
+            self.condition.acquire()
+            try:
+                self.counters["created"] += 1
+                self.idle.append((connection, time.time()))
+                self.condition.notify()
+            finally:
+                self.condition.release()
+
+    def _borrow(self):
+        """
+        Takes the most recently used idle connection, or returns None after reserving room for a
+        new one, waiting for either if the pool is exhausted.
+        """
+        start = None
+        evicted = []
+        self.condition.acquire()
+        try:
+            while True:
+                evicted.extend(self._evict_idle())
+                if self.idle:
+                    return self.idle.pop()[0]
+                if self.size < self.max_size:
+                    self.size += 1
+                    return None
+                reclaimed = self._reclaim()
+                if reclaimed:
+                    evicted.extend(reclaimed)
+                    continue
+
+                now = time.time()
+                if start is None:
+                    start = now
+                    self.counters["waits"] += 1
+                if self.checkout_timeout is None:
+                    self.condition.wait()
+                elif now - start < self.checkout_timeout:
+                    self.condition.wait(start + self.checkout_timeout - now)
+                else:
+                    self.counters["timeouts"] += 1
+                    raise PoolExhaustedException("All %s connections are in use, and none was given back within %s seconds"
+                                                 % (self.max_size, self.checkout_timeout))
+        finally:
+            if start is not None:
+                self.counters["wait_time"] += time.time() - start
+            self.condition.release()
+            self._close_all(evicted)
+
+    def _reclaim(self):
+        """
+        Takes back, and returns for closing, the connections of threads which have died without
+        releasing them, as they may be in the middle of a transaction. Call with the lock held.
+        """
+        reclaimed = []
+        for thread in [thread for thread in self.checked_out if not thread.isAlive()]:
+            self.logger.warning("Reclaiming the connection of %s, which died without releasing it" % thread.getName())
+            reclaimed.append(self.checked_out.pop(thread))
+            self.size -= 1
+            self.counters["reclaimed"] += 1
+        return reclaimed
+
+    def _evict_idle(self):
+        """Removes, and returns, the connections idle for too long, oldest first. Call with the lock held."""
+        evicted = []
+        if self.max_idle_time is None:
+            return evicted
+        oldest_allowed = time.time() - self.max_idle_time
+        while self.idle and self.size > self.min_size and self.idle[0][1] < oldest_allowed:
+            evicted.append(self.idle.pop(0)[0])
+            self.size -= 1
+            self.counters["idle_evictions"] += 1
+        return evicted
+
+    def _validate(self, connection):
+        if not self.validate_on_borrow:
+            return True
+        try:
+            cursor = connection.cursor()
+            try:
+                if self.validation_query is not None:
+                    cursor.execute(self.validation_query)
+                    cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception, e:
+            self.logger.debug("Connection %s failed validation: %s" % (connection, e))
+            return False
+
+    def _discard(self, connection):
+        """Gives up a reserved or broken connection, making room for another one."""
+        self.condition.acquire()
+        try:
+            self.size -= 1
+            self.condition.notify()
+        finally:
+            self.condition.release()
+        if connection is not None:
+            self._close_all([connection])
+
+    def _close_all(self, connections):
+        for connection in connections:
+            try:
+                connection.close()
+                self._count("closed")
+            except Exception, e:
+                self.logger.debug("Trapped %s while closing %s, and throwing away." % (e, connection))
+
+    def _count(self, counter):
+        self.condition.acquire()
+        try:
+            self.counters[counter] += 1
+        finally:
+            self.condition.release()
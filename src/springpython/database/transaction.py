@@ -17,6 +17,7 @@ import inspect
 import logging
 import re
 import types
+import threading
 from springpython.aop import MethodInterceptor
 from springpython.aop import ProxyFactoryObject
 from springpython.context import ObjectPostProcessor
@@ -57,8 +58,22 @@ class ConnectionFactoryTransactionManager(PlatformTransactionManager):
     def __init__(self, connection_factory):
         self.connection_factory = connection_factory
         self.logger = logging.getLogger("springpython.database.transaction.ConnectionFactoryTransactionManager")
+        self.local = threading.local()
         self.status = []
 
+    def _get_status(self):
+        """Each thread has transactions of its own, e.g. on the connections a PooledConnectionFactory hands out."""
+        try:
+            return self.local.status
+        except AttributeError:
+            self.local.status = []
+            return self.local.status
+
+    def _set_status(self, status):
+        self.local.status = status
+
+    status = property(_get_status, _set_status)
+
     def getTransaction(self, definition):
         """According to PEP 249, commits and rollbacks silently start new transactions. Until a more
         robust transaction manager is implemented to handle save points and so forth, this must suffice."""
@@ -92,6 +107,7 @@ class ConnectionFactoryTransactionManager(PlatformTransactionManager):
             self.logger.debug("START TRANSACTION")
             self.logger.debug("Creating a transaction, propagation = %s, isolation = %s, timeout = %s, read_only = %s" % (definition.propagation, definition.isolation, definition.timeout, definition.read_only))
             self.connection_factory.commit()
+            self.connection_factory.begin_transaction()
 
         return self.status
 
@@ -101,7 +117,10 @@ class ConnectionFactoryTransactionManager(PlatformTransactionManager):
             self.status.pop()
             if len(self.status) == 0:
                 self.logger.debug("Commit the changes")
-                self.connection_factory.commit()
+                try:
+                    self.connection_factory.commit()
+                finally:
+                    self.connection_factory.end_transaction()
                 self.logger.debug("END TRANSACTION")
         except IndexError:
             pass
@@ -112,7 +131,10 @@ class ConnectionFactoryTransactionManager(PlatformTransactionManager):
             self.status.pop()
             if len(self.status) == 0:
                 self.logger.debug("Rolling back the transaction.")
-                self.connection_factory.rollback()
+                try:
+                    self.connection_factory.rollback()
+                finally:
+                    self.connection_factory.end_transaction()
                 self.logger.debug("END TRANSACTION")
         except IndexError:
             pass
@@ -28,20 +28,37 @@ class ReflectiveObjectFactory(ObjectFactory):
 
     def create_object(self, constr, named_constr):
         self.logger.debug("Creating an instance of %s" % self.module_and_class)
-        parts = self.module_and_class.split(".")
-        module_name = ".".join(parts[:-1])
-        class_name = parts[-1]
-        if module_name == "":
-            return __import__(class_name)(*constr, **named_constr)
-        else:
-            __import__(module_name)
-            cls = getattr(sys.modules[module_name], class_name)
-            return cls(*constr, **named_constr)
+        return self.get_class()(*constr, **named_constr)
+
+    def get_class(self):
+        """Imports and returns the class this factory instantiates, resolving it only once."""
+        try:
+            return self._cls
+        except AttributeError:
+            parts = self.module_and_class.split(".")
+            module_name = ".".join(parts[:-1])
+            class_name = parts[-1]
+            if module_name == "":
+                self._cls = __import__(class_name)
+            else:
+                __import__(module_name)
+                self._cls = getattr(sys.modules[module_name], class_name)
+            return self._cls
 
 
     def __str__(self):
         return "ReflectiveObjectFactory(%s)" % self.module_and_class
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["logger"] = self.logger.name
+        state.pop("_cls", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.logger = logging.getLogger(state["logger"])
+
 class PythonObjectFactory(ObjectFactory):
     def __init__(self, method, wrapper):
         self.logger = logging.getLogger("springpython.factory.PythonObjectFactory")
@@ -19,6 +19,7 @@ import re
 import pickle
 import types
 from springpython.context import ApplicationContextAware
+from springpython.context import scope
 from springpython.aop import utils
 from springpython.security import AccessDeniedException
 from springpython.security import AuthenticationException
@@ -109,7 +110,37 @@ class FilterChainProxy(Filter, ApplicationContextAware):
         if self.application:
             filterChain.addFilter(self.application)
         environ["SPRINGPYTHON_FILTER_CHAIN"] = filterChain.getFilterChain()
-        return self.doNextFilter(environ, start_response)
+
+        # Request scoped objects only live as long as the request does, which for a lazily
+        # produced body means until the server closes it.
+        try:
+            results = self.doNextFilter(environ, start_response)
+        except:
+            scope.end_request()
+            raise
+        if results is None or isinstance(results, (list, tuple, basestring)):
+            scope.end_request()
+            return results
+        return RequestScopedBody(results)
+
+class RequestScopedBody(object):
+    """
+    Wraps a WSGI response body which is produced while being iterated over, so that the
+    request scope only ends when the server calls close() on it, as PEP 333 requires
+    servers to do.
+    """
+    def __init__(self, body):
+        self.body = body
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def close(self):
+        try:
+            if hasattr(self.body, "close"):
+                self.body.close()
+        finally:
+            scope.end_request()
 
 class SessionStrategy(object):
     """
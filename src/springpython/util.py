@@ -13,7 +13,9 @@
    See the License for the specific language governing permissions and
    limitations under the License.
 """
+import time
 import logging
+import threading
 import traceback
 from threading import RLock, currentThread
 
@@ -49,3 +51,128 @@ class synchronized(object):
                 self.lock.release()
                 self.logger.log(TRACE1, "Released lock [%s] thread [%s]" % (self.lock, currentThread()))
         return lockedfunc
+
+class CacheRegion(object):
+    """
+    A thread-safe cache which keeps at most max_size entries, evicting the least recently used
+    one first, and, if ttl is set, forgets entries ttl seconds after they were stored. It also
+    counts its hits, misses, evictions and expirations. A ttl must be positive; leave it as None
+    to keep entries until they are evicted.
+    """
+    def __init__(self, name, ttl=None, max_size=1000):
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl of cache region %s must be positive, or None to never expire, not %r" % (name, ttl))
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = {}
+
+        # A circular, doubly-linked list of [previous, next, key, value, expires] links, most
+        # recently used first, with a sentinel link as its head.
+        self.head = []
+        self.head[:] = [self.head, self.head, None, None, None]
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """Returns the value stored under key, or default if there is none or it has expired."""
+        self.lock.acquire()
+        try:
+            link = self.entries.get(key)
+            if link is None:
+                self.misses += 1
+                return default
+            if link[4] is not None and link[4] <= time.time():
+                self._unlink(link)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._move_to_front(link)
+            self.hits += 1
+            return link[3]
+        finally:
+            self.lock.release()
+
+    def put(self, key, value):
+        if self.ttl is not None:
+            expires = time.time() + self.ttl
+        else:
+            expires = None
+
+        self.lock.acquire()
+        try:
+            link = self.entries.get(key)
+            if link is not None:
+                link[3] = value
+                link[4] = expires
+                self._move_to_front(link)
+                return
+
+            link = [self.head, self.head[1], key, value, expires]
+            self.head[1][0] = link
+            self.head[1] = link
+            self.entries[key] = link
+
+            while self.max_size and len(self.entries) > self.max_size:
+                self._unlink(self.head[0])
+                self.evictions += 1
+        finally:
+            self.lock.release()
+
+    def evict(self, key):
+        """Forgets the entry stored under key, if any."""
+        self.lock.acquire()
+        try:
+            link = self.entries.get(key)
+            if link is not None:
+                self._unlink(link)
+        finally:
+            self.lock.release()
+
+    def evict_where(self, predicate):
+        """Forgets every entry whose key predicate(key) is true for. This looks at every entry."""
+        self.lock.acquire()
+        try:
+            for key, link in self.entries.items():
+                if predicate(key):
+                    self._unlink(link)
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.entries.clear()
+            self.head[:] = [self.head, self.head, None, None, None]
+        finally:
+            self.lock.release()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        self.lock.acquire()
+        try:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "expirations": self.expirations, "size": len(self.entries)}
+        finally:
+            self.lock.release()
+
+    def _move_to_front(self, link):
+        previous, next = link[0], link[1]
+        previous[1] = next
+        next[0] = previous
+        link[0] = self.head
+        link[1] = self.head[1]
+        self.head[1][0] = link
+        self.head[1] = link
+
+    def _unlink(self, link):
+        previous, next = link[0], link[1]
+        previous[1] = next
+        next[0] = previous
+        del self.entries[link[2]]
@@ -4,6 +4,10 @@ from springpythontest.databaseCoreTestCases import MySQLDatabaseTemplateTestCase
 from springpythontest.databaseCoreTestCases import PostGreSQLDatabaseTemplateTestCase
 from springpythontest.databaseCoreTestCases import SqliteDatabaseTemplateTestCase
 from springpythontest.databaseCoreTestCases import DatabaseTemplateMockTestCase
+from springpythontest.databaseCoreTestCases import PooledConnectionFactoryTestCase
+from springpythontest.databaseCoreTestCases import QueryIterTestCase
+from springpythontest.databaseCoreTestCases import StatementCacheTestCase
+from springpythontest.databaseCoreTestCases import ColumnResultSetTestCase
 from springpythontest.databaseTransactionTestCases import MySQLTransactionTestCase
 from springpythontest.databaseTransactionTestCases import PostGreSQLTransactionTestCase
 from springpythontest.databaseTransactionTestCases import SqliteTransactionTestCase
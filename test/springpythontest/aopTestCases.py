@@ -13,18 +13,34 @@
    See the License for the specific language governing permissions and
    limitations under the License.
 """
+import os
+import time
 import logging
 import unittest
+import threading
+from springpython.aop import AsyncExecutionInterceptor
+from springpython.aop import AsyncMethodInterceptor
+from springpython.aop import BulkheadInterceptor, BulkheadFullException
+from springpython.aop import CachingInterceptor
+from springpython.aop import CircuitBreakerInterceptor, CircuitOpenException
+from springpython.aop import ClassProxyFactory
+from springpython.aop import CoalescingInterceptor
 from springpython.aop import MethodInterceptor
 from springpython.aop import MethodMatcher
+from springpython.aop import PerformanceMetricsInterceptor
 from springpython.aop import Pointcut
+from springpython.aop import metrics
 from springpython.aop import ProxyFactory
 from springpython.aop import ProxyFactoryObject
 from springpython.aop import RegexpMethodPointcutAdvisor
-from springpython.config import XMLConfig
+from springpython.aop.future import Future, ProcessPoolExecutor, TimeoutError
+from springpython.util import CacheRegion
+from springpython.config import PythonConfig, Object
+from springpython.config import XMLConfig, YamlConfig
 from springpython.context import ApplicationContext
 from springpython.remoting.pyro import PyroDaemonHolder
 from springpythontest.support.testSupportClasses import BeforeAndAfterInterceptor
+from springpythontest.support.testSupportClasses import CountingRepository, SlowUserRepository, Rendezvous
 from springpythontest.support.testSupportClasses import SampleService, NewStyleSampleService
 from springpythontest.support.testSupportClasses import WrappingInterceptor
 
@@ -241,6 +257,674 @@ class AopProxiedArgumentsTest(unittest.TestCase):
         self.assertEquals("You made it! => <Wrapped>Alright!</Wrapped>",
                           service.method(data=service.doSomething()))
 
+class CompiledDispatchTestCase(unittest.TestCase):
+    def testDispatchersAreCompiledOncePerMethod(self):
+        service = ProxyFactory(target = SampleService(), interceptors = WrappingInterceptor()).getProxy()
+        self.assertTrue(service.doSomething is service.doSomething)
+        self.assertFalse(service.doSomething is service.method)
+        self.assertEquals("<Wrapped>Alright!</Wrapped>", service.doSomething())
+        self.assertEquals("<Wrapped>Alright!</Wrapped>", service.doSomething())
+
+    def testChangingInterceptorsOrTargetIsSeenImmediately(self):
+        service = ProxyFactoryObject(target = SampleService(), interceptors = WrappingInterceptor())
+        self.assertEquals("<Wrapped>Alright!</Wrapped>", service.doSomething())
+
+        service.interceptors = [WrappingInterceptor(), BeforeAndAfterInterceptor()]
+        self.assertEquals("<Wrapped>BEFORE => Alright! <= AFTER</Wrapped>", service.doSomething())
+
+        service.target = NewStyleSampleService()
+        self.assertEquals("<Wrapped>BEFORE => Even better! <= AFTER</Wrapped>", service.doSomething())
+
+        doSomething = service.doSomething
+        service.interceptors.pop()
+        self.assertEquals("<Wrapped>Even better!</Wrapped>", service.doSomething())
+        service.interceptors.append(BeforeAndAfterInterceptor())
+        self.assertEquals("<Wrapped>BEFORE => Even better! <= AFTER</Wrapped>", doSomething())
+
+    def testInterceptorChainsAreCompiledOnce(self):
+        class ChainRecorder(MethodInterceptor):
+            def __init__(self):
+                self.chains = []
+            def invoke(self, invocation):
+                self.chains.append(invocation.chain)
+                return invocation.proceed()
+
+        recorder = ChainRecorder()
+        for service in [ProxyFactory(target = SampleService(), interceptors = recorder).getProxy(),
+                        ClassProxyFactory(target = SampleService(), interceptors = recorder).getProxy()]:
+            recorder.chains = []
+            service.doSomething()
+            service.doSomething()
+            self.assertTrue(isinstance(recorder.chains[0], tuple))
+            self.assertTrue(recorder.chains[0] is recorder.chains[1])
+            self.assertEquals(2, len(recorder.chains[0]))
+
+        service = ProxyFactoryObject(target = SampleService(), interceptors = recorder)
+        recorder.chains = []
+        service.doSomething()
+        service.interceptors = [recorder, WrappingInterceptor()]
+        service.doSomething()
+        service.doSomething()
+        self.assertFalse(recorder.chains[0] is recorder.chains[1])
+        self.assertTrue(recorder.chains[1] is recorder.chains[2])
+        self.assertEquals(3, len(recorder.chains[1]))
+
+    def testAdvisorsStillInsertTheirAdvice(self):
+        pointcutAdvisor = RegexpMethodPointcutAdvisor(advice = [WrappingInterceptor(), BeforeAndAfterInterceptor()],
+                                                      patterns = ["SampleService.method"])
+        service = ProxyFactory(target = SampleService(), interceptors = pointcutAdvisor).getProxy()
+        for i in range(2):
+            self.assertEquals("<Wrapped>BEFORE => You made it! => test <= AFTER</Wrapped>", service.method("test"))
+            self.assertEquals("Alright!", service.doSomething())
+
+class PointcutMatchCacheTestCase(unittest.TestCase):
+    def testMatchesAreCachedPerClassAndMethod(self):
+        advisor = RegexpMethodPointcutAdvisor(advice = WrappingInterceptor(),
+                                              patterns = ["SampleService.method", ".*Style.*doSomething"])
+        self.assertTrue(advisor.combined_pattern is not None)
+
+        self.assertTrue(advisor.matches_method_and_target("method", "SampleService", ()))
+        self.assertFalse(advisor.matches_method_and_target("doSomething", "SampleService", ()))
+        self.assertTrue(advisor.matches_method_and_target("doSomething", "NewStyleSampleService", ()))
+        self.assertEquals({("method", "SampleService"): True, ("doSomething", "SampleService"): False,
+                           ("doSomething", "NewStyleSampleService"): True},
+                          dict([((method, cls), matched) for (cls, method), matched in advisor.match_cache.items()]))
+
+    def testAssigningPatternsInvalidatesTheCache(self):
+        advisor = RegexpMethodPointcutAdvisor(advice = WrappingInterceptor(), patterns = ["SampleService.method"])
+        service = ProxyFactory(target = SampleService(), interceptors = advisor).getProxy()
+        self.assertEquals("Alright!", service.doSomething())
+
+        advisor.patterns = ["SampleService.doSomething"]
+        self.assertEquals("<Wrapped>Alright!</Wrapped>", service.doSomething())
+        self.assertEquals("You made it! => test", service.method("test"))
+
+    def testCacheIsBounded(self):
+        advisor = RegexpMethodPointcutAdvisor(advice = WrappingInterceptor(), patterns = ["SampleService.method"])
+        advisor.match_cache_size = 10
+        for i in range(25):
+            advisor.matches_method_and_target("method%d" % i, "SampleService", ())
+        self.assertTrue(len(advisor.match_cache) <= 10)
+
+    def testPatternsWithBackreferencesAreMatchedOneByOne(self):
+        advisor = RegexpMethodPointcutAdvisor(advice = WrappingInterceptor(),
+                                              patterns = [r"(Sample)Service.\1", "(?i)samplEservice.DOSOMETHING"])
+        self.assertTrue(advisor.combined_pattern is None)
+        self.assertTrue(advisor.matches_method_and_target("Sample", "SampleService", ()))
+        self.assertTrue(advisor.matches_method_and_target("doSomething", "SampleService", ()))
+        self.assertFalse(advisor.matches_method_and_target("method", "SampleService", ()))
+
+class ClassProxyTestCase(unittest.TestCase):
+    def testClassicTarget(self):
+        target = SampleService()
+        service = ClassProxyFactory(target = target, interceptors = WrappingInterceptor()).getProxy()
+
+        self.assertTrue(isinstance(service, SampleService))
+        self.assertEquals("<Wrapped>Alright!</Wrapped>", service.doSomething())
+        self.assertEquals("<Wrapped>You made it! => test</Wrapped>", service.method(data="test"))
+        self.assertEquals("sample", service.attribute)
+        self.assertEquals("This is a sample service.", str(service))
+
+        service.attribute = "changed"
+        self.assertEquals("changed", target.attribute)
+
+    def testNewStyleTargetSharesAttributes(self):
+        target = NewStyleSampleService()
+        service = ClassProxyFactory(target = target, interceptors = [WrappingInterceptor(), BeforeAndAfterInterceptor()]).getProxy()
+
+        self.assertTrue(isinstance(service, NewStyleSampleService))
+        self.assertTrue("doSomething" in service.__class__.__dict__)
+        self.assertEquals("<Wrapped>BEFORE => Even better! <= AFTER</Wrapped>", service.doSomething())
+        self.assertEquals("new_sample", service.attribute)
+
+        service.attribute = "changed"
+        self.assertEquals("changed", target.attribute)
+        target.other = 1
+        self.assertEquals(1, service.other)
+
+    def testSlotsTarget(self):
+        class Point(object):
+            __slots__ = ["x"]
+            def get_x(self):
+                return self.x
+
+        target = Point()
+        target.x = 1
+        service = ClassProxyFactory(target = target, interceptors = BeforeAndAfterInterceptor()).getProxy()
+        service.x = "2"
+        self.assertEquals("2", target.x)
+        self.assertEquals("BEFORE => 2 <= AFTER", service.get_x())
+
+    def testInstanceAttributeCallablesAreNotAdvised(self):
+        target = NewStyleSampleService()
+        target.doSomething = lambda: "Replaced!"
+        target.extra = lambda: "Extra!"
+
+        service = ClassProxyFactory(target = target, interceptors = WrappingInterceptor()).getProxy()
+        self.assertEquals("Replaced!", service.doSomething())
+        self.assertEquals("Extra!", service.extra())
+
+        # ProxyFactory advises every callable it finds on the target.
+        service = ProxyFactory(target = target, interceptors = WrappingInterceptor()).getProxy()
+        self.assertEquals("<Wrapped>Replaced!</Wrapped>", service.doSomething())
+        self.assertEquals("<Wrapped>Extra!</Wrapped>", service.extra())
+
+    def testProxyClassesAreCachedAndAdvisorsStillApply(self):
+        advisor = RegexpMethodPointcutAdvisor(advice = WrappingInterceptor(), patterns = ["SampleService.method"])
+        first = ClassProxyFactory(target = SampleService(), interceptors = advisor).getProxy()
+        second = ClassProxyFactory(target = SampleService()).getProxy()
+
+        self.assertTrue(first.__class__ is second.__class__)
+        self.assertEquals("<Wrapped>You made it! => test</Wrapped>", first.method("test"))
+        self.assertEquals("Alright!", first.doSomething())
+        self.assertEquals("You made it! => test", second.method("test"))
+
+class RecordingAsyncInterceptor(AsyncMethodInterceptor):
+    def __init__(self):
+        self.events = []
+
+    def before(self, invocation):
+        self.events.append("before %s" % invocation.method_name)
+        return invocation.method_name
+
+    def after(self, invocation, context, result, exc_info):
+        if exc_info is not None:
+            self.events.append("after %s failed with %s" % (context, exc_info[1]))
+            return result
+        self.events.append("after %s => %s" % (context, result))
+        return "<%s>" % result
+
+class DeferredService(object):
+    def __init__(self):
+        self.pending = []
+
+    def fetch(self, key):
+        future = Future()
+        self.pending.append((future, key))
+        return future
+
+    def fetch_now(self, key):
+        return key.upper()
+
+    def fail(self):
+        raise ValueError("no way")
+
+class AsyncInterceptorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.target = DeferredService()
+        self.interceptor = RecordingAsyncInterceptor()
+        self.service = ProxyFactory(target = self.target, interceptors = self.interceptor).getProxy()
+
+    def testPlainResults(self):
+        self.assertEquals("<ABC>", self.service.fetch_now("abc"))
+        self.assertEquals(["before fetch_now", "after fetch_now => ABC"], self.interceptor.events)
+
+    def testExceptions(self):
+        self.assertRaises(ValueError, self.service.fail)
+        self.assertEquals(["before fail", "after fail failed with no way"], self.interceptor.events)
+
+    def testAfterRunsWhenTheFutureIsDone(self):
+        result = self.service.fetch("abc")
+        self.assertFalse(result.done())
+        self.assertEquals(["before fetch"], self.interceptor.events)
+
+        future, key = self.target.pending.pop()
+        thread = threading.Thread(target=lambda: future.set_result(key.upper()))
+        thread.start()
+
+        self.assertEquals("<ABC>", result.result(timeout=5))
+        self.assertEquals(["before fetch", "after fetch => ABC"], self.interceptor.events)
+
+    def testFailedFutures(self):
+        result = self.service.fetch("abc")
+        future, key = self.target.pending.pop()
+        future.set_exception(KeyError(key))
+
+        self.assertRaises(KeyError, result.result)
+        self.assertTrue(isinstance(result.exception(), KeyError))
+        self.assertEquals(["before fetch", "after fetch failed with 'abc'"], self.interceptor.events)
+
+    def testFutures(self):
+        future = Future()
+        self.assertRaises(TimeoutError, future.result, 0.01)
+        done = []
+        future.add_done_callback(done.append)
+        future.set_result(1)
+        future.add_done_callback(done.append)
+        self.assertEquals([future, future], done)
+        self.assertEquals(1, future.result())
+        self.assertRaises(RuntimeError, future.set_result, 2)
+
+class PerformanceMetricsInterceptorTestCase(unittest.TestCase):
+    def testSnapshotAndExposition(self):
+        interceptor = PerformanceMetricsInterceptor()
+        service = ProxyFactory(target = DeferredService(), interceptors = interceptor).getProxy()
+
+        for i in range(10):
+            service.fetch_now("abc")
+        self.assertRaises(ValueError, service.fail)
+
+        thread = threading.Thread(target=lambda: service.fetch_now("abc"))
+        thread.start()
+        thread.join()
+
+        snapshot = interceptor.snapshot()
+        self.assertEquals(["DeferredService.fail", "DeferredService.fetch_now"], sorted(snapshot.keys()))
+        self.assertEquals(11, snapshot["DeferredService.fetch_now"]["count"])
+        self.assertEquals(0, snapshot["DeferredService.fetch_now"]["errors"])
+        self.assertEquals(1, snapshot["DeferredService.fail"]["errors"])
+        self.assertEquals(11, sum(snapshot["DeferredService.fetch_now"]["buckets"]))
+        for stats in snapshot.values():
+            self.assertTrue(0.0 < stats["p50"] <= stats["p95"] <= stats["p99"] <= stats["max"])
+
+        text = interceptor.format_metrics()
+        self.assertTrue("# TYPE springpython_method_seconds summary\n" in text)
+        self.assertTrue('springpython_method_seconds_count{method="DeferredService.fetch_now"} 11\n' in text)
+        self.assertTrue('springpython_method_seconds{method="DeferredService.fail",quantile="0.99"} ' in text)
+        self.assertTrue('springpython_method_errors_total{method="DeferredService.fail"} 1\n' in text)
+
+        interceptor.reset()
+        self.assertEquals({}, interceptor.snapshot())
+
+    def testPercentiles(self):
+        recorder = metrics.LatencyRecorder()
+        for i in range(1, 101):
+            recorder.record("method", i / 1000.0)
+        stats = recorder.snapshot()["method"]
+        self.assertEquals(0.1, stats["max"])
+        for key, expected in [("p50", 0.05), ("p95", 0.095), ("p99", 0.099)]:
+            self.assertTrue(expected <= stats[key] <= expected * 1.19, "%s = %s" % (key, stats[key]))
+
+    def testResetLeavesOtherThreadsBuffersAlone(self):
+        recorder = metrics.LatencyRecorder()
+        recorded = threading.Event()
+        go_on = threading.Event()
+        def record_twice():
+            recorder.record("method", 0.001)
+            recorded.set()
+            go_on.wait(5)
+            recorder.record("method", 0.002)
+        thread = threading.Thread(target=record_twice)
+        thread.start()
+        try:
+            recorded.wait(5)
+            thread_stats = recorder.buffers[0][1]
+            recorder.reset()
+            self.assertEquals({}, recorder.snapshot())
+            self.assertEquals(1, thread_stats["method"][0])
+        finally:
+            go_on.set()
+            thread.join()
+
+        stats = recorder.snapshot()["method"]
+        self.assertEquals(1, stats["count"])
+        self.assertEquals(0.002, stats["max"])
+
+    def testFinishedThreadsAreRetiredWithoutSnapshots(self):
+        recorder = metrics.LatencyRecorder()
+        for i in range(20):
+            thread = threading.Thread(target=recorder.record, args=("method", 0.001))
+            thread.start()
+            thread.join()
+        self.assertEquals(1, len(recorder.buffers))
+
+        recorder.record("method", 0.001)
+        self.assertEquals(21, recorder.snapshot()["method"]["count"])
+        self.assertEquals(1, len(recorder.buffers))
+
+class CachingInterceptorTestCase(unittest.TestCase):
+    def _check_repository(self, ctx):
+        repository = ctx.get_object("repository")
+        interceptor = ctx.get_object("cachingInterceptor")
+        self.assertEquals(60.0, interceptor.ttl)
+        self.assertEquals(2, interceptor.max_size)
+
+        self.assertEquals("value of a", repository.load("a"))
+        self.assertEquals("value of a", repository.load("a"))
+        self.assertEquals([("load", "a")], repository.target.calls)
+
+        repository.save("a", "new")
+        repository.load("a")
+        self.assertEquals([("load", "a"), ("save", "a"), ("load", "a")], repository.target.calls)
+        self.assertEquals({"load": {"hits": 1, "misses": 2, "evictions": 0, "expirations": 0, "size": 1}},
+                          interceptor.stats())
+
+    def testXMLConfig(self):
+        self._check_repository(ApplicationContext(XMLConfig("support/aopCachingContext.xml")))
+
+    def testYamlConfig(self):
+        self._check_repository(ApplicationContext(YamlConfig("support/aopCachingContext.yaml")))
+
+    def testLeastRecentlyUsedEviction(self):
+        interceptor = CachingInterceptor(max_size = 2)
+        target = CountingRepository()
+        repository = ProxyFactory(target, interceptor).getProxy()
+
+        repository.load("a")
+        repository.load("b")
+        repository.load("a")
+        repository.load("c")
+        repository.load("a")
+        repository.load("b")
+        self.assertEquals(["a", "b", "c", "b"], [key for method, key in target.calls])
+        self.assertEquals(2, interceptor.stats()["load"]["evictions"])
+
+    def testExpiry(self):
+        interceptor = CachingInterceptor(ttl = 0.05)
+        target = CountingRepository()
+        repository = ProxyFactory(target, interceptor).getProxy()
+
+        repository.load("a")
+        repository.load("a")
+        time.sleep(0.1)
+        repository.load("a")
+        self.assertEquals(2, len(target.calls))
+        self.assertEquals(1, interceptor.stats()["load"]["expirations"])
+
+    def testRegionsKeysAndExplicitEviction(self):
+        interceptor = CachingInterceptor(regions = {"load": "data", "fail": "data"})
+        target = CountingRepository()
+        repository = ProxyFactory(target, interceptor).getProxy()
+
+        repository.load("a")
+        repository.load("a", default = 1)
+        repository.load("a", default = 1)
+        repository.load(["unhashable"])
+        repository.load(["unhashable"])
+        self.assertRaises(KeyError, repository.fail, "a")
+        self.assertRaises(KeyError, repository.fail, "a")
+        self.assertEquals(6, len(target.calls))
+        self.assertEquals(["data"], interceptor.stats().keys())
+
+        interceptor.evict("load", "a")
+        repository.load("a")
+        repository.load("a", default = 1)
+        self.assertEquals(7, len(target.calls))
+
+        interceptor.clear()
+        repository.load("a", default = 1)
+        self.assertEquals(8, len(target.calls))
+
+    def testTargetsSharingAnInterceptorAreCachedApart(self):
+        interceptor = CachingInterceptor()
+        first, second = CountingRepository(), CountingRepository()
+        first_repository = ProxyFactory(first, interceptor).getProxy()
+        second_repository = ProxyFactory(second, interceptor).getProxy()
+
+        first_repository.load("a")
+        second_repository.load("a")
+        first_repository.load("a")
+        self.assertEquals([("load", "a")], first.calls)
+        self.assertEquals([("load", "a")], second.calls)
+
+        interceptor.evict("load", "a")
+        first_repository.load("a")
+        second_repository.load("a")
+        self.assertEquals(2, len(first.calls))
+        self.assertEquals(2, len(second.calls))
+
+    def testTargetsWhichAreGoneDoNotPassOnTheirResults(self):
+        interceptor = CachingInterceptor()
+        target = CountingRepository()
+        ProxyFactory(target, interceptor).getProxy().load("a")
+        target_id = id(target)
+        del target
+
+        # Look for a new target which reuses the old one's id.
+        targets = []
+        for i in range(1000):
+            target = CountingRepository()
+            if id(target) == target_id:
+                break
+            targets.append(target)
+        ProxyFactory(target, interceptor).getProxy().load("a")
+        self.assertEquals([("load", "a")], target.calls)
+
+    def testTtlMustBePositive(self):
+        self.assertRaises(ValueError, CachingInterceptor, ttl = 0)
+        self.assertRaises(ValueError, CachingInterceptor, ttl = "-1")
+        self.assertRaises(ValueError, CacheRegion, "region", 0)
+        self.assertEquals(None, CachingInterceptor().ttl)
+
+    def testPythonConfig(self):
+        class CachingContext(PythonConfig):
+            @Object
+            def repository(self):
+                return ProxyFactory(CountingRepository(), CachingInterceptor(ttl = 60, regions = {"load": "data"})).getProxy()
+
+        repository = ApplicationContext(CachingContext()).get_object("repository")
+        repository.load("a")
+        repository.load("a")
+        self.assertEquals(1, len(repository.target.calls))
+
+def return_unpicklable():
+    """Runs in a pool process, returning a result which can't be sent back."""
+    return lambda: None
+
+def exit_worker():
+    """Runs in a pool process, which it ends without a word."""
+    os._exit(1)
+
+class ExitingService(object):
+    """A picklable target whose method ends the pool process running it."""
+    def exit(self):
+        exit_worker()
+
+def call_concurrently(calls):
+    """Makes each (method, arg) call on a thread of its own, returning their results or exceptions in order."""
+    results = {}
+    def call(index, method, arg):
+        try:
+            results[index] = method(arg)
+        except Exception, e:
+            results[index] = e
+    threads = [threading.Thread(target=call, args=(i, method, arg)) for i, (method, arg) in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [results[i] for i in range(len(calls))]
+
+class CoalescingInterceptorTestCase(unittest.TestCase):
+
+    def testConcurrentIdenticalCallsAreCoalesced(self):
+        target = SlowUserRepository()
+        service = ProxyFactory(target, CoalescingInterceptor()).getProxy()
+
+        results = call_concurrently([(service.load_user, "alice")] * 5 + [(service.load_user, "bob")])
+        self.assertEquals(["user alice"] * 5 + ["user bob"], results)
+        self.assertEquals([("load_user", "alice"), ("load_user", "bob")], sorted(target.calls))
+
+        service.load_user("alice")
+        self.assertEquals(3, len(target.calls))
+
+    def testExceptionsAreSharedToo(self):
+        target = SlowUserRepository()
+        service = ProxyFactory(target, CoalescingInterceptor()).getProxy()
+
+        results = call_concurrently([(service.load_user, "missing")] * 3)
+        self.assertEquals([KeyError] * 3, [result.__class__ for result in results])
+        self.assertEquals(1, len(target.calls))
+
+    def testMicroBatching(self):
+        target = SlowUserRepository(delay = 0.01)
+        interceptor = CoalescingInterceptor(batch_methods = {"load_user": "load_users"})
+        interceptor.batch_window = "0.2"
+        service = ProxyFactory(target, interceptor).getProxy()
+
+        results = call_concurrently([(service.load_user, "alice"), (service.load_user, "bob"),
+                                           (service.load_user, "alice"), (service.load_user, "missing")])
+        self.assertEquals(["user alice", "user bob", "user alice", KeyError],
+                          results[:3] + [results[3].__class__])
+        self.assertEquals([("load_users", ["alice", "bob", "missing"])], target.calls)
+
+    def testFullBatchesDoNotWait(self):
+        target = SlowUserRepository(delay = 0)
+        service = ProxyFactory(target, CoalescingInterceptor({"load_user": "load_users"}, 10, 1)).getProxy()
+
+        start = time.time()
+        self.assertEquals("user alice", service.load_user("alice"))
+        self.assertTrue(time.time() - start < 5)
+        self.assertEquals([("load_users", ["alice"])], target.calls)
+
+class AsyncExecutionInterceptorTestCase(unittest.TestCase):
+    def tearDown(self):
+        if hasattr(self, "interceptor"):
+            self.interceptor.shutdown()
+
+    def testMatchedMethodsRunOnPoolThreads(self):
+        target = SlowUserRepository(delay = 0)
+        self.interceptor = AsyncExecutionInterceptor(max_workers = "2")
+        advisor = RegexpMethodPointcutAdvisor(advice = [self.interceptor], patterns = [".*load_user$"])
+        service = ProxyFactory(target, advisor).getProxy()
+
+        threads = []
+        def remember_thread(username):
+            threads.append(threading.currentThread())
+            return "user %s" % username
+        target.load_user = remember_thread
+
+        future = service.load_user("alice")
+        self.assertTrue(isinstance(future, Future))
+        self.assertEquals("user alice", future.result(5))
+        self.assertNotEquals(threading.currentThread(), threads[0])
+        self.assertEquals({"alice": "user alice"}, service.load_users(["alice"]))
+
+    def testExceptionsAreRaisedByTheFuture(self):
+        self.interceptor = AsyncExecutionInterceptor()
+        service = ProxyFactory(SlowUserRepository(delay = 0), self.interceptor).getProxy()
+        self.assertRaises(KeyError, service.load_user("missing").result, 5)
+
+    def testCallsDoNotWaitForEachOther(self):
+        self.interceptor = AsyncExecutionInterceptor(max_workers = 4)
+        target = SlowUserRepository(delay = 0)
+        service = ProxyFactory(target, self.interceptor).getProxy()
+
+        # Each call waits until all four are running, which only happens if neither the caller
+        # nor the pool waits for one call to finish before starting the next.
+        rendezvous = Rendezvous(4)
+        target.load_user = lambda username: (username, rendezvous.arrive())
+
+        futures = [service.load_user(name) for name in ["a", "b", "c", "d"]]
+        self.assertEquals([("a", True), ("b", True), ("c", True), ("d", True)], [future.result(10) for future in futures])
+        self.assertTrue(len(self.interceptor.executor.threads) <= 4)
+
+    def testProcessPool(self):
+        self.interceptor = AsyncExecutionInterceptor(pool = "process", max_workers = 1)
+        service = ProxyFactory(CountingRepository(), self.interceptor).getProxy()
+        self.assertEquals("value of key", service.load("key").result(10))
+        self.assertRaises(KeyError, service.fail("key").result, 10)
+
+    def testProcessPoolFailuresOutsideTheTask(self):
+        executor = ProcessPoolExecutor(max_workers = 1, task_timeout = 1, poll_interval = 0.01)
+        try:
+            self.assertRaises(Exception, executor.submit(return_unpicklable).result, 10)
+
+            future = executor.submit(exit_worker)
+            self.assertRaises(TimeoutError, future.result, 10)
+            self.assertTrue(future.done())
+
+            self.assertEquals(4, executor.submit(pow, 2, 2).result(10))
+        finally:
+            executor.shutdown()
+
+    def testProcessPoolTaskTimeout(self):
+        self.interceptor = AsyncExecutionInterceptor(pool = "process", max_workers = 1, task_timeout = "1")
+        service = ProxyFactory(ExitingService(), self.interceptor).getProxy()
+        self.assertRaises(TimeoutError, service.exit().result, 10)
+        self.assertEquals(1.0, self.interceptor.executor.task_timeout)
+
+    def testProcessPoolWatcherSurvivesFuturesCompletedByThePool(self):
+        class NeverReady(object):
+            def ready(self):
+                return False
+        executor = ProcessPoolExecutor(task_timeout = 0, poll_interval = 0.01)
+        future = Future()
+        future.set_result("completed by the pool")
+        executor.pending.append((future, NeverReady(), time.time() - 1))
+        executor.watcher = threading.currentThread()
+
+        executor._watch()
+        self.assertEquals([], executor.pending)
+        self.assertTrue(executor.watcher is None)
+        self.assertEquals("completed by the pool", future.result(0))
+
+    def testUnknownPool(self):
+        self.interceptor = AsyncExecutionInterceptor(pool = "fibers")
+        service = ProxyFactory(CountingRepository(), self.interceptor).getProxy()
+        self.assertRaises(ValueError, service.load, "key")
+
+class CircuitBreakerInterceptorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.target = CountingRepository()
+        self.interceptor = CircuitBreakerInterceptor(failure_threshold = 2, reset_timeout = 0.1)
+        self.service = ProxyFactory(self.target, self.interceptor).getProxy()
+
+    def testOpensAfterConsecutiveFailures(self):
+        self.assertRaises(KeyError, self.service.fail, "a")
+        self.assertEquals("value of a", self.service.load("a"))
+        self.assertRaises(KeyError, self.service.fail, "a")
+        self.assertRaises(KeyError, self.service.fail, "a")
+        self.assertEquals("open", self.interceptor.state)
+
+        self.assertRaises(CircuitOpenException, self.service.load, "a")
+        self.assertEquals(4, len(self.target.calls))
+
+    def testSuccessfulProbeClosesTheCircuit(self):
+        self.assertRaises(KeyError, self.service.fail, "a")
+        self.assertRaises(KeyError, self.service.fail, "a")
+        time.sleep(0.15)
+        self.assertEquals("value of a", self.service.load("a"))
+        self.assertEquals("closed", self.interceptor.state)
+        self.assertRaises(KeyError, self.service.fail, "a")
+        self.assertEquals("closed", self.interceptor.state)
+
+    def testFailedProbeReopensTheCircuit(self):
+        self.assertRaises(KeyError, self.service.fail, "a")
+        self.assertRaises(KeyError, self.service.fail, "a")
+        time.sleep(0.15)
+        self.assertRaises(KeyError, self.service.fail, "a")
+        self.assertEquals("open", self.interceptor.state)
+        self.assertRaises(CircuitOpenException, self.service.load, "a")
+
+        self.interceptor.reset()
+        self.assertEquals("value of a", self.service.load("a"))
+
+    def testOnlyFailureExceptionsCount(self):
+        self.interceptor.failure_exceptions = [IOError]
+        for i in range(3):
+            self.assertRaises(KeyError, self.service.fail, "a")
+        self.assertEquals("closed", self.interceptor.state)
+
+class BulkheadInterceptorTestCase(unittest.TestCase):
+    def testCallsBeyondTheLimitAreRejected(self):
+        service = ProxyFactory(SlowUserRepository(delay = 0.2), BulkheadInterceptor(max_concurrent_calls = 1)).getProxy()
+        results = call_concurrently([(service.load_user, "alice"), (service.load_user, "bob")])
+        self.assertEquals(1, len([result for result in results if isinstance(result, BulkheadFullException)]))
+        self.assertEquals("user alice", service.load_user("alice"))
+
+    def testQueuedCallsWaitTheirTurn(self):
+        service = ProxyFactory(SlowUserRepository(delay = 0.05), BulkheadInterceptor(2, 2)).getProxy()
+        results = call_concurrently([(service.load_user, name) for name in "abcd"])
+        self.assertEquals(["user a", "user b", "user c", "user d"], results)
+
+    def testQueueTimeout(self):
+        interceptor = BulkheadInterceptor(max_concurrent_calls = "1", max_queue = "1", queue_timeout = "0.05")
+        service = ProxyFactory(SlowUserRepository(delay = 0.3), interceptor).getProxy()
+        results = call_concurrently([(service.load_user, "alice"), (service.load_user, "bob")])
+        self.assertEquals(1, len([result for result in results if isinstance(result, BulkheadFullException)]))
+        self.assertEquals(0, interceptor.active)
+
+    def testConfiguredOnProxyFactoryObject(self):
+        context = ApplicationContext(XMLConfig("support/aopResilienceContext.xml"))
+        service = context.get_object("repository")
+        results = call_concurrently([(service.load_user, "alice"), (service.load_user, "bob")])
+        self.assertEquals(1, len([result for result in results if isinstance(result, BulkheadFullException)]))
+
+        self.assertRaises(KeyError, service.load_user, "missing")
+        self.assertRaises(KeyError, service.load_user, "missing")
+        self.assertRaises(CircuitOpenException, service.load_user, "alice")
+
 if __name__ == "__main__":
     logger = logging.getLogger("springpython")
     loggingLevel = logging.INFO
@@ -3,6 +3,10 @@ from springpythontest.contextTestCases import *
 from springpythontest.databaseCoreTestCases import ConnectionFactoryTestCase
 from springpythontest.databaseCoreTestCases import SqliteDatabaseTemplateTestCase
 from springpythontest.databaseCoreTestCases import DatabaseTemplateMockTestCase
+from springpythontest.databaseCoreTestCases import PooledConnectionFactoryTestCase
+from springpythontest.databaseCoreTestCases import QueryIterTestCase
+from springpythontest.databaseCoreTestCases import StatementCacheTestCase
+from springpythontest.databaseCoreTestCases import ColumnResultSetTestCase
 from springpythontest.databaseTransactionTestCases import SqliteTransactionTestCase
 from springpythontest.securityEncodingTestCases import *
 from springpythontest.securityProviderTestCases import InMemoryDaoAuthenticationProviderTestCase
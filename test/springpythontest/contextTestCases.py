@@ -19,16 +19,26 @@
 # pmock
 from pmock import *
 
+import gc
+import os
 import sys
+import time
+import shutil
+import logging
+import tempfile
 import atexit
 import random
 import unittest
+import weakref
+import threading
 from decimal import Decimal
 from StringIO import StringIO
 
+import springpython
 from springpython.context import DisposableObject
 from springpython.context import ApplicationContext
 from springpython.context import ObjectPostProcessor
+from springpython.context.profiler import StartupProfiler
 from springpython.config import PythonConfig
 from springpython.config import PyContainerConfig
 from springpython.config import SpringJavaConfig
@@ -36,10 +46,15 @@ from springpython.config import Object
 from springpython.config import XMLConfig, xml_mappings
 from springpython.config import YamlConfig, yaml_mappings
 from springpython.config import Object, ObjectDef
+from springpython.config import ReferenceDef, ValueDef
+from springpython.container import ObjectContainer, LazyObjectProxy
+from springpython.container.graph import DependencyGraph, CyclicDependencyException
 from springpython.factory import PythonObjectFactory
+from springpython.factory import ReflectiveObjectFactory
 from springpython.remoting.pyro import PyroProxyFactory
 from springpython.security.userdetails import InMemoryUserDetailsService
 from springpythontest.support import testSupportClasses
+from springpython.context import scope
 from springpython.context.scope import SINGLETON, PROTOTYPE
 from springpython.container import AbstractObjectException, InvalidObjectScope
 
@@ -111,6 +126,13 @@ class PurePythonContainerTestCase(unittest.TestCase):
         self.assertEquals(movieList[0], "The Count of Monte Cristo")
         self.assertEquals(lister.description.str, "There should only be one copy of this string")
         
+    def testObjectCallsDoNotCreateLoggers(self):
+        ApplicationContext(testSupportClasses.MovieBasedApplicationContext()).get_object("MovieLister")
+        loggers = len(logging.Logger.manager.loggerDict)
+        for i in range(3):
+            ApplicationContext(testSupportClasses.MovieBasedApplicationContext()).get_object("MovieLister")
+        self.assertEquals(loggers, len(logging.Logger.manager.loggerDict))
+
     def testCreatingMovieListerBeforeSingletonString(self):
         movieAppContainer = ApplicationContext(testSupportClasses.MovieBasedApplicationContext())
         self.assertTrue(isinstance(movieAppContainer, ApplicationContext))
@@ -2002,3 +2024,678 @@ class InvalidScopeContainingContext(PythonConfig):
             exec invalid in _globals, _locals
             
         self.assertRaises(InvalidObjectScope, should_raise_invalid_object_scope)
+
+class ConcurrentSingletonCreationTestCase(unittest.TestCase):
+    """Concurrent first requests for a singleton must create it only once."""
+
+    def test_singleton_created_once_under_concurrent_access(self):
+
+        created = []
+
+        class SlowSingletonContext(PythonConfig):
+
+            @Object(lazy_init=True)
+            def slow_singleton(self):
+                time.sleep(0.05)
+                created.append(1)
+                return object()
+
+        container = ApplicationContext(SlowSingletonContext())
+
+        results = []
+        def fetch():
+            results.append(container.get_object("slow_singleton"))
+
+        threads = [threading.Thread(target=fetch) for x in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(1, len(created))
+        self.assertEquals(10, len(results))
+        for result in results:
+            self.assertTrue(result is results[0])
+
+    def test_prototypes_are_not_serialized(self):
+
+        class PrototypeContext(PythonConfig):
+
+            @Object(PROTOTYPE)
+            def prototype(self):
+                return object()
+
+        container = ApplicationContext(PrototypeContext())
+        self.assertFalse(container.get_object("prototype") is container.get_object("prototype"))
+        self.assertFalse("prototype" in container._creation_locks)
+
+class ObjectCreationPlanTestCase(unittest.TestCase):
+    """Object definitions are compiled into creation plans once and reused."""
+
+    def _get_holder_def(self):
+        holder_def = ObjectDef(id="holder", scope=PROTOTYPE,
+            factory=ReflectiveObjectFactory("springpythontest.support.testSupportClasses.MultiValueHolder"))
+        holder_def.pos_constr = [ValueDef("holder.constr", "first"), ReferenceDef("holder.constr", "shared")]
+        holder_def.named_constr = {"c": ValueDef("c", 0)}
+        return holder_def
+
+    def _get_container(self):
+        container = ObjectContainer()
+        container.object_defs["shared"] = ObjectDef(id="shared",
+            factory=ReflectiveObjectFactory("springpythontest.support.testSupportClasses.ValueHolder"))
+        container.object_defs["holder"] = self._get_holder_def()
+        return container
+
+    def test_prototype_plan_is_reused(self):
+        container = self._get_container()
+
+        holder1 = container.get_object("holder")
+        plan = container._plans["holder"]
+        holder2 = container.get_object("holder")
+
+        self.assertTrue(plan is container._plans["holder"])
+        self.assertFalse(holder1 is holder2)
+
+        shared = container.get_object("shared")
+        for holder in [holder1, holder2]:
+            self.assertEquals("first", holder.a)
+            self.assertTrue(holder.b is shared)
+            self.assertEquals(0, holder.c)
+
+        self.assertEquals(("first",), tuple([value for constant, value in plan.pos_args if constant]))
+        self.assertEquals({"c": 0}, plan.kw_constants)
+
+    def test_replaced_definition_is_compiled_again(self):
+        container = self._get_container()
+        container.get_object("holder")
+        plan = container._plans["holder"]
+
+        holder_def = self._get_holder_def()
+        holder_def.named_constr = {"c": ValueDef("c", "replaced")}
+        container.object_defs["holder"] = holder_def
+
+        self.assertEquals("replaced", container.get_object("holder").c)
+        self.assertFalse(plan is container._plans["holder"])
+
+class ParallelStartupTestCase(unittest.TestCase):
+    """Independent eager singletons may be created concurrently at startup."""
+
+    def tearDown(self):
+        testSupportClasses.rendezvous_points.clear()
+
+    def test_parallel_startup(self):
+        testSupportClasses.rendezvous_points["connections"] = testSupportClasses.Rendezvous(3)
+        ctx = ApplicationContext(XMLConfig("support/contextParallelStartup.xml"), parallel_startup=True)
+
+        self.assertEquals(2, len(ctx.startup_waves))
+        self.assertEquals(["connection1", "connection2", "connection3"], sorted(ctx.startup_waves[0]))
+        self.assertEquals(["service"], ctx.startup_waves[1])
+
+        # Each connection waits in its constructor until the other two arrive, which
+        # can only happen if the whole wave is being created at the same time.
+        for name in ctx.startup_waves[0]:
+            self.assertTrue(ctx.get_object(name).met_group, name)
+
+        thread_names = set([ctx.get_object(name).thread_name for name in ctx.startup_waves[0]])
+        self.assertEquals(3, len(thread_names))
+
+        service = ctx.get_object("service")
+        self.assertTrue(service.dependencies[0] is ctx.get_object("connection1"))
+        self.assertTrue(service.dependencies[1] is ctx.get_object("connection2"))
+
+        self.assertFalse("reportGenerator" in ctx.objects)
+        self.assertEquals(["connection1", "connection2", "connection3", "service"], sorted(ctx.startup_times.keys()))
+
+    def test_serial_startup_records_times(self):
+        ctx = ApplicationContext(XMLConfig("support/contextParallelStartup.xml"))
+
+        self.assertEquals([], ctx.startup_waves)
+        for name in ["connection1", "connection2", "connection3", "service"]:
+            self.assertTrue(name in ctx.objects)
+        # The container's measurement encloses each object's own constructor.
+        for name, elapsed in ctx.startup_times.items():
+            self.assertTrue(elapsed >= ctx.get_object(name).created_in, name)
+
+class StartupProfilerTestCase(unittest.TestCase):
+    """A StartupProfiler records where an application context's startup time goes."""
+
+    def test_startup_report(self):
+        profiler = StartupProfiler()
+        ctx = ApplicationContext(XMLConfig("support/contextParallelStartup.xml"), profiler=profiler)
+
+        report = ctx.get_startup_report()
+        self.assertEquals(["objects", "phases", "sources"], sorted(report.keys()))
+
+        self.assertEquals(1, report["sources"]["XMLConfig(support/contextParallelStartup.xml)"]["calls"])
+
+        for phase in ["read_object_defs", "create_object", "after_properties_set", "startup"]:
+            self.assertTrue(phase in report["phases"], phase)
+        self.assertEquals(4, report["phases"]["create_object"]["calls"])
+
+        created_in = dict([(name, ctx.get_object(name).created_in) for name in report["objects"]])
+        self.assertTrue(report["phases"]["startup"]["elapsed"] >= sum(created_in.values()))
+
+        service = report["objects"]["service"]
+        self.assertEquals(1, service["phases"]["create_object"]["calls"])
+        self.assertTrue(service["self"] >= created_in["service"])
+        self.assertTrue(service["elapsed"] >= service["self"])
+
+        # Self times never count the same interval twice, so they add up to no more than startup.
+        total_self = sum([entry["self"] for entry in report["objects"].values()])
+        self.assertTrue(total_self <= report["phases"]["startup"]["elapsed"] + 1e-6)
+
+        self.assertFalse("reportGenerator" in report["objects"])
+        ctx.get_object("reportGenerator")
+        self.assertTrue("reportGenerator" in ctx.get_startup_report()["objects"])
+
+        slowest = profiler.slowest_objects(2)
+        self.assertEquals(2, len(slowest))
+        self.assertTrue(slowest[0][1]["self"] >= slowest[1][1]["self"])
+
+        table = profiler.format_slowest_objects()
+        self.assertTrue(table.startswith("object"))
+        self.assertEquals(6, len(table.split("\n")))
+
+        self.assertTrue('"create_object"' in profiler.to_json())
+
+    def test_no_profiler(self):
+        ctx = ApplicationContext(XMLConfig("support/contextParallelStartup.xml"))
+        self.assertTrue(ctx.get_startup_report() is None)
+
+class ObjectDefCacheTestCase(unittest.TestCase):
+    """Parsed object definitions are cached on disk until their config file changes."""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.work_dir, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _copy_config(self, name):
+        path = os.path.join(self.work_dir, os.path.basename(name))
+        shutil.copy(name, path)
+        return path
+
+    def _check_config(self, config_class, name):
+        path = self._copy_config(name)
+
+        cold = config_class(path, cache_dir=self.cache_dir)
+        ctx = ApplicationContext(cold)
+        self.assertEquals((0, 1), (cold.cache.hits, cold.cache.misses))
+        self.assertEquals("Greg", ctx.get_object("value").name)
+
+        warm = config_class(path, cache_dir=self.cache_dir)
+        ctx = ApplicationContext(warm)
+        self.assertEquals((1, 0), (warm.cache.hits, warm.cache.misses))
+        self.assertEquals("Greg", ctx.get_object("value").name)
+        self.assertTrue(hasattr(ctx.get_object("value"), "processedAfter"))
+
+        config_file = open(path)
+        content = config_file.read().replace("Greg", "Dirk")
+        config_file.close()
+        config_file = open(path, "w")
+        config_file.write(content)
+        config_file.close()
+
+        changed = config_class(path, cache_dir=self.cache_dir)
+        ctx = ApplicationContext(changed)
+        self.assertEquals((0, 1), (changed.cache.hits, changed.cache.misses))
+        self.assertEquals("Dirk", ctx.get_object("value").name)
+
+    def test_xml_config_cache(self):
+        self._check_config(XMLConfig, "support/contextObjectPostProcessing.xml")
+
+    def test_yaml_config_cache(self):
+        self._check_config(YamlConfig, "support/contextObjectPostProcessing.yaml")
+
+    def test_mappings_and_version_are_part_of_the_key(self):
+        path = self._copy_config("support/contextObjectPostProcessing.xml")
+        XMLConfig(path, cache_dir=self.cache_dir).read_object_defs()
+
+        xml_mappings["ordereddict"] = "springpythontest.support.testSupportClasses.Person"
+        try:
+            config = XMLConfig(path, cache_dir=self.cache_dir)
+            config.read_object_defs()
+            self.assertEquals((0, 1), (config.cache.hits, config.cache.misses))
+        finally:
+            del xml_mappings["ordereddict"]
+
+        version = springpython.__version__
+        springpython.__version__ = "0.1"
+        try:
+            config = XMLConfig(path, cache_dir=self.cache_dir)
+            config.read_object_defs()
+            self.assertEquals((0, 1), (config.cache.hits, config.cache.misses))
+        finally:
+            springpython.__version__ = version
+
+    def test_yaml_streams_are_not_cached(self):
+        stream = open("support/contextObjectPostProcessing.yaml")
+        try:
+            config = YamlConfig(stream, cache_dir=self.cache_dir)
+            ctx = ApplicationContext(config)
+        finally:
+            stream.close()
+        self.assertEquals("Greg", ctx.get_object("value").name)
+        self.assertEquals((0, 0), (config.cache.hits, config.cache.misses))
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_cached_definitions_use_shared_loggers(self):
+        path = self._copy_config("support/contextSpringPythonAppContext.xml")
+        XMLConfig(path, cache_dir=self.cache_dir).read_object_defs()
+        object_defs = XMLConfig(path, cache_dir=self.cache_dir).read_object_defs()
+
+        for object_def in object_defs:
+            self.assertTrue(object_def.factory.logger is logging.getLogger("springpython.factory.ReflectiveObjectFactory"))
+            for prop in object_def.props:
+                if hasattr(prop, "logger"):
+                    self.assertTrue(prop.logger is logging.getLogger(prop.logger.name))
+
+class RefreshTestCase(unittest.TestCase):
+    """Refreshing a context rebuilds only what changed and what refers to it."""
+
+    config = """<?xml version="1.0" encoding="UTF-8"?>
+<objects xmlns="http://www.springframework.org/springpython/schema/objects">
+    <object id="connection" class="springpythontest.support.testSupportClasses.DisposableConnection">
+        <property name="url" value="%s"/>
+    </object>
+    <object id="service" class="springpythontest.support.testSupportClasses.SlowStartingObject">
+        <constructor-arg name="delay" value="0"/>
+        <constructor-arg name="dependencies"><list><ref object="connection"/></list></constructor-arg>
+    </object>
+    <object id="person" class="springpythontest.support.testSupportClasses.Person">
+        <constructor-arg name="name" value="Greg"/>
+    </object>
+    <object id="session" class="springpythontest.support.testSupportClasses.SlowStartingObject" scope="thread">
+        <constructor-arg name="delay" value="0"/>
+        <constructor-arg name="dependencies"><list><ref object="connection"/></list></constructor-arg>
+    </object>
+</objects>
+"""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.work_dir, "refresh.xml")
+        self._write_config("db://first")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _write_config(self, url):
+        config_file = open(self.path, "w")
+        config_file.write(self.config % url)
+        config_file.close()
+
+    def test_refresh_without_changes(self):
+        ctx = ApplicationContext([XMLConfig(self.path), testSupportClasses.ConstructorBasedContainer()])
+        objects = dict(ctx.objects)
+        self.assertTrue(ctx.config_signatures is None)
+
+        self.assertEquals([], ctx.refresh())
+        self.assertEquals(objects, ctx.objects)
+        self.assertEquals(2, len(ctx.config_signatures))
+        self.assertEquals([], ctx.refresh())
+
+    def test_refresh_rebuilds_changed_objects_and_dependents(self):
+        ctx = ApplicationContext(XMLConfig(self.path))
+        connection = ctx.get_object("connection")
+        service = ctx.get_object("service")
+        person = ctx.get_object("person")
+        session = ctx.get_object("session")
+
+        self._write_config("db://second")
+        self.assertEquals(["connection", "service", "session"], ctx.refresh())
+
+        self.assertFalse(session is ctx.get_object("session"))
+        self.assertTrue(ctx.get_object("session").dependencies[0] is ctx.get_object("connection"))
+
+        self.assertTrue(connection.destroyed)
+        self.assertEquals("db://second", ctx.get_object("connection").url)
+        self.assertFalse(ctx.get_object("connection").destroyed)
+
+        self.assertFalse(service is ctx.get_object("service"))
+        self.assertTrue(ctx.get_object("service").dependencies[0] is ctx.get_object("connection"))
+
+        self.assertTrue(person is ctx.get_object("person"))
+        self.assertEquals([], ctx.refresh())
+
+    def test_definitions_stay_visible_while_refreshing(self):
+        ctx = ApplicationContext(XMLConfig(self.path))
+        names = sorted(ctx.object_defs.keys())
+        missing = []
+
+        class WatchedDefinitions(type(ctx.object_defs)):
+            """Checks after every change that no definition has gone missing."""
+            def _check(self):
+                missing.extend([name for name in names if name not in self])
+            def __setitem__(self, name, object_def):
+                super(WatchedDefinitions, self).__setitem__(name, object_def)
+                self._check()
+            def __delitem__(self, name):
+                super(WatchedDefinitions, self).__delitem__(name)
+                self._check()
+            def pop(self, name, *default):
+                result = super(WatchedDefinitions, self).pop(name, *default)
+                self._check()
+                return result
+            def clear(self):
+                super(WatchedDefinitions, self).clear()
+                self._check()
+
+        watched = WatchedDefinitions()
+        for name, object_def in ctx.object_defs.items():
+            watched[name] = object_def
+        ctx.object_defs = watched
+        del missing[:]
+
+        self._write_config("db://second")
+        self.assertEquals(["connection", "service", "session"], ctx.refresh())
+        self.assertEquals([], missing)
+        self.assertEquals(names, sorted(ctx.object_defs.keys()))
+
+class TypeIndexTestCase(unittest.TestCase):
+    def test_index_follows_stored_objects(self):
+        container = ObjectContainer()
+        connection = testSupportClasses.DisposableConnection("db://first")
+        container.objects["connection"] = connection
+        container.objects["port"] = 18000
+
+        self.assertEquals({"connection": connection}, container.objects.get_by_type(DisposableObject))
+        self.assertEquals({"port": 18000}, container.objects.get_by_type(int))
+        self.assertEquals(2, len(container.objects.get_by_type(object)))
+
+        container.objects["connection"] = "db://second"
+        self.assertEquals({}, container.objects.get_by_type(DisposableObject))
+        self.assertEquals(["connection"], container.objects.get_by_type(basestring).keys())
+
+        del container.objects["connection"]
+        self.assertEquals(18000, container.objects.pop("port"))
+        self.assertEquals({}, container.objects.get_by_type(object))
+        self.assertEquals({}, container.objects.type_index)
+
+    def test_abstract_base_classes_are_scanned(self):
+        import abc
+        class Pingable(object):
+            __metaclass__ = abc.ABCMeta
+        Pingable.register(testSupportClasses.DisposableConnection)
+
+        container = ObjectContainer()
+        container.objects["connection"] = testSupportClasses.DisposableConnection("db://first")
+        container.objects["port"] = 18000
+
+        self.assertEquals(["connection"], container.objects.get_by_type(Pingable).keys())
+        self.assertEquals(["connection"], container.objects.get_by_type((Pingable, str)).keys())
+
+    def test_definitions_by_declared_class(self):
+        ctx = ApplicationContext(XMLConfig("support/contextParallelStartup.xml"))
+        self.assertFalse("reportGenerator" in ctx.objects)
+
+        object_defs = ctx.get_object_defs_by_type(testSupportClasses.SlowStartingObject)
+        self.assertEquals(["connection1", "connection2", "connection3", "reportGenerator", "service"],
+                          sorted(object_defs.keys()))
+        self.assertEquals({}, ctx.get_object_defs_by_type(testSupportClasses.SlowStartingObject, False))
+        self.assertEquals(5, len(ctx.get_object_defs_by_type(object, False)))
+        self.assertFalse("reportGenerator" in ctx.objects)
+
+    def test_unresolvable_definitions_are_skipped(self):
+        ctx = ApplicationContext(XMLConfig("support/contextParallelStartup.xml"))
+        ctx.object_defs["missing"] = ObjectDef(id="missing", factory=ReflectiveObjectFactory("springpythontest.support.noSuchModule.Missing"))
+
+        object_defs = ctx.get_object_defs_by_type(testSupportClasses.SlowStartingObject)
+        self.assertEquals(5, len(object_defs))
+        self.assertFalse("missing" in object_defs)
+
+class LazyProxiesTestCase(unittest.TestCase):
+    def test_lazy_references_are_created_eagerly_by_default(self):
+        ctx = ApplicationContext(XMLConfig("support/contextLazyProxies.xml"))
+        self.assertTrue("reportGenerator" in ctx.objects)
+        self.assertTrue(ctx.get_object("service").dependencies is ctx.get_object("reportGenerator"))
+
+    def test_lazy_references_are_proxied(self):
+        ctx = ApplicationContext(XMLConfig("support/contextLazyProxies.xml"), lazy_proxies=True)
+        self.assertFalse("reportGenerator" in ctx.objects)
+
+        proxy = ctx.get_object("service").dependencies
+        self.assertTrue(type(proxy) is LazyObjectProxy)
+        self.assertFalse("reportGenerator" in ctx.objects)
+
+        self.assertEquals("db://reports", proxy.url)
+        self.assertTrue("reportGenerator" in ctx.objects)
+        self.assertTrue(isinstance(proxy, testSupportClasses.DisposableConnection))
+
+        proxy.destroy()
+        self.assertTrue(ctx.get_object("reportGenerator").destroyed)
+
+        # Both proxies stand in for the same single instance.
+        ctx.get_object("auditor").url.url = "db://audit"
+        self.assertEquals("db://audit", ctx.get_object("reportGenerator").url)
+
+    def test_proxied_objects_are_initialized(self):
+        for lazy_proxies in [False, True]:
+            ctx = ApplicationContext(XMLConfig("support/contextLazyProxiesInitialized.xml"), lazy_proxies=lazy_proxies)
+            connection = ctx.get_object("service").dependencies
+
+            self.assertEquals("db://lazy", connection.url)
+            self.assertEquals((True, True), (connection.properties_set, connection.app_context is ctx))
+            self.assertEquals("connection", connection.processedBefore)
+            self.assertEquals("connection", connection.processedAfter)
+
+    def test_special_methods_are_forwarded(self):
+        ctx = ApplicationContext(XMLConfig("support/contextLazyProxiesInitialized.xml"), lazy_proxies=True)
+        proxy = ctx.get_object("service").dependencies
+        self.assertTrue(type(proxy) is LazyObjectProxy)
+
+        self.assertEquals("db://lazy", proxy.__enter__())
+        self.assertFalse(proxy.__exit__(None, None, None))
+        self.assertTrue(ctx.get_object("connection").destroyed)
+
+        number = LazyObjectProxy(ObjectContainer(), "number")
+        object.__setattr__(number, "_target", 6)
+        self.assertEquals((8, 4, 12, 3, 0, -6, 36), (number + 2, number - 2, 2 * number, number / 2, number % 2, -number, number ** 2))
+        self.assertEquals((4, 2), (10 - number, 12 / number))
+        self.assertTrue(number < 7 and number <= 6 and number > 5 and number >= 6)
+        self.assertEquals(6, int(number))
+        self.assertEquals("g", "abcdefg"[number])
+
+        letters = LazyObjectProxy(ObjectContainer(), "letters")
+        object.__setattr__(letters, "_target", ["a", "b", "c"])
+        self.assertEquals(3, len(letters))
+        self.assertEquals(["a", "b", "c"], list(letters))
+        self.assertEquals(["c", "b", "a"], list(reversed(letters)))
+        self.assertEquals(["b", "c"], letters[1:])
+
+    def test_created_lazy_objects_are_injected_directly(self):
+        container = ObjectContainer(XMLConfig("support/contextLazyProxies.xml"), lazy_proxies=True)
+        container.get_object("reportGenerator")
+        self.assertTrue(container.get_object("service").dependencies is container.get_object("reportGenerator"))
+
+class CustomScopesTestCase(unittest.TestCase):
+    def _get_context(self, scope_):
+        class ScopedContext(PythonConfig):
+            @Object(scope_)
+            def handler(self):
+                return testSupportClasses.DisposableConnection()
+
+        return ApplicationContext(ScopedContext())
+
+    def tearDown(self):
+        scope.end_request()
+
+    def test_thread_scope(self):
+        ctx = self._get_context(scope.THREAD)
+        handler = ctx.get_object("handler")
+        self.assertTrue(handler is ctx.get_object("handler"))
+
+        handlers = []
+        thread = threading.Thread(target=lambda: handlers.extend([ctx.get_object("handler"), ctx.get_object("handler")]))
+        thread.start()
+        thread.join()
+
+        self.assertTrue(handlers[0] is handlers[1])
+        self.assertFalse(handlers[0] is handler)
+
+    def test_request_scope(self):
+        ctx = self._get_context(scope.REQUEST)
+        self.assertFalse("handler" in ctx.objects)
+
+        handler = ctx.get_object("handler")
+        self.assertTrue(handler is ctx.get_object("handler"))
+
+        scope.end_request()
+        self.assertFalse(handler is ctx.get_object("handler"))
+
+    def test_invalidate_reaches_every_thread(self):
+        thread_scope = scope.ThreadScope()
+        thread_scope.get("key", lambda: "main")
+
+        stored, invalidated = threading.Event(), threading.Event()
+        seen = []
+        def other_thread():
+            thread_scope.get("key", lambda: "other")
+            stored.set()
+            invalidated.wait(5)
+            seen.append(thread_scope.get("key", lambda: "recreated"))
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+
+        stored.wait(5)
+        thread_scope.invalidate("key")
+        invalidated.set()
+        thread.join()
+
+        self.assertEquals(["recreated"], seen)
+        self.assertEquals("recreated", thread_scope.get("key", lambda: "recreated"))
+
+    def test_scopes_do_not_keep_containers_alive(self):
+        class ScopedContext(PythonConfig):
+            @Object(scope.THREAD)
+            def handler(self):
+                return testSupportClasses.DisposableConnection()
+
+        container = ObjectContainer(ScopedContext())
+        container.get_object("handler")
+        container_ref = weakref.ref(container)
+
+        del container
+        gc.collect()
+        self.assertTrue(container_ref() is None)
+
+    def test_scoped_objects_are_kept_per_container(self):
+        first, second = self._get_context(scope.REQUEST), self._get_context(scope.REQUEST)
+        self.assertFalse(first.get_object("handler") is second.get_object("handler"))
+
+    def test_registered_scope(self):
+        scope.register_scope("conversation", scope.ThreadScope())
+        try:
+            self.assertEquals("conversation", scope.convert("conversation"))
+            ctx = self._get_context("conversation")
+            handler = ctx.get_object("handler")
+            self.assertTrue(handler is ctx.get_object("handler"))
+
+            scope.get_scope("conversation").clear()
+            self.assertFalse(handler is ctx.get_object("handler"))
+        finally:
+            del scope._scopes["conversation"]
+
+        self.assertRaises(InvalidObjectScope, self._get_context, "conversation")
+
+class DependencyGraphTestCase(unittest.TestCase):
+    def _get_object_def(self, id, *refs, **kwargs):
+        object_def = ObjectDef(id=id, factory=ReflectiveObjectFactory("springpythontest.support.testSupportClasses.SlowStartingObject"), **kwargs)
+        object_def.pos_constr = [ValueDef("delay", "0")]
+        object_def.props = [ReferenceDef("ref%s" % i, ref) for i, ref in enumerate(refs)]
+        return object_def
+
+    def test_creation_order_and_levels(self):
+        graph = DependencyGraph({"service": set(["dao", "cache"]), "dao": set(["connection"]), "cache": set()})
+
+        self.assertEquals([], graph.find_cycles())
+        self.assertEquals(["cache", "connection", "dao", "service"], graph.get_creation_order(["service"]))
+        self.assertEquals(["connection", "dao", "cache", "service"], graph.get_creation_order(["dao", "service"]))
+        self.assertEquals([["cache", "connection"], ["dao"], ["service"]],
+                          [sorted(level) for level in graph.get_levels(["service", "dao", "cache", "connection"])])
+        self.assertEquals(set(["service"]), graph.get_dependents("dao"))
+
+    def test_cycles(self):
+        graph = DependencyGraph({"a": set(["b"]), "b": set(["c"]), "c": set(["a"]), "d": set(["d"]), "e": set(["a"])})
+
+        self.assertEquals([["a", "b", "c", "a"], ["d", "d"]], graph.find_cycles())
+        try:
+            graph.get_creation_order()
+            self.fail("Expected a CyclicDependencyException")
+        except CyclicDependencyException, e:
+            self.assertEquals([["a", "b", "c", "a"], ["d", "d"]], e.cycles)
+            self.assertTrue("a -> b -> c -> a" in str(e))
+
+        self.assertEquals(["e"], graph.get_levels(["a", "b", "c", "d", "e"])[-1])
+
+    def test_deep_chains_do_not_recurse(self):
+        depth = sys.getrecursionlimit() * 2
+        graph = DependencyGraph(dict([("object%d" % i, set(["object%d" % (i + 1)])) for i in range(depth)]))
+
+        self.assertEquals([], graph.find_cycles())
+        self.assertEquals("object%d" % depth, graph.get_creation_order(["object0"])[0])
+        levels = graph.get_levels(["object%d" % i for i in range(depth + 1)])
+        self.assertEquals(depth + 1, len(levels))
+        self.assertEquals(["object%d" % depth], levels[0])
+        self.assertEquals(["object0"], levels[-1])
+
+    def test_to_dot(self):
+        graph = DependencyGraph({"service": set(["dao"])})
+        self.assertEquals('digraph "objects" {\n    "dao";\n    "service";\n    "service" -> "dao";\n}', graph.to_dot())
+
+    def test_containers_reject_cycles(self):
+        class CyclicConfig(object):
+            def read_object_defs(config):
+                return [self._get_object_def("a", "b"), self._get_object_def("b", "a", lazy_init=True)]
+
+        self.assertRaises(CyclicDependencyException, ApplicationContext, CyclicConfig())
+        self.assertRaises(CyclicDependencyException, ApplicationContext, CyclicConfig(), parallel_startup=True)
+
+        # A lazy proxy breaks the cycle, as it creates nothing until it's used.
+        ctx = ApplicationContext(CyclicConfig(), lazy_proxies=True)
+        self.assertTrue(ctx.get_object("a").ref0.ref0 is ctx.get_object("a"))
+
+    def test_graph_follows_definition_changes(self):
+        class ChainConfig(object):
+            def read_object_defs(config):
+                return [self._get_object_def("a", "b", lazy_init=True), self._get_object_def("b", lazy_init=True)]
+
+        ctx = ApplicationContext(ChainConfig())
+        self.assertEquals(set(["b"]), ctx.dependency_graph.dependencies["a"])
+
+        ctx.object_defs["b"] = self._get_object_def("b", "c", lazy_init=True)
+        ctx.object_defs["c"] = self._get_object_def("c", "a", lazy_init=True)
+        self.assertRaises(CyclicDependencyException, ctx.get_object, "a")
+        self.assertEquals([["a", "b", "c", "a"]], ctx.dependency_graph.find_cycles())
+
+        ctx.object_defs = {"a": self._get_object_def("a", lazy_init=True)}
+        self.assertEquals([], ctx.dependency_graph.find_cycles())
+        self.assertFalse(hasattr(ctx.get_object("a"), "ref0"))
+
+    def test_cycles_are_only_rejected_when_requested(self):
+        class LazyCyclicConfig(object):
+            def read_object_defs(config):
+                return [self._get_object_def("a", "b", lazy_init=True), self._get_object_def("b", "a", lazy_init=True),
+                        self._get_object_def("c", "a", scope=PROTOTYPE, lazy_init=True), self._get_object_def("d")]
+
+        ctx = ApplicationContext(LazyCyclicConfig())
+        self.assertEquals(["d"], ctx.objects.keys())
+
+        for name in ["a", "b", "c"]:
+            try:
+                ctx.get_object(name)
+                self.fail("Expected a CyclicDependencyException")
+            except CyclicDependencyException, e:
+                self.assertEquals([["a", "b", "a"]], e.cycles)
+
+        self.assertTrue(ctx.dependency_graph.depends_on_cycle("c"))
+        self.assertFalse(ctx.dependency_graph.depends_on_cycle("d"))
+        self.assertEquals([], ctx.dependency_graph.find_cycles(["d"]))
+
+    def test_lazy_references_are_left_out_of_graph(self):
+        ctx = ApplicationContext(XMLConfig("support/contextLazyProxies.xml"))
+        self.assertEquals(set(["reportGenerator"]), ctx.dependency_graph.dependencies["service"])
+        ctx = ApplicationContext(XMLConfig("support/contextLazyProxies.xml"), lazy_proxies=True)
+        self.assertEquals(set(), ctx.dependency_graph.dependencies["service"])
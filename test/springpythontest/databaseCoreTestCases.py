@@ -13,21 +13,31 @@
    See the License for the specific language governing permissions and
    limitations under the License.       
 """
+import array
+import gc
 import logging
 import os
 import sys
+import time
 import types
+import tempfile
 import unittest
+import threading
 from pmock import *
 from springpython.config import XMLConfig
 from springpython.context import ApplicationContext
 from springpython.database import ArgumentMustBeNamed
 from springpython.database import DataAccessException
 from springpython.database import InvalidArgumentType
+from springpython.database import PoolExhaustedException
+from springpython.database import core
 from springpython.database.core import DatabaseTemplate
 from springpython.database.core import DictionaryRowMapper
 from springpython.database.core import SimpleRowMapper
 from springpython.database import factory
+from springpython.database.transaction import ConnectionFactoryTransactionManager
+from springpython.database.transaction import TransactionCallbackWithoutResult
+from springpython.database.transaction import TransactionTemplate
 from springpythontest.support import testSupportClasses
 
 logger = logging.getLogger("springpythontest.databaseCoreTestCases")
@@ -167,6 +177,120 @@ class ConnectionFactoryTestCase(MockTestCase):
 
         del(sys.modules["cx_Oracle"])
 
+class StatementCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.factory = factory.Sqlite3ConnectionFactory(":memory:")
+
+    def testConvertedStatementsAreCached(self):
+        self.assertEquals("SELECT * FROM animal WHERE name = ?", self.factory.get_statement("SELECT * FROM animal WHERE name = %s"))
+        self.assertEquals("SELECT * FROM animal WHERE name = ?", self.factory.get_statement("SELECT * FROM animal WHERE name = %s"))
+        stats = self.factory.statement_cache_stats()
+        self.assertEquals((1, 1, 0.5), (stats["hits"], stats["misses"], stats["hit_rate"]))
+
+    def testCacheIsBounded(self):
+        self.factory.statement_cache_size = "2"
+        for sql in ["SELECT 1", "SELECT 2", "SELECT 3", "SELECT 1"]:
+            self.factory.get_statement(sql)
+        stats = self.factory.statement_cache_stats()
+        self.assertEquals((0, 4, 2, 2), (stats["hits"], stats["misses"], stats["evictions"], stats["size"]))
+
+    def testDatabaseTemplateUsesTheCache(self):
+        databaseTemplate = DatabaseTemplate(self.factory)
+        databaseTemplate.execute("CREATE TABLE animal (name VARCHAR(11))")
+        databaseTemplate.batch_update("INSERT INTO animal (name) VALUES (%s)", [("snake",), ("racoon",)])
+        for i in range(3):
+            self.assertEquals(1, databaseTemplate.query_for_int("SELECT count(*) FROM animal WHERE name = %s", ("snake",)))
+        self.assertEquals(2, self.factory.statement_cache_stats()["hits"])
+
+    def testPooledFactoriesShareTheCacheOfTheirFactory(self):
+        pool = factory.PooledConnectionFactory(self.factory)
+        self.assertEquals("SELECT ?", pool.get_statement("SELECT %s"))
+        self.assertEquals("SELECT ?", self.factory.get_statement("SELECT %s"))
+        self.assertEquals(1, pool.statement_cache_stats()["hits"])
+
+    def testFactoriesWhichSkipTheBaseConstructorStillWork(self):
+        class CustomConnectionFactory(factory.ConnectionFactory):
+            def __init__(self):
+                self.acceptable_types = [types.TupleType]
+                self.connection = self.connect()
+            def connect(self):
+                import sqlite3
+                return sqlite3.connect(":memory:", check_same_thread=False)
+            def getConnection(self):
+                return self.connection
+            def in_transaction(self):
+                return True
+            def close(self):
+                pass
+            def convert_sql_binding(self, sql_query):
+                return sql_query
+        custom = CustomConnectionFactory()
+        self.assertEquals(1, DatabaseTemplate(custom).query_for_int("SELECT ?", (1,)))
+        self.assertEquals(1, DatabaseTemplate(factory.PooledConnectionFactory(CustomConnectionFactory())).query_for_int("SELECT 1"))
+        self.assertEquals(256, custom.statement_cache_size)
+
+class ColumnResultSetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.databaseTemplate = DatabaseTemplate(factory.Sqlite3ConnectionFactory(":memory:"))
+        self.databaseTemplate.execute("CREATE TABLE animal (name VARCHAR(11), population INTEGER, weight REAL, legs INTEGER)")
+        self.databaseTemplate.batch_update("INSERT INTO animal VALUES (?, ?, ?, ?)",
+            [("snake", 1, 2.5, 0), ("racoon", 2, 7.0, 4), ("spider", 300, 0.01, 8), ("mermaid", 0, 60.0, None)])
+
+    def testNumericColumnsAreArrays(self):
+        results = self.databaseTemplate.query_for_columns("SELECT * FROM animal ORDER BY population", fetch_size=2)
+        self.assertEquals(4, len(results))
+        self.assertEquals(["name", "population", "weight", "legs"], results.names)
+        self.assertEquals([u"mermaid", u"snake", u"racoon", u"spider"], results["name"])
+        self.assertEquals(array.array("l", [0, 1, 2, 300]), results["population"])
+        self.assertEquals(array.array("d", [60.0, 2.5, 7.0, 0.01]), results[2])
+        self.assertEquals([None, 0, 4, 8], results["legs"])
+        self.assertEquals((u"snake", 1, 2.5, 0), list(results.rows())[1])
+        self.assertEquals(sorted(results.names), sorted(results.as_dict().keys()))
+
+    def testColumnsFallBackToListsWhenValuesDoNotFit(self):
+        self.databaseTemplate.execute("INSERT INTO animal VALUES ('amoeba', 0.5, 1, 0)")
+        results = self.databaseTemplate.query_for_columns("SELECT population, legs FROM animal WHERE legs IS NOT NULL", fetch_size=1)
+        self.assertEquals([1, 2, 300, 0.5], results["population"])
+        self.assertEquals(array.array("l", [0, 4, 8, 0]), results["legs"])
+
+    def testLongColumnsAreArrays(self):
+        column = core._extend_column(None, [1L, 2L])
+        column = core._extend_column(column, [3, 4L])
+        self.assertEquals(array.array("l", [1, 2, 3, 4]), column)
+        column = core._extend_column(column, [5L, 2L**70])
+        self.assertEquals([1, 2, 3, 4, 5, 2L**70], column)
+        self.assertEquals([2L**70, 1L], core._extend_column(None, [2L**70, 1L]))
+
+    def testEmptyResults(self):
+        results = self.databaseTemplate.query_for_columns("SELECT name, population FROM animal WHERE name = ?", ("unicorn",))
+        self.assertEquals(0, len(results))
+        self.assertEquals([[], []], results.columns)
+
+    def testNumpyArrays(self):
+        if core.numpy is None:
+            self.assertRaises(ImportError, self.databaseTemplate.query_for_columns, "SELECT population FROM animal", use_numpy=True)
+            return
+        results = self.databaseTemplate.query_for_columns("SELECT population, weight FROM animal", use_numpy=True)
+        self.assertEquals(303, results["population"].sum())
+        self.assertEquals(core.numpy.float64, results["weight"].dtype)
+
+    def testNumpyArraysAreBuiltFromColumnBuffers(self):
+        class FakeNumpy(object):
+            def dtype(self, typecode):
+                return "dtype " + typecode
+            def frombuffer(self, buffer, dtype):
+                return (dtype, buffer.tolist())
+        real_numpy = core.numpy
+        core.numpy = FakeNumpy()
+        try:
+            results = self.databaseTemplate.query_for_columns("SELECT name, population, weight, legs FROM animal ORDER BY population", use_numpy=True)
+        finally:
+            core.numpy = real_numpy
+        self.assertEquals([u"mermaid", u"snake", u"racoon", u"spider"], results["name"])
+        self.assertEquals(("dtype l", [0, 1, 2, 300]), results["population"])
+        self.assertEquals(("dtype d", [60.0, 2.5, 7.0, 0.01]), results["weight"])
+        self.assertEquals([None, 0, 4, 8], results["legs"])
+
 class DatabaseTemplateMockTestCase(MockTestCase):
     """Testing the DatabaseTemplate utilizes stubbing and mocking, in order to isolate from different
     vendor implementations. This reduces the overhead in making changes to core functionality."""
@@ -423,6 +547,274 @@ class DatabaseTemplateMockTestCase(MockTestCase):
         name = self.databaseTemplate.query_for_object("select name from animal where name = 'cottonmouth'", required_type=types.StringType)
         self.assertEquals(name, "cottonmouth")
 
+class PooledConnectionFactoryTestCase(unittest.TestCase):
+    def setUp(self):
+        handle, self.db_filename = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        self.factory = factory.PooledConnectionFactory(factory.Sqlite3ConnectionFactory(self.db_filename, check_same_thread=False),
+                                                       min_size=1, max_size=2, checkout_timeout=0.1)
+        dt = DatabaseTemplate(self.factory)
+        dt.execute("CREATE TABLE animal (name VARCHAR(11), category VARCHAR(20), population integer)")
+        self.factory.commit()
+
+    def tearDown(self):
+        self.factory.shutdown()
+        os.remove(self.db_filename)
+
+    def _in_thread(self, func):
+        results = []
+        def run():
+            try:
+                results.append(func())
+            except Exception, e:
+                results.append(e)
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        return results[0]
+
+    def _query_and_commit(self):
+        results = DatabaseTemplate(self.factory).query_for_list("SELECT * FROM animal")
+        self.factory.commit()
+        return results
+
+    def testEachThreadHasAConnectionOfItsOwn(self):
+        connection = self.factory.getConnection()
+        self.assertTrue(connection is self.factory.getConnection())
+        self.assertFalse(connection is self._in_thread(self.factory.getConnection))
+
+        self.factory.commit()
+        self.assertTrue(connection is self.factory.getConnection())
+        self.assertEquals(2, self.factory.stats()["size"])
+
+    def testCheckoutTimesOutWhenThePoolIsExhausted(self):
+        self.factory.getConnection()
+        held = threading.Event()
+        done = threading.Event()
+        def hold():
+            self.factory.getConnection()
+            held.set()
+            done.wait()
+        thread = threading.Thread(target=hold)
+        thread.start()
+        held.wait()
+        try:
+            self.assertTrue(isinstance(self._in_thread(self.factory.getConnection), PoolExhaustedException))
+            self.assertEquals(1, self.factory.stats()["timeouts"])
+        finally:
+            done.set()
+            thread.join()
+
+        self.factory.checkout_timeout = "5"
+        self.assertFalse(isinstance(self._in_thread(self.factory.getConnection), PoolExhaustedException))
+        self.assertEquals(1, self.factory.stats()["reclaimed"])
+
+    def testWaitingThreadGetsReleasedConnection(self):
+        self.factory.checkout_timeout = None
+        self.factory.max_size = "1"
+        connection = self.factory.getConnection()
+        results = []
+        thread = threading.Thread(target=lambda: results.append(self.factory.getConnection()))
+        thread.start()
+        time.sleep(0.05)
+        self.assertEquals([], results)
+        self.factory.rollback()
+        thread.join()
+        self.assertTrue(results[0] is connection)
+        self.assertEquals(1, self.factory.stats()["waits"])
+
+    def testBrokenConnectionsAreReplacedOnBorrow(self):
+        self.factory.validation_query = "SELECT 1"
+        connection = self.factory.getConnection()
+        self.factory.release()
+        connection.close()
+
+        self.assertFalse(connection is self.factory.getConnection())
+        self.assertEquals(1, self.factory.stats()["validation_failures"])
+        self.assertEquals([], DatabaseTemplate(self.factory).query_for_list("SELECT * FROM animal"))
+
+    def testIdleConnectionsAreEvicted(self):
+        self.factory.min_size = 0
+        self.factory.max_idle_time = "0.01"
+        self.factory.getConnection()
+        self._in_thread(lambda: (self.factory.getConnection(), self.factory.release()))
+        self.factory.commit()
+        time.sleep(0.02)
+        self.factory.getConnection()
+        stats = self.factory.stats()
+        self.assertTrue(stats["idle_evictions"] >= 1)
+        self.assertEquals(1, stats["size"])
+
+    def testTransactionsRunOnOneConnectionPerThread(self):
+        tx_manager = ConnectionFactoryTransactionManager(self.factory)
+        dt = DatabaseTemplate(self.factory)
+
+        class InsertAnimal(TransactionCallbackWithoutResult):
+            def do_in_tx_without_result(s, status):
+                dt.execute("INSERT INTO animal (name, category, population) VALUES ('snake', 'reptile', 1)")
+                self.assertEquals(1, len(tx_manager.status))
+                self.assertEquals(0, self._in_thread(lambda: len(tx_manager.status)))
+                self.assertEquals([], self._in_thread(self._query_and_commit))
+
+        TransactionTemplate(tx_manager).execute(InsertAnimal())
+        self.assertEquals(0, self.factory.stats()["checked_out"])
+        self.assertEquals([(u"snake", u"reptile", 1)], self._in_thread(self._query_and_commit))
+
+    def testTemplateOperationsOutsideTransactionsGiveConnectionsBack(self):
+        dt = DatabaseTemplate(self.factory)
+        dt.execute("INSERT INTO animal (name, category, population) VALUES ('snake', 'reptile', 1)")
+        self.assertEquals(0, self.factory.stats()["checked_out"])
+
+        # More long-lived workers than connections, each running several operations.
+        done = threading.Event()
+        results = []
+        def work():
+            try:
+                for i in range(3):
+                    results.append(len(dt.query_for_list("SELECT * FROM animal")))
+                    results.append(len(list(dt.query_for_iter("SELECT * FROM animal"))))
+            except Exception, e:
+                results.append(e)
+            done.wait(5)
+        workers = [threading.Thread(target=work) for i in range(4)]
+        for worker in workers:
+            worker.start()
+        try:
+            while len(results) < 24 and not [result for result in results if isinstance(result, Exception)]:
+                time.sleep(0.01)
+            self.assertEquals([1] * 24, results)
+            self.assertEquals(0, self.factory.stats()["checked_out"])
+        finally:
+            done.set()
+            for worker in workers:
+                worker.join()
+
+    def testOpenIteratorsKeepTheirConnection(self):
+        dt = DatabaseTemplate(self.factory)
+        dt.batch_update("INSERT INTO animal (name, category, population) VALUES (?, ?, ?)",
+                        [("snake", "reptile", 1), ("racoon", "mammal", 2), ("spider", "insect", 300)])
+        connection = self.factory.getConnection()
+        self.factory.release()
+
+        rows = dt.query_for_iter("SELECT name FROM animal ORDER BY population", fetch_size=1)
+        self.assertEquals((u"snake",), rows.next())
+        self.assertEquals(3, len(dt.query_for_list("SELECT * FROM animal")))
+        DatabaseTemplate(self.factory).__del__()
+        self.assertEquals(1, self.factory.stats()["checked_out"])
+        self.assertFalse(connection is self._in_thread(lambda: (self.factory.getConnection(), self.factory.release())[0]))
+        self.assertEquals([(u"racoon",), (u"spider",)], list(rows))
+        self.assertEquals(0, self.factory.stats()["checked_out"])
+
+        dt.query_for_iter("SELECT name FROM animal").close()
+        self.assertEquals(0, self.factory.stats()["checked_out"])
+
+    def testTransactionsAreTrackedByThePool(self):
+        class OracleLikeConnectionFactory(factory.Sqlite3ConnectionFactory):
+            def in_transaction(self):
+                raise NotImplementedError()
+        self.factory.connection_factory = OracleLikeConnectionFactory(self.db_filename, check_same_thread=False)
+        tx_manager = ConnectionFactoryTransactionManager(self.factory)
+        dt = DatabaseTemplate(self.factory)
+
+        class InsertAnimal(TransactionCallbackWithoutResult):
+            def do_in_tx_without_result(s, status):
+                self.assertTrue(self.factory.in_transaction())
+                dt.execute("INSERT INTO animal (name, category, population) VALUES ('snake', 'reptile', 1)")
+                self.assertEquals([], self._in_thread(self._query_and_commit))
+
+        self.assertFalse(self.factory.in_transaction())
+        TransactionTemplate(tx_manager).execute(InsertAnimal())
+        self.assertFalse(self.factory.in_transaction())
+        self.assertEquals(1, len(dt.query_for_list("SELECT * FROM animal")))
+        self.assertEquals(0, self.factory.stats()["checked_out"])
+
+    def testClosingDoesNotTouchActiveTransactions(self):
+        tx_manager = ConnectionFactoryTransactionManager(self.factory)
+
+        class InsertAnimal(TransactionCallbackWithoutResult):
+            def do_in_tx_without_result(s, status):
+                dt = DatabaseTemplate(self.factory)
+                dt.execute("INSERT INTO animal (name, category, population) VALUES ('snake', 'reptile', 1)")
+                self.assertEquals(1, self.factory.stats()["checked_out"])
+
+                # A short-lived template being collected closes the factory.
+                DatabaseTemplate(self.factory).__del__()
+                self.assertEquals(1, self.factory.stats()["checked_out"])
+                dt.execute("INSERT INTO animal (name, category, population) VALUES ('lizard', 'reptile', 2)")
+
+        TransactionTemplate(tx_manager).execute(InsertAnimal())
+        self.assertEquals(0, self.factory.stats()["checked_out"])
+        self.assertEquals(2, len(self._in_thread(self._query_and_commit)))
+
+class RecordingCursor(object):
+    description = [("name", None, None, None, None, None, None)]
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.fetch_sizes = []
+        self.closed = False
+
+    def execute(self, sql, args=None):
+        pass
+
+    def fetchmany(self, size):
+        self.fetch_sizes.append(size)
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        self.closed = True
+
+class RecordingConnectionFactory(factory.ConnectionFactory):
+    def __init__(self, cursor):
+        factory.ConnectionFactory.__init__(self, [types.TupleType])
+        self.recorded_cursor = cursor
+
+    def getConnection(self):
+        return self
+
+    def cursor(self):
+        return self.recorded_cursor
+
+    def close(self):
+        pass
+
+class QueryIterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cursor = RecordingCursor([("row %d" % i,) for i in range(5)])
+        self.databaseTemplate = DatabaseTemplate(RecordingConnectionFactory(self.cursor))
+        self.databaseTemplate.fetch_size = "2"
+
+    def testRowsAreFetchedInBatchesAndMappedLazily(self):
+        rows = self.databaseTemplate.query_iter("SELECT name FROM animal", rowhandler=DictionaryRowMapper())
+        self.assertEquals([], self.cursor.fetch_sizes)
+        self.assertEquals({"name": "row 0"}, rows.next())
+        self.assertEquals([2], self.cursor.fetch_sizes)
+        self.assertEquals(["row 1", "row 2", "row 3", "row 4"], [row["name"] for row in rows])
+        self.assertEquals([2, 2, 2, 2], self.cursor.fetch_sizes)
+        self.assertTrue(self.cursor.closed)
+
+    def testClosingTheIteratorClosesTheCursor(self):
+        rows = self.databaseTemplate.query_for_iter("SELECT name FROM animal", fetch_size=3)
+        self.assertEquals(("row 0",), rows.next())
+        self.assertFalse(self.cursor.closed)
+        rows.close()
+        self.assertTrue(self.cursor.closed)
+        self.assertEquals([3], self.cursor.fetch_sizes)
+        self.assertRaises(StopIteration, rows.next)
+
+    def testClosingAnUnstartedIteratorClosesTheCursor(self):
+        rows = self.databaseTemplate.query_iter("SELECT name FROM animal", rowhandler=DictionaryRowMapper())
+        rows.close()
+        self.assertTrue(self.cursor.closed)
+        self.assertEquals([], self.cursor.fetch_sizes)
+        self.assertEquals([], list(rows))
+
+    def testDroppingAnUnstartedIteratorClosesTheCursor(self):
+        self.databaseTemplate.query_for_iter("SELECT name FROM animal")
+        gc.collect()
+        self.assertTrue(self.cursor.closed)
+
 class AbstractDatabaseTemplateTestCase(unittest.TestCase):
     def __init__(self, methodName='runTest'):
         unittest.TestCase.__init__(self, methodName)
@@ -529,6 +921,19 @@ class AbstractDatabaseTemplateTestCase(unittest.TestCase):
         self.assertRaises(InvalidArgumentType, self.databaseTemplate.query_for_list, "select * from animal where name = %s", "snake")
         self.assertRaises(InvalidArgumentType, self.databaseTemplate.query_for_list, "select * from animal where name = ?", "snake")
 
+    def testProgrammaticQueryIter(self):
+        self.assertRaises(ArgumentMustBeNamed, self.databaseTemplate.query_iter, "select * from animal", testSupportClasses.AnimalRowMapper())
+
+        animals = self.databaseTemplate.query_iter("select name, category from animal where population = ?", (1,),
+                                                   testSupportClasses.AnimalRowMapper(), fetch_size=2)
+        self.assertEquals(["snake", "black mamba", "cottonmouth"], [animal.name for animal in animals])
+
+    def testProgrammaticQueryForIter(self):
+        rows = self.databaseTemplate.query_for_iter("select name from animal", fetch_size=1)
+        self.assertEquals([row[0] for row in self.databaseTemplate.query_for_list("select name from animal")],
+                          [row[0] for row in rows])
+        self.assertRaises(DataAccessException, self.databaseTemplate.query_for_iter, "select * from no_such_table")
+
     def testProgrammaticStaticQueryForInt(self):
         count = self.databaseTemplate.query_for_int("select population from animal where name = 'snake'")
         self.assertEquals(count, 1)
@@ -584,6 +989,19 @@ class AbstractDatabaseTemplateTestCase(unittest.TestCase):
         name = self.databaseTemplate.query_for_object("SELECT name FROM animal WHERE category = 'reptile'", required_type=types.StringType)
         self.assertEquals(name, "coily")
 
+    def testProgrammaticBatchUpdate(self):
+        animals = [("lion", "mammal", i) for i in range(5)]
+        self.assertEquals([2, 2, 1], self.databaseTemplate.batch_update(
+            "INSERT INTO animal (name, category, population) VALUES (?, ?, ?)", animals, batch_size=2))
+        self.assertEquals(5, self.databaseTemplate.query_for_int("select count(*) from animal where name = 'lion'"))
+
+        self.assertEquals([2], self.databaseTemplate.batch_update("UPDATE animal SET population = %s WHERE name = %s",
+                                                                  iter([(10, "snake"), (10, "racoon")])))
+        self.assertEquals(10, self.databaseTemplate.query_for_int("select population from animal where name = 'racoon'"))
+
+        self.assertRaises(InvalidArgumentType, self.databaseTemplate.batch_update, "UPDATE animal SET population = ?", [5])
+        self.assertRaises(DataAccessException, self.databaseTemplate.batch_update, "UPDATE no_such_table SET population = ?", [(5,)])
+
     def testProgrammaticStaticInsert(self):
         self.databaseTemplate.execute("DELETE FROM animal")
         rows = self.databaseTemplate.execute("INSERT INTO animal (name, category, population) VALUES ('black mamba', 'kill_bill_viper', 1)")
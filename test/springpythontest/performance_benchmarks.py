@@ -0,0 +1,318 @@
+"""
+   Copyright 2006-2008 SpringSource (http://springsource.com), All Rights Reserved
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+#############################################################
+# This stand-alone utility runs micro-benchmarks of Spring
+# Python's hot paths. It isn't part of the test suite.
+#
+# Usage (from this directory, with ../../src on PYTHONPATH):
+#
+#   python performance_benchmarks.py            - runs all
+#   python performance_benchmarks.py prototypes - runs one
+#   python performance_benchmarks.py aop
+#   python performance_benchmarks.py logging
+#   python performance_benchmarks.py batch
+#   python performance_benchmarks.py columns
+#############################################################
+
+import sys
+import copy
+import time
+import logging
+
+from springpython.aop import AopProxy, ClassProxyFactory, FinalInterceptor, MethodInterceptor, MethodInvocation, ProxyFactory
+from springpython.aop import RegexpMethodPointcutAdvisor
+from springpython.config import _python_config
+from springpython.config import ObjectDef, PythonConfig, Object
+from springpython.config import ReferenceDef, ValueDef
+from springpython.container import ObjectContainer
+from springpython.context import ApplicationContext
+from springpython.context.scope import PROTOTYPE
+from springpython.database.core import DatabaseTemplate, DictionaryRowMapper
+from springpython.database.factory import Sqlite3ConnectionFactory
+from springpython.factory import ReflectiveObjectFactory
+
+def measure(func, iterations):
+    """Returns the number of calls of func per second."""
+    start = time.time()
+    for i in xrange(iterations):
+        func()
+    return iterations / (time.time() - start)
+
+def report(title, results, unit="calls"):
+    print title
+    for label, rate in results:
+        print "    %-45s %12.0f %s/s" % (label, rate, unit)
+    print
+
+class UncompiledObjectContainer(ObjectContainer):
+    """Creates objects by walking their definitions on every call, like containers did
+    before definitions were compiled into creation plans."""
+
+    def _create_object(self, object_def):
+        [constr.prefetch(self) for constr in object_def.pos_constr if hasattr(constr, "prefetch")]
+        [constr.prefetch(self) for constr in object_def.named_constr.values() if hasattr(constr, "prefetch")]
+        [prop.prefetch(self) for prop in object_def.props if hasattr(prop, "prefetch")]
+
+        pos_constr = tuple([constr.get_value(self) for constr in object_def.pos_constr
+                            if hasattr(constr, "get_value")])
+        named_constr = dict([(key, object_def.named_constr[key].get_value(self)) for key in object_def.named_constr
+                             if hasattr(object_def.named_constr[key], "get_value")])
+        obj = object_def.factory.create_object(pos_constr, named_constr)
+
+        [prop.set_value(obj, self) for prop in object_def.props if hasattr(prop, "set_value")]
+        return obj
+
+class RequestHandler(object):
+    def __init__(self, name=None, timeout=None, service=None):
+        self.name = name
+        self.timeout = timeout
+        self.service = service
+
+class Service(object):
+    pass
+
+def _fill_prototype_container(container):
+    container.object_defs["service"] = ObjectDef(id="service",
+        factory=ReflectiveObjectFactory("performance_benchmarks.Service"))
+
+    handler_def = ObjectDef(id="handler", scope=PROTOTYPE,
+        factory=ReflectiveObjectFactory("performance_benchmarks.RequestHandler"))
+    handler_def.pos_constr = [ValueDef("handler.constr", "handler")]
+    handler_def.named_constr = {"timeout": ValueDef("timeout", 30)}
+    handler_def.props = [ReferenceDef("service", "service"), ValueDef("retries", 3), ValueDef("verbose", False)]
+    container.object_defs["handler"] = handler_def
+
+    return container
+
+def bench_prototypes(iterations=50000):
+    """Throughput of creating a prototype with constant and reference arguments."""
+    uncompiled = _fill_prototype_container(UncompiledObjectContainer())
+    compiled = _fill_prototype_container(ObjectContainer())
+
+    report("Prototype creation", [
+        ("uncompiled definition walk", measure(lambda: uncompiled.get_object("handler"), iterations)),
+        ("compiled creation plan", measure(lambda: compiled.get_object("handler"), iterations)),
+    ])
+
+class UncompiledMethodInvocation(MethodInvocation):
+    """Copies the interceptors and walks them with a generator on every call, like method
+    invocations did before AOP proxies compiled their dispatchers."""
+
+    def __init__(self, instance, method_name, args, kwargs, interceptors):
+        self.instance = instance
+        self.method_name = method_name
+        self.args = args
+        self.kwargs = kwargs
+        self.intercept_stack = copy.copy(interceptors)
+        self.intercept_stack.append(FinalInterceptor())
+        self.logger = logging.getLogger("springpython.aop.MethodInvocation")
+
+    def __getattr__(self, name):
+        self.iterator = iter(self.intercept_stack)
+        self.method_name = name
+        return self
+
+    def proceed(self):
+        interceptor = self.iterator.next()
+        self.logger.debug("Calling %s.%s(%s, %s)" % (interceptor.__class__.__name__, self.method_name, self.args, self.kwargs))
+        return interceptor.invoke(self)
+
+class UncompiledAopProxy(AopProxy):
+    """Builds a new dispatch closure and method invocation on every call."""
+
+    def __getattr__(self, name):
+        if name in ["target", "interceptors", "method_name"]:
+            return self.__dict__[name]
+        attr = getattr(self.target, name)
+        if not callable(attr):
+            return attr
+
+        def dispatch(*args, **kwargs):
+            invocation = UncompiledMethodInvocation(self.target, name, args, kwargs, self.interceptors)
+            return invocation.__getattr__(name)(*args, **kwargs)
+
+        return dispatch
+
+class Calculator(object):
+    def add(self, a, b):
+        return a + b
+
+class PassThroughInterceptor(MethodInterceptor):
+    def invoke(self, invocation):
+        return invocation.proceed()
+
+def bench_aop(iterations=20000):
+    """Overhead of calling a method through an AOP proxy, compared with calling it directly."""
+    target = Calculator()
+    results = [("raw call", measure(lambda: target.add(1, 2), iterations))]
+
+    for count in (0, 1, 5):
+        interceptors = [PassThroughInterceptor() for i in range(count)]
+        uncompiled = UncompiledAopProxy(target, interceptors)
+        compiled = ProxyFactory(target, interceptors).getProxy()
+        generated = ClassProxyFactory(target, interceptors).getProxy()
+        results.append(("%d interceptor(s), uncompiled dispatch" % count, measure(lambda: uncompiled.add(1, 2), iterations)))
+        results.append(("%d interceptor(s), compiled dispatch" % count, measure(lambda: compiled.add(1, 2), iterations)))
+        results.append(("%d interceptor(s), generated proxy class" % count, measure(lambda: generated.add(1, 2), iterations)))
+
+    report("AOP proxied calls", results)
+
+class EagerLoggingMethodInvocation(MethodInvocation):
+    """Formats its debug message on every call, whether or not it gets logged."""
+
+    def proceed(self):
+        interceptor = self.intercept_stack[self.position]
+        self.position += 1
+        self.logger.debug("Calling %s.%s(%s, %s)" % (interceptor.__class__.__name__, self.method_name, self.args, self.kwargs))
+        return interceptor.invoke(self)
+
+class EagerLoggingAdvisor(RegexpMethodPointcutAdvisor):
+    """Formats its debug messages and walks the interceptor stack on every call."""
+
+    def invoke(self, invocation):
+        if self.matches_method_and_target(invocation.method_name, invocation.instance.__class__.__name__, invocation.args):
+            invocation.intercept_stack[1:1] = self.advice
+            self.logger.debug("We have a match, passing through to the advice.")
+            invocation.dump_interceptors(logging.DEBUG)
+            return invocation.proceed()
+        self.logger.debug("No match, bypassing advice, going straight to targetClass.")
+        return getattr(invocation.instance, invocation.method_name)(*invocation.args, **invocation.kwargs)
+
+class EagerLoggingObjectContainer(ObjectContainer):
+    """Formats its debug messages on every lookup which misses the singleton storage."""
+
+    def get_object(self, name, ignore_abstract=False):
+        if name not in self.objects:
+            self.logger.debug("Did NOT find object '%s' in the singleton storage." % name)
+        return ObjectContainer.get_object(self, name, ignore_abstract)
+
+    def _create_object(self, object_def):
+        self.logger.debug("Creating an instance of %s" % object_def)
+        return ObjectContainer._create_object(self, object_def)
+
+def eager_logging_object_wrapper(f, scope, parent, log_func_name, *args, **kwargs):
+    """Gets a logger named after the function and its arguments, and formats its debug
+    messages, on every call of a PythonConfig @Object method."""
+    log = logging.getLogger("springpython.config.%s%s - %s%s" % (log_func_name, f, str(args), scope))
+    log.debug("This is NOT the top-level object %s, deferring to container." % f.func_name)
+    container = _python_config._object_context[args]["container"]
+    log.debug("Container = %s" % container)
+    results = container.get_object(f.func_name)
+    log.debug("Found %s inside the container" % results)
+    return results
+
+class HandlerConfig(PythonConfig):
+    @Object
+    def service(self):
+        return Service()
+
+    @Object(PROTOTYPE)
+    def handler(self):
+        return RequestHandler("handler", 30, self.service())
+
+def bench_logging(iterations=20000):
+    """Cost of debug logging on hot paths while it is disabled, eagerly formatted or guarded."""
+    logging.getLogger("springpython").setLevel(logging.WARNING)
+    target = Calculator()
+
+    results = []
+    for label, advisor_class, invocation_class in [("eager", EagerLoggingAdvisor, EagerLoggingMethodInvocation),
+                                                   ("guarded", RegexpMethodPointcutAdvisor, MethodInvocation)]:
+        advisor = advisor_class(advice=[PassThroughInterceptor()], patterns=[".*add"])
+        proxy = ProxyFactory(target, [advisor]).getProxy()
+        original = sys.modules["springpython.aop"].MethodInvocation
+        sys.modules["springpython.aop"].MethodInvocation = invocation_class
+        try:
+            proxy.reset_dispatchers()
+            results.append(("advised proxied call, %s logging" % label, measure(lambda: proxy.add(1, 2), iterations)))
+        finally:
+            sys.modules["springpython.aop"].MethodInvocation = original
+
+    eager = _fill_prototype_container(EagerLoggingObjectContainer())
+    guarded = _fill_prototype_container(ObjectContainer())
+    results.append(("prototype lookup, eager logging", measure(lambda: eager.get_object("handler"), iterations)))
+    results.append(("prototype lookup, guarded logging", measure(lambda: guarded.get_object("handler"), iterations)))
+
+    config = HandlerConfig()
+    context = ApplicationContext(config)
+    context.get_object("handler")
+    original = _python_config._object_wrapper
+    _python_config._object_wrapper = eager_logging_object_wrapper
+    try:
+        results.append(("singleton @Object call, eager logging", measure(config.service, iterations)))
+    finally:
+        _python_config._object_wrapper = original
+    results.append(("singleton @Object call, guarded logging", measure(config.service, iterations)))
+
+    report("Debug logging disabled", results)
+
+def bench_batch(rows=20000):
+    """Rows inserted per second into an in-memory sqlite3 table, one update() per row or with batch_update()."""
+    args = [("animal %d" % i, "mammal", i) for i in xrange(rows)]
+    sql = "INSERT INTO animal (name, category, population) VALUES (?, ?, ?)"
+
+    def run(insert):
+        factory = Sqlite3ConnectionFactory(":memory:")
+        template = DatabaseTemplate(factory)
+        template.execute("CREATE TABLE animal (name VARCHAR(20), category VARCHAR(20), population INTEGER)")
+        start = time.time()
+        insert(template)
+        factory.commit()
+        return rows / (time.time() - start)
+
+    def per_row(template):
+        for row in args:
+            template.update(sql, row)
+
+    report("Bulk inserts (sqlite3, in memory)", [
+        ("update() per row", run(per_row)),
+        ("batch_update(), batches of 1000", run(lambda template: template.batch_update(sql, args))),
+        ("batch_update(), one batch", run(lambda template: template.batch_update(sql, args, batch_size=rows))),
+    ], "rows")
+
+def bench_columns(rows=50000, iterations=5):
+    """Rows read per second from an in-memory sqlite3 table, as dictionaries or column by column, and summed."""
+    factory = Sqlite3ConnectionFactory(":memory:")
+    template = DatabaseTemplate(factory)
+    template.execute("CREATE TABLE sale (region VARCHAR(20), quantity INTEGER, price REAL)")
+    template.batch_update("INSERT INTO sale VALUES (?, ?, ?)", [("region %d" % (i % 10), i % 7, i * 0.5) for i in xrange(rows)])
+    sql = "SELECT region, quantity, price FROM sale"
+
+    def by_row():
+        sales = template.query(sql, rowhandler=DictionaryRowMapper())
+        return sum([sale["quantity"] for sale in sales])
+
+    def by_column():
+        return sum(template.query_for_columns(sql)["quantity"])
+
+    report("Reading a result set (sqlite3, in memory)", [
+        ("query() with DictionaryRowMapper", rows * measure(by_row, iterations)),
+        ("query_for_columns()", rows * measure(by_column, iterations)),
+    ], "rows")
+
+benchmarks = {
+    "prototypes": bench_prototypes,
+    "aop": bench_aop,
+    "logging": bench_logging,
+    "batch": bench_batch,
+    "columns": bench_columns,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or sorted(benchmarks.keys())
+    for name in names:
+        benchmarks[name]()
@@ -16,6 +16,9 @@
 import pickle
 import unittest
 from pmock import *
+from springpython.config import PythonConfig, Object
+from springpython.context import ApplicationContext
+from springpython.context import scope
 from springpython.security import BadCredentialsException
 from springpython.security.context import SecurityContext
 from springpython.security.context import SecurityContextHolder
@@ -231,3 +234,59 @@ class FilterTestCase(MockTestCase):
         self.assertRaises(BadCredentialsException, filterChainProxy, environ, start_response)
         self.assertFalse(SecurityContextHolder.getContext().authentication.isAuthenticated())
         
+
+    def testFilterChainProxyEndsRequestScope(self):
+        class RequestContext(PythonConfig):
+            @Object(scope.REQUEST)
+            def audit_trail(self):
+                return []
+
+        ctx = ApplicationContext(RequestContext())
+        seen = []
+
+        def start_response():
+            pass
+        def application(environ, start_response):
+            ctx.get_object("audit_trail").append(environ["PATH_INFO"])
+            seen.append(ctx.get_object("audit_trail"))
+            return ["Success"]
+
+        filterChainProxy = FilterChainProxy(filterInvocationDefinitionSource=[("/.*", [])])
+        filterChainProxy.application = application
+
+        self.assertEquals(["Success"], filterChainProxy({"PATH_INFO": "/first.html"}, start_response))
+        self.assertEquals(["Success"], filterChainProxy({"PATH_INFO": "/second.html"}, start_response))
+        self.assertEquals([["/first.html"], ["/second.html"]], seen)
+
+    def testFilterChainProxyEndsRequestScopeWhenBodyIsClosed(self):
+        class RequestContext(PythonConfig):
+            @Object(scope.REQUEST)
+            def audit_trail(self):
+                return []
+
+        ctx = ApplicationContext(RequestContext())
+
+        class Body(object):
+            """A body whose parts are only produced while the server iterates over it."""
+            def __iter__(self):
+                for part in ["first", "second"]:
+                    ctx.get_object("audit_trail").append(part)
+                    yield part
+
+        def start_response():
+            pass
+        def application(environ, start_response):
+            ctx.get_object("audit_trail").append("application")
+            return Body()
+
+        filterChainProxy = FilterChainProxy(filterInvocationDefinitionSource=[("/.*", [])])
+        filterChainProxy.application = application
+
+        body = filterChainProxy({"PATH_INFO": "/first.html"}, start_response)
+        audit_trail = ctx.get_object("audit_trail")
+        self.assertEquals(["first", "second"], list(body))
+        self.assertEquals(["application", "first", "second"], audit_trail)
+
+        body.close()
+        self.assertFalse(audit_trail is ctx.get_object("audit_trail"))
+        scope.end_request()
@@ -13,14 +13,17 @@
    See the License for the specific language governing permissions and
    limitations under the License.       
 """
+import time
 import logging
 import types
+import threading
 from pmock import *
 from springpython.aop import MethodInterceptor
 from springpython.config import PythonConfig
 from springpython.config import Object
 from springpython.context import scope
 from springpython.context import ObjectPostProcessor
+from springpython.context import DisposableObject
 from springpython.database.core import DaoSupport
 from springpython.database.core import DatabaseTemplate
 from springpython.database.core import RowMapper
@@ -535,3 +538,111 @@ class Foo(object):
     def __str__(self):
         return "<id=%s %s %s %s %s %s %s %s>" % (hex(id(self)), self.a, self.b,
             self.c, self.d, self.e, self.f, self.g)
+
+class Rendezvous(object):
+    """Lets a fixed number of threads wait for each other, like a barrier."""
+    def __init__(self, parties, timeout=5.0):
+        self.parties = parties
+        self.timeout = timeout
+        self.arrived = 0
+        self.condition = threading.Condition()
+
+    def arrive(self):
+        """Returns True if all parties arrived before the timeout ran out."""
+        self.condition.acquire()
+        try:
+            self.arrived += 1
+            self.condition.notifyAll()
+            deadline = time.time() + self.timeout
+            while self.arrived < self.parties:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return True
+        finally:
+            self.condition.release()
+
+# Tests register a Rendezvous here under the group name their objects are created with.
+rendezvous_points = {}
+
+class SlowStartingObject(object):
+    """Simulates an object which blocks on I/O when created, e.g. a connection factory."""
+    def __init__(self, delay="0.1", dependencies=None, group=None):
+        start = time.time()
+        time.sleep(float(delay))
+        self.met_group = None
+        if group in rendezvous_points:
+            self.met_group = rendezvous_points[group].arrive()
+        self.dependencies = dependencies
+        self.thread_name = threading.currentThread().getName()
+        self.created_in = time.time() - start
+
+class DisposableConnection(DisposableObject):
+    def __init__(self, url=None):
+        self.url = url
+        self.destroyed = False
+
+    def destroy(self):
+        self.destroyed = True
+
+class InitializedConnection(DisposableConnection):
+    """Records the container callbacks it receives."""
+    def __init__(self, url=None):
+        DisposableConnection.__init__(self, url)
+        self.properties_set = False
+        self.app_context = None
+
+    def after_properties_set(self):
+        self.properties_set = True
+
+    def set_app_context(self, app_context):
+        self.app_context = app_context
+
+    def __enter__(self):
+        return self.url
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.destroy()
+        return False
+
+class CountingRepository(object):
+    """Counts how many times each of its methods actually runs."""
+    def __init__(self):
+        self.calls = []
+
+    def load(self, key, default=None):
+        self.calls.append(("load", key))
+        return "value of %s" % key
+
+    def save(self, key, value):
+        self.calls.append(("save", key))
+
+    def fail(self, key):
+        self.calls.append(("fail", key))
+        raise KeyError(key)
+
+class SlowUserRepository(object):
+    """Takes a while to answer, like a database under load, and records every call it gets."""
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _record(self, call):
+        self.lock.acquire()
+        try:
+            self.calls.append(call)
+        finally:
+            self.lock.release()
+        time.sleep(self.delay)
+
+    def load_user(self, username):
+        self._record(("load_user", username))
+        if username == "missing":
+            raise KeyError(username)
+        return "user %s" % username
+
+    def load_users(self, usernames):
+        self._record(("load_users", sorted(usernames)))
+        return dict([(username, "user %s" % username) for username in usernames if username != "missing"])